@@ -1,15 +1,23 @@
-import os, sys
-from elasticsearch import helpers, Elasticsearch
+import os
+import sys
+import shutil
+import threading
+import argparse
+from elasticsearch import Elasticsearch
 from src.config import Config
-from src.core import get_es_client
-from src.ingestion import download_arxiv_data, download_pubmed_data
-from src.processing import extract_multimedia
+from src.core import get_es_client, stream_bulk, Manifest, ParagraphStore, MetricsCollector, bump_index_generation
+from src.core import load_checkpoint, save_checkpoint, clear_checkpoint
+from src.core import BoundedQueue, StageThread, PipelineAborted
+from src.ingestion import iter_arxiv_pages, iter_pubmed_pages
+from src.processing import list_html_files, extract_corpus, fit_corpus_model, update_corpus_model
+from src.processing.parallel import start_pool
 import time   # <-- [AGGIUNTO] per misurazione tempi sperimentali
 
 
-def setup_indices(es: Elasticsearch):
+def setup_indices(es: Elasticsearch, reset=True):
     """
-    Crea o resetta gli indici in Elasticsearch con i mapping corretti
+    Crea o resetta gli indici in Elasticsearch con i mapping corretti.
+    Con reset=False (modalità incrementale) gli indici esistenti vengono mantenuti.
     """
     
     # Mapping documenti (INDEX_DOCS)
@@ -23,8 +31,11 @@ def setup_indices(es: Elasticsearch):
             
             # Testo analizzato
             "title": {"type": "text", "analyzer": "english"},       # Titolo
-            "abstract": {"type": "text", "analyzer": "english"},    # Abstract
-            "full_text": {"type": "text", "analyzer": "english"},   # Testo completo
+            # index_options "offsets": highlight dagli offset salvati nell'indice,
+            # senza rianalizzare i testi lunghi a ogni ricerca
+            "abstract": {"type": "text", "analyzer": "english", "index_options": "offsets"},    # Abstract
+            "full_text": {"type": "text", "analyzer": "english", "index_options": "offsets"},   # Testo completo
+            "full_text_pending": {"type": "boolean"},   # ArXiv: full_text ancora uguale all'abstract
             "authors": {"type": "text", "analyzer": "standard"}     # Autori
         }
     }
@@ -39,10 +50,11 @@ def setup_indices(es: Elasticsearch):
             "img_url": {"type": "keyword"},     # URL dell'immagine
             
             # Contenuto semantico (Testo)
-            "caption": {"type": "text", "analyzer": "english"},             # Didascalia
-            "body_content": {"type": "text", "analyzer": "english"},        # Solo per le tabelle
-            "mentions": {"type": "text", "analyzer": "english"},            # Riferimenti nel testo
-            "context_paragraphs": {"type": "text", "analyzer": "english"}   # Paragrafi di contesto
+            # (campi evidenziati nei risultati: offset salvati nell'indice)
+            "caption": {"type": "text", "analyzer": "english", "index_options": "offsets"},             # Didascalia
+            "body_content": {"type": "text", "analyzer": "english", "index_options": "offsets"},        # Solo per le tabelle
+            "mentions": {"type": "text", "analyzer": "english", "index_options": "offsets"},            # Riferimenti nel testo
+            "context_paragraphs": {"type": "text", "analyzer": "english", "index_options": "offsets"}   # Paragrafi di contesto
         }
     }
 
@@ -55,6 +67,9 @@ def setup_indices(es: Elasticsearch):
     print("\nSetup Indici")
     for idx_name, mapping in indices:
         if es.indices.exists(index=idx_name):
+            if not reset:
+                print(f"Indice esistente mantenuto: {idx_name}")
+                continue
             print(f"Eliminazione indice esistente: {idx_name}")
             es.indices.delete(index=idx_name)
         
@@ -62,141 +77,495 @@ def setup_indices(es: Elasticsearch):
         print(f"Indice creato: {idx_name}")
 
 
-def run():
-    # ------------------------------------------------------------------
-    # [AGGIUNTO] Timer globale della pipeline (Esperimento 1 - Relazione)
-    # ------------------------------------------------------------------
-    pipeline_start = time.time()
+def media_actions(results, metrics, counts, manifest, store=None):
+    """
+    Generatore di azioni bulk per figure e tabelle.
+    Consuma i risultati dell'estrazione uno alla volta, registra le metriche
+    del paper (span e conteggi) e produce le azioni da inviare a Elasticsearch.
+    Per i paper già presenti nel manifest, dopo i nuovi documenti vengono
+    cancellati quelli obsoleti: il paper non resta mai senza figure/tabelle.
+    Per ArXiv aggiorna anche il full_text del documento, calcolato dallo
+    stesso parsing usato per l'estrazione, e azzera full_text_pending.
+    Se l'estrazione o l'update non riescono il paper non viene confermato nel
+    manifest: resta full_text_pending=true e il run successivo lo rielabora.
+    Se l'estrazione ha usato il ParagraphStore, i testi di mentions e
+    context_paragraphs vengono letti (mmap) solo qui, un oggetto alla volta.
+    """
+    for result in results:
+        paper_id, source = result["paper_id"], result["source"]
+        figs, tabs = result["figures"], result["tables"]
+        metrics.record_paper(paper_id, source, result["spans"], result["counts"])
+        spans = " | ".join(f"{name} {secs:.2f}s" for name, secs in result["spans"].items() if name != "total")
+        resumed = " (ripreso dal checkpoint)" if result.get("resumed") else ""
+        print(f"[DOC] {paper_id} ({source}) processed in {result['time']:.2f}s [{result['parser']}] {spans}{resumed}")
+
+        if source == "arxiv":
+            doc = {"full_text_pending": False}
+            if result["full_text"]:
+                doc["full_text"] = result["full_text"]
+            manifest.expect(paper_id, Config.INDEX_DOCS, paper_id)
+            yield {"_op_type": "update", "_index": Config.INDEX_DOCS, "_id": paper_id, "doc": doc}
+
+        fig_ids = [f"{x['paper_id']}_{x['figure_id']}" for x in figs]
+        tab_ids = [f"{x['paper_id']}_{x['table_id']}" for x in tabs]
+
+        stored = result.get("paragraph_store")
+
+        for doc_id, x in zip(fig_ids, figs):
+            counts["figures"] += 1
+            if stored:
+                x = _with_paragraphs(x, store, paper_id)
+            manifest.expect(paper_id, Config.INDEX_FIGURES, doc_id)
+            yield {"_index": Config.INDEX_FIGURES, "_id": doc_id, "_source": x}
+
+        for doc_id, x in zip(tab_ids, tabs):
+            counts["tables"] += 1
+            if stored:
+                x = _with_paragraphs(x, store, paper_id)
+            manifest.expect(paper_id, Config.INDEX_TABLES, doc_id)
+            yield {"_index": Config.INDEX_TABLES, "_id": doc_id, "_source": x}
+
+        if stored:
+            store.release(paper_id)
+
+        old_figs, old_tabs = manifest.stale_ids(paper_id, fig_ids, tab_ids)
+        for doc_id in old_figs:
+            manifest.expect(paper_id, Config.INDEX_FIGURES, doc_id)
+            yield {"_op_type": "delete", "_index": Config.INDEX_FIGURES, "_id": doc_id}
+        for doc_id in old_tabs:
+            manifest.expect(paper_id, Config.INDEX_TABLES, doc_id)
+            yield {"_op_type": "delete", "_index": Config.INDEX_TABLES, "_id": doc_id}
+
+        manifest.stage(paper_id, source, fig_ids, tab_ids)
+
+
+def _with_paragraphs(obj, store, paper_id):
+    """Copia di una figura/tabella con i testi dei paragrafi al posto degli indici."""
+    return {
+        **obj,
+        "mentions": store.texts(paper_id, obj["mentions"]),
+        "context_paragraphs": store.texts(paper_id, obj["context_paragraphs"])
+    }
 
-    es = get_es_client()
 
-    # Setup indici
-    setup_indices(es)
+def _acknowledge(manifest, ok, info):
+    """Esito di un'azione bulk di figure/tabelle -> marcatore di completamento del paper."""
+    op_info = next(iter(info.values()), {})
+    if isinstance(op_info, dict):
+        manifest.acknowledge(op_info.get("_index"), op_info.get("_id"), ok)
+
+
+# Paper controllati per richiesta mget da skip_orphans
+ORPHAN_CHECK_BATCH = 1000
+
+
+def doc_actions(docs):
+    """Azioni bulk per i documenti (content_index) di una pagina dell'harvest."""
+    for d in docs:
+        yield {"_index": Config.INDEX_DOCS, "_id": d['document_id'], "_source": d}
+
+
+def harvest(es, manifest, resume=False, on_page=None):
+    """
+    Harvest paginato di ArXiv e PubMed con indicizzazione pagina per pagina.
+    I paper del manifest vengono saltati solo se il loro HTML non è cambiato
+    (risposta 304 all'ETag salvato o stesso hash del contenuto).
+    Dopo ogni pagina indicizzata il cursore viene salvato su disco: con
+    resume=True un harvest interrotto riprende dall'ultima pagina completata.
+    on_page(source, docs), se indicata, riceve ogni pagina indicizzata
+    (modalità pipelined: i file HTML salvati passano subito all'estrazione).
+    Restituisce il numero di documenti indicizzati.
+    """
+    queries = [Config.QUERY_ARXIV, Config.QUERY_PUBMED]
+    state = load_checkpoint("harvest") if resume else {}
+    if state and state.get("queries") != queries:
+        print("Checkpoint harvest relativo a query diverse: ripartenza da zero")
+        state = {}
+    cursor = state.get("cursor", {})
+
+    n_docs = 0
+    known = manifest.validators()
+    sources = [
+        ("arxiv", iter_arxiv_pages(known, start=cursor.get("arxiv", 0))),
+        ("pubmed", iter_pubmed_pages(known, start=cursor.get("pubmed", 0)))
+    ]
+    for name, pages in sources:
+        for next_start, docs in pages:
+            for d in docs:
+                # L'ETag va nel manifest (con l'hash), non nell'indice
+                etag = d.pop("etag", None)
+                if d.get("local_filename"):
+                    manifest.set_etag(d["local_filename"].replace(".html", ""), etag)
+
+            if docs:
+                print(f"Indicizzazione {len(docs)} documenti ({name})...")
+                stream_bulk(es, doc_actions(docs), label=f"Documenti {name}")
+                n_docs += len(docs)
+
+            # Il cursore avanza solo dopo che la pagina è stata indicizzata
+            cursor[name] = next_start
+            save_checkpoint("harvest", {"queries": queries, "cursor": cursor})
+
+            if on_page is not None and docs:
+                on_page(name, docs)
+
+    clear_checkpoint("harvest")
+    return n_docs
+
+
+def skip_orphans(es, manifest, tasks, counts, harvested=()):
+    """
+    Scarta i file HTML arXiv senza documento in INDEX_DOCS (es. dopo un reset
+    degli indici o HTML rimasti da run precedenti): l'update del full_text
+    fallirebbe a ogni run e il paper non verrebbe mai confermato.
+    Con un'unica mget si controllano solo i paper che non sono nel manifest
+    né tra quelli appena indicizzati dall'harvest (harvested). Gli orfani
+    vengono contati e restano fuori dal manifest: tornano in elaborazione
+    quando un harvest successivo ne indicizza il documento.
+    """
+    unknown = [
+        t[1] for t in tasks
+        if t[2] == "arxiv" and t[1] not in manifest.papers and t[1] not in harvested
+    ]
+    present = set()
+    for start in range(0, len(unknown), ORPHAN_CHECK_BATCH):
+        resp = es.mget(index=Config.INDEX_DOCS, ids=unknown[start:start + ORPHAN_CHECK_BATCH], source=False)
+        present.update(doc["_id"] for doc in resp["docs"] if doc.get("found"))
+
+    orphans = set(unknown) - present
+    if orphans:
+        counts["orphans"] += len(orphans)
+        print(f"[MANIFEST] {len(orphans)} file HTML arXiv senza documento indicizzato: saltati")
+    return [t for t in tasks if t[1] not in orphans]
+
+
+def local_tasks():
+    """File HTML locali di ArXiv e PubMed (ordine stabile -> _id deterministici)."""
+    tasks = []
+    for folder, source in [
+        (Config.OUTPUT_DIR_ARXIV, "arxiv"),
+        (Config.OUTPUT_DIR_PUBMED, "pubmed")
+    ]:
+        tasks.extend(list_html_files(folder, source))
+    return tasks
+
+
+def run_pipelined(es, manifest, workers, metrics, counts, store, pool=None, resume=False, harvest_done=False, tfidf_known=None):
+    """
+    Esecuzione a pipeline con code limitate (producer/consumer):
+      - thread di download: harvest pagina per pagina; i file HTML salvati
+        entrano subito nella coda dei task
+      - estrazione: processi del pool (o thread principale con 1 worker)
+        che consumano la coda dei task
+      - thread di indicizzazione: bulk in streaming dei risultati
+    Le code piene bloccano lo stadio a monte (backpressure): la memoria resta
+    costante e il tempo totale tende a quello dello stadio più lento.
+    tfidf_known: con TFIDF_MODE=corpus, paper già presenti nel modello di
+    corpus. L'IDF resta quella caricata all'avvio per tutto il run (i worker
+    la condividono): i file scaricati durante il run vengono aggiunti al
+    modello alla fine e contano dal run successivo.
+    pool: processi di estrazione già avviati (vedi run), None con 1 worker.
+    Restituisce: (documenti_harvest, azioni_indicizzate, errori_bulk)
+    """
+    abort = threading.Event()
+    task_queue = BoundedQueue(Config.PIPELINE_QUEUE_SIZE, abort)
+    result_queue = BoundedQueue(Config.PIPELINE_QUEUE_SIZE, abort)
+    queued = set()
+    harvested = []
+    state = {"docs": 0, "indexed": 0, "errors": []}
+    timings = {}
+
+    def enqueue(task):
+        # Solo paper nuovi o modificati, ognuno una sola volta
+        if task[1] in queued or not manifest.has_changed(task[0], task[1]):
+            return
+        queued.add(task[1])
+        task_queue.put(task)
+
+    def on_page(source, docs):
+        folder = Config.OUTPUT_DIR_ARXIV if source == "arxiv" else Config.OUTPUT_DIR_PUBMED
+        for doc in docs:
+            if doc.get("local_file_saved") and doc.get("local_filename"):
+                filename = doc["local_filename"]
+                task = (os.path.join(folder, filename), filename.replace(".html", ""), source)
+                if tfidf_known is not None and task[1] not in tfidf_known:
+                    harvested.append(task)
+                enqueue(task)
+
+    def produce():
+        t_start = time.perf_counter()
+        try:
+            if not harvest_done:
+                save_checkpoint("pipeline", {"stage": "harvest"})
+                state["docs"] = harvest(es, manifest, resume=resume, on_page=on_page)
+                save_checkpoint("pipeline", {"stage": "media"})
+            # File locali non prodotti da questo harvest (download precedenti, HTML modificati)
+            for task in skip_orphans(es, manifest, local_tasks(), counts, queued):
+                enqueue(task)
+        finally:
+            task_queue.close()
+            timings["harvest"] = time.perf_counter() - t_start
+
+    def index():
+        t_start = time.perf_counter()
+        actions = media_actions(result_queue, metrics, counts, manifest, store)
+        state["indexed"], state["errors"] = stream_bulk(
+            es, actions, label="Figure/Tabelle",
+            on_result=lambda ok, info: _acknowledge(manifest, ok, info)
+        )
+        timings["index"] = time.perf_counter() - t_start
+
+    producer = StageThread("harvest", produce, abort)
+    indexer = StageThread("index", index, abort)
+
+    producer.start()
+    indexer.start()
+    t_extract = time.perf_counter()
+    try:
+        for result in extract_corpus(task_queue, workers, pool):
+            result_queue.put(result)
+        result_queue.close()
+        if harvested:
+            # Stesso pool dell'estrazione: nessun fork con i thread attivi
+            update_corpus_model(harvested, workers, pool)
+    except PipelineAborted:
+        pass
+    except BaseException:
+        abort.set()
+        raise
+    finally:
+        producer.join()
+        indexer.join()
+    timings["extract"] = time.perf_counter() - t_extract
+
+    for stage in (producer, indexer):
+        if stage.error is not None:
+            raise stage.error
+
+    for stage, seconds in timings.items():
+        metrics.record_stage(f"pipelined_{stage}", seconds)
+    print(
+        f"[PIPELINE] paper in coda: {len(queued)} | "
+        f"massimo occupazione code: task {task_queue.high_water}/{Config.PIPELINE_QUEUE_SIZE}, "
+        f"risultati {result_queue.high_water}/{Config.PIPELINE_QUEUE_SIZE}"
+    )
+    return state["docs"], state["indexed"], state["errors"]
+
+
+def _run_sequential(es, manifest, workers, metrics, counts, store, pool=None, incremental=False, resume=False, fit_tfidf=False, harvest_done=False):
+    """
+    Esecuzione per stadi in sequenza: harvest completo, poi estrazione e
+    indicizzazione in streaming di tutti i file locali nuovi o modificati.
+    IDF di corpus ed estrazione usano il pool avviato prima dell'harvest.
+    Restituisce: (documenti_harvest, azioni_indicizzate, errori_bulk)
+    """
+    # Paper presenti prima dell'harvest (per aggiornare l'IDF di corpus con i nuovi)
+    before_harvest = {t[1] for t in local_tasks()}
 
     # ------------------------------------------------------------------
     # [AGGIUNTO] Timer fase download/ingestion metadati
     # ------------------------------------------------------------------
-    t_download = time.time()
-
-    # Download e Indicizzazione Documenti (Docs)
-    df_arxiv = download_arxiv_data()
-    df_pubmed = download_pubmed_data()
-
-    download_time = time.time() - t_download
-    print(f"[TIME] Download & ingestion metadata: {download_time:.2f}s")
-
-    # Unione e Indexing Docs
-    all_docs = []
-    if not df_arxiv.empty:
-        all_docs.extend(df_arxiv.to_dict(orient='records'))
-    if not df_pubmed.empty:
-        all_docs.extend(df_pubmed.to_dict(orient='records'))
-
-    if all_docs:
-        print(f"Indicizzazione {len(all_docs)} documenti...")
-        actions = [
-            {"_index": Config.INDEX_DOCS, "_id": d['document_id'], "_source": d}
-            for d in all_docs
-        ]
-        helpers.bulk(es, actions)
+    t_download = time.perf_counter()
+
+    # Download e Indicizzazione Documenti (Docs), una pagina alla volta.
+    # In ripresa l'harvest viene saltato se era già stato completato
+    if harvest_done:
+        print("Harvest già completato nel run interrotto: si riprende dall'estrazione")
+        n_docs = 0
+    else:
+        save_checkpoint("pipeline", {"stage": "harvest"})
+        n_docs = harvest(es, manifest, resume=resume)
+        save_checkpoint("pipeline", {"stage": "media"})
+
+    download_time = time.perf_counter() - t_download
+    metrics.record_stage("harvest", download_time, documents=n_docs)
+    print(f"[TIME] Download & ingestion metadata: {download_time:.2f}s ({n_docs} documenti)")
 
     # Estrazione e Indicizzazione Figure/Tabelle
     print("\nEstrazione Multimediale in corso...")
 
-    all_figures = []
-    all_tables = []
-
+    # Processiamo i file locali scaricati (ordine stabile -> _id deterministici)
+    tasks = local_tasks()
+
+    # IDF di corpus: calcolata su tutti i paper locali (non solo su quelli
+    # da rielaborare) se manca o se richiesto esplicitamente, altrimenti
+    # aggiornata con i paper appena scaricati prima di estrarli
+    if Config.TFIDF_MODE == "corpus":
+        t_fit = time.perf_counter()
+        if fit_tfidf or not os.path.exists(Config.TFIDF_MODEL_PATH):
+            fit_corpus_model(tasks, workers, pool)
+        else:
+            new_tasks = [t for t in tasks if t[1] not in before_harvest]
+            if new_tasks:
+                update_corpus_model(new_tasks, workers, pool)
+        metrics.record_stage("tfidf_fit", time.perf_counter() - t_fit)
+
+    # Solo i paper nuovi o con HTML modificato (hash diverso) vengono estratti
+    all_tasks = len(tasks)
+    tasks = [t for t in tasks if manifest.has_changed(t[0], t[1])]
+    tasks = skip_orphans(es, manifest, tasks, counts)
+    if incremental:
+        print(f"Paper da (ri)elaborare: {len(tasks)} su {all_tasks}")
+
+    if workers > 1:
+        print(f"Estrazione parallela su {workers} processi")
+
+    # Indicizzazione in streaming: le azioni vengono generate man mano che
+    # l'estrazione procede, senza accumulare figure/tabelle di tutto il corpus
+    t_extract = time.perf_counter()
+    results = extract_corpus(tasks, workers, pool)
+    actions = media_actions(results, metrics, counts, manifest, store)
+    indexed, errors = stream_bulk(
+        es, actions, label="Figure/Tabelle",
+        on_result=lambda ok, info: _acknowledge(manifest, ok, info)
+    )
+    store.close()
+    metrics.record_stage("extract_index", time.perf_counter() - t_extract, papers=len(tasks))
+    return n_docs, indexed, errors
+
+
+def run(workers=None, incremental=False, resume=False, fit_tfidf=False, pipelined=False):
     # ------------------------------------------------------------------
-    # [AGGIUNTO] Strutture per Esperimento 1:
-    # tempo per documento e statistiche finali
+    # [AGGIUNTO] Timer globale della pipeline (Esperimento 1 - Relazione)
     # ------------------------------------------------------------------
-    doc_times = []
-    processed_docs = 0
+    pipeline_start = time.perf_counter()
+    metrics = MetricsCollector(Config.METRICS_DIR, Config.METRICS_FORMATS)
 
-    # Processiamo i file locali scaricati
-    for folder, source in [
-        (Config.OUTPUT_DIR_ARXIV, "arxiv"),
-        (Config.OUTPUT_DIR_PUBMED, "pubmed")
-    ]:
-        if not os.path.exists(folder):
-            continue
-        
-        files = [f for f in os.listdir(folder) if f.endswith(".html")]
-
-        for f in files:
-            path = os.path.join(folder, f)
-            paper_id = f.replace(".html", "")
-
-            # ----------------------------------------------------------
-            # [AGGIUNTO] Timer per singolo documento HTML
-            # ----------------------------------------------------------
-            t_doc_start = time.time()
-
-            with open(path, "r", encoding="utf-8") as file_in:
-                html = file_in.read()
-
-            # Unica chiamata all'extractor
-            figs, tabs = extract_multimedia(html, paper_id, source)
-
-            # ----------------------------------------------------------
-            # [AGGIUNTO] Fine timer documento
-            # ----------------------------------------------------------
-            t_doc_end = time.time()
-            doc_time = t_doc_end - t_doc_start
-
-            doc_times.append(doc_time)
-            processed_docs += 1
-
-            print(f"[DOC] {paper_id} ({source}) processed in {doc_time:.2f}s")
-
-            all_figures.extend(figs)
-            all_tables.extend(tabs)
-
-    # Bulk Indexing Figure
-    if all_figures:
-        print(f"Indicizzazione {len(all_figures)} Figure...")
-        actions = [
-            {
-                "_index": Config.INDEX_FIGURES,
-                "_id": f"{x['paper_id']}_{x['figure_id']}",
-                "_source": x
-            }
-            for x in all_figures
-        ]
-        helpers.bulk(es, actions)
-
-    # Bulk Indexing Tabelle
-    if all_tables:
-        print(f"Indicizzazione {len(all_tables)} Tabelle...")
-        actions = [
-            {
-                "_index": Config.INDEX_TABLES,
-                "_id": f"{x['paper_id']}_{x['table_id']}",
-                "_source": x
-            }
-            for x in all_tables
-        ]
-        helpers.bulk(es, actions)
+    es = get_es_client()
+
+    # Stato della pipeline a stadi: harvest -> media (estrazione + indicizzazione).
+    # Senza --resume si riparte da zero e i risultati intermedi vengono scartati
+    if resume:
+        pipeline_state = load_checkpoint("pipeline")
+    else:
+        pipeline_state = {}
+        clear_checkpoint("pipeline")
+        shutil.rmtree(Config.RESULTS_DIR, ignore_errors=True)
+
+    # Setup indici (in modalità incrementale o di ripresa non vengono cancellati)
+    keep_existing = incremental or resume
+    setup_indices(es, reset=not keep_existing)
+
+    # Manifest: in modalità completa si riparte da zero e lo si ricostruisce.
+    # Viene salvato periodicamente man mano che i paper risultano indicizzati
+    if keep_existing:
+        manifest = Manifest.load(Config.MANIFEST_PATH)
+        print(f"Modalità incrementale: {len(manifest.papers)} paper già indicizzati")
+    else:
+        manifest = Manifest(Config.MANIFEST_PATH)
+    manifest.save_every = Config.MANIFEST_SAVE_EVERY
+
+    workers = workers or Config.EXTRACTION_WORKERS
+    counts = {"figures": 0, "tables": 0, "orphans": 0}
+    store = ParagraphStore(Config.PARAGRAPH_STORE_DIR)
+
+    # Il fork di un processo con thread attivi (event loop del fetcher durante
+    # l'harvest, stadi della pipeline) non è sicuro: i processi del pool
+    # vengono avviati subito e usati da IDF di corpus ed estrazione
+    pool = start_pool(workers) if workers > 1 else None
+    try:
+        if pipelined:
+            # Download, estrazione e indicizzazione sovrapposti
+            # IDF di corpus: i worker usano per tutto il run il modello disponibile
+            # all'avvio (calcolato sui file già presenti); i paper scaricati nel
+            # run vengono aggiunti al termine e contano dal run successivo
+            tfidf_known = None
+            if Config.TFIDF_MODE == "corpus":
+                tasks = local_tasks()
+                tfidf_known = {t[1] for t in tasks}
+                if fit_tfidf or not os.path.exists(Config.TFIDF_MODEL_PATH):
+                    if tasks:
+                        fit_corpus_model(tasks, workers, pool)
+                    elif not os.path.exists(Config.TFIDF_MODEL_PATH):
+                        print("[PIPELINE] Nessun file locale per l'IDF di corpus: TF-IDF per paper in questo run")
+
+            print(f"\nPipeline a stadi sovrapposti ({workers} processi di estrazione)...")
+            t_media = time.perf_counter()
+            n_docs, indexed, errors = run_pipelined(
+                es, manifest, workers, metrics, counts, store, pool,
+                resume=resume, harvest_done=pipeline_state.get("stage") == "media",
+                tfidf_known=tfidf_known
+            )
+            store.close()
+            metrics.record_stage("extract_index", time.perf_counter() - t_media)
+        else:
+            n_docs, indexed, errors = _run_sequential(
+                es, manifest, workers, metrics, counts, store, pool,
+                incremental=incremental, resume=resume, fit_tfidf=fit_tfidf,
+                harvest_done=pipeline_state.get("stage") == "media"
+            )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    # Il manifest contiene solo i paper confermati da _acknowledge (tutte le
+    # azioni bulk riuscite): quelli con errori verranno rielaborati al prossimo run
+    manifest.save()
+
+    # Pipeline completata: stato e risultati intermedi non servono più
+    clear_checkpoint("pipeline")
+    shutil.rmtree(Config.RESULTS_DIR, ignore_errors=True)
+
+    print(f"Indicizzate {counts['figures']} Figure e {counts['tables']} Tabelle ({indexed} ok, {len(errors)} errori)")
+    for err in errors[:5]:
+        print(f"   Errore bulk: {err}")
+    if counts["orphans"]:
+        print(f"File HTML arXiv senza documento (saltati): {counts['orphans']}")
+
+    # Nuova generazione degli indici: invalida le cache dei risultati (app web)
+    generation = bump_index_generation(es)
+    print(f"Generazione indici: {generation}")
 
     # ------------------------------------------------------------------
     # [AGGIUNTO] Statistiche finali Esperimento 1 (Relazione)
     # ------------------------------------------------------------------
-    pipeline_end = time.time()
+    pipeline_time = time.perf_counter() - pipeline_start
+    metrics.record_stage("total", pipeline_time)
+    doc_times = metrics.span_values("total")
 
     print("\n=== PIPELINE TIMING STATS ===")
-    print(f"Articoli processati: {processed_docs}")
-    print(f"Tempo totale pipeline: {pipeline_end - pipeline_start:.2f}s")
+    print(f"Articoli processati: {len(doc_times)}")
+    print(f"Tempo totale pipeline: {pipeline_time:.2f}s")
 
     if doc_times:
         print(f"Tempo medio per articolo: {sum(doc_times)/len(doc_times):.2f}s")
         print(f"Min / Max per articolo: {min(doc_times):.2f}s / {max(doc_times):.2f}s")
 
+    metrics.print_summary()
+    metrics.close()
+    if Config.METRICS_FORMATS:
+        print(f"Metriche ({', '.join(Config.METRICS_FORMATS)}) salvate in {Config.METRICS_DIR}")
+
     print("\nIndicizzazione completata")
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline di indicizzazione (ETL)")
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Processi per l'estrazione multimediale (default: Config.EXTRACTION_WORKERS)"
+    )
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Non cancella gli indici ed elabora solo i paper nuovi o modificati"
+    )
+    parser.add_argument(
+        "--resume", action="store_true",
+        help="Riprende una pipeline interrotta (harvest dal cursore salvato, paper già estratti o indicizzati saltati)"
+    )
+    parser.add_argument(
+        "--pipelined", action="store_true",
+        help="Sovrappone download, estrazione e indicizzazione con code limitate"
+    )
+    parser.add_argument(
+        "--fit-tfidf", action="store_true",
+        help="Ricalcola l'IDF di corpus (solo con TFIDF_MODE=corpus)"
+    )
+    args = parser.parse_args()
+
     try:
-        run()
+        run(workers=args.workers, incremental=args.incremental, resume=args.resume,
+            fit_tfidf=args.fit_tfidf, pipelined=args.pipelined)
     except ConnectionError as e:
         print(f"\n[ERRORE CRITICO] {e}")
         print("Assicurati che Docker o il servizio Elasticsearch sia attivo.")
@@ -0,0 +1,88 @@
+import argparse
+import time
+from elasticsearch import ConnectionError
+from src.config import Config
+from src.core import get_es_client, stream_bulk, bump_index_generation
+from src.processing.artifacts import list_artifacts, relink_paper
+
+
+def relink_actions(paper_ids, refit=False, threshold=None, stats=None):
+    """
+    Generatore di azioni bulk (update parziale) con i nuovi context_paragraphs
+    di figure e tabelle, ricalcolati dagli artefatti di estrazione.
+    """
+    for paper_id in paper_ids:
+        try:
+            linked = relink_paper(paper_id, refit=refit, threshold=threshold)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"[RELINK] Artefatti non leggibili per {paper_id}: {e}")
+            continue
+
+        if stats is not None:
+            stats["papers"] += 1
+            stats["objects"] += len(linked)
+            stats["paragraphs"] += sum(len(ctx) for _, _, ctx in linked)
+
+        for index, doc_id, context in linked:
+            yield {
+                "_op_type": "update",
+                "_index": index,
+                "_id": doc_id,
+                "doc": {"context_paragraphs": context}
+            }
+
+
+def run(refit=False, threshold=None, dry_run=False):
+    t_start = time.time()
+
+    paper_ids = list_artifacts()
+    if not paper_ids:
+        print(f"Nessun artefatto in {Config.ARTIFACTS_DIR}: eseguire prima run_pipeline.py con SAVE_ARTIFACTS=1")
+        return
+
+    mode = "rivettorizzazione" if refit else "matrici salvate"
+    print(f"Re-link del contesto per {len(paper_ids)} paper ({mode}, soglia {threshold or Config.TFIDF_THRESHOLD})")
+
+    stats = {"papers": 0, "objects": 0, "paragraphs": 0}
+    actions = relink_actions(paper_ids, refit=refit, threshold=threshold, stats=stats)
+
+    if dry_run:
+        for _ in actions:
+            pass
+        updated, errors = 0, []
+    else:
+        es = get_es_client()
+        updated, errors = stream_bulk(es, actions, label="Re-link")
+        if updated:
+            # Contesti cambiati: invalida le cache dei risultati (app web)
+            bump_index_generation(es)
+
+    print(f"Paper: {stats['papers']} | Figure/Tabelle: {stats['objects']} | Paragrafi di contesto: {stats['paragraphs']}")
+    if not dry_run:
+        print(f"Aggiornati {updated} documenti ({len(errors)} errori)")
+        for err in errors[:5]:
+            print(f"   Errore bulk: {err}")
+    print(f"[TIME] Re-link: {time.time() - t_start:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ricalcola context_paragraphs senza rielaborare l'HTML")
+    parser.add_argument(
+        "--threshold", type=float, default=None,
+        help="Soglia di similarità (default: Config.TFIDF_THRESHOLD)"
+    )
+    parser.add_argument(
+        "--refit", action="store_true",
+        help="Rivettorizza paragrafi e caption salvati (es. dopo aver cambiato le stop words)"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true",
+        help="Calcola il contesto senza aggiornare Elasticsearch"
+    )
+    args = parser.parse_args()
+
+    try:
+        run(refit=args.refit, threshold=args.threshold, dry_run=args.dry_run)
+    except ConnectionError as e:
+        print(f"\n[ERRORE CRITICO] {e}")
+        print("Assicurati che Docker o il servizio Elasticsearch sia attivo.")
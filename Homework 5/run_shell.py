@@ -1,25 +1,16 @@
 import sys
 from elasticsearch import ConnectionError
-from src.config import Config
 from src.core import get_es_client
-import time   # <-- [AGGIUNTO] per misurare la latenza delle query (Esperimento 5)
+from src.search import SearchService, logic_type
+import time
 
-# --- CONFIGURAZIONE CAMPI DI RICERCA (Boosting) ---
-# Definiamo dove cercare e quanto pesare i campi.
-
-# Documenti: Titolo molto importante (^3), Abstract importante (^2)
-CONTENT_FIELDS = ["title^3", "abstract^2", "full_text", "authors", "document_id"]
-
-# Tabelle: Caption fondamentale, Contenuto tabella, Contesto
-TABLE_FIELDS = ["caption^3", "body_content^2", "mentions", "context_paragraphs", "table_id", "paper_id"]
-
-# Figure: Caption fondamentale, Contesto
-FIGURE_FIELDS = ["caption^3", "mentions", "context_paragraphs", "figure_id", "paper_id"]
+# Query, campi (boosting), highlighting e instradamento modalità -> indici
+# sono definiti in src/search, condivisi con l'app web e il benchmark
 
 def choose_index():
     """
-    Menu interattivo per scegliere l'indice.
-    Restituisce: (tipo_logico, [lista_indici_reali])
+    Menu interattivo per scegliere la modalità di ricerca.
+    Restituisce: modalità ("docs", "tables", "figures", "all") o None per uscire
     """
     print("\n--- SELEZIONE MODALITÀ ---")
     print(" 1) Documenti (Full Text)")
@@ -30,50 +21,16 @@ def choose_index():
     choice = input("Scelta [1-4, q per uscire]: ").strip()
 
     if choice.lower() == "q":
-        return None, None
-
-    # Mappatura usando le costanti della Config centralizzata
-    if choice == "1":
-        return "docs", [Config.INDEX_DOCS]
-    if choice == "2":
-        return "tables", [Config.INDEX_TABLES]
-    if choice == "3":
-        return "figures", [Config.INDEX_FIGURES]
-    if choice == "4":
-        return "all", [Config.INDEX_DOCS, Config.INDEX_TABLES, Config.INDEX_FIGURES]
+        return None
+
+    # Gli indici di ogni modalità sono risolti da src.search.resolve_indices
+    modes = {"1": "docs", "2": "tables", "3": "figures", "4": "all"}
+    if choice in modes:
+        return modes[choice]
 
     print("Scelta non valida.")
     return choose_index()
 
-def build_query(index_type, query_string):
-    """Costruisce la query Elasticsearch con highlighting."""
-    
-    if index_type == "docs":
-        fields = CONTENT_FIELDS
-    elif index_type == "tables":
-        fields = TABLE_FIELDS
-    elif index_type == "figures":
-        fields = FIGURE_FIELDS
-    else:
-        fields = CONTENT_FIELDS
-
-    return {
-        "query": {
-            "query_string": {
-                "query": query_string,
-                "fields": fields,
-                "default_operator": "AND"
-            }
-        },
-        "highlight": {
-            "fields": { "*": {} },
-            # Colore Giallo ANSI per il terminale
-            "pre_tags": ["\033[93m"], 
-            "post_tags": ["\033[0m"]  
-        },
-        "size": 5 # Limitiamo a 5 risultati per leggibilità nel terminale
-    }
-
 def print_hit(hit, logic_type):
     """Formatta e stampa il risultato in base al tipo."""
     src = hit["_source"]
@@ -124,11 +81,39 @@ def print_hit(hit, logic_type):
         if 'context_paragraphs' in highlights:
             print(f"\nContesto:\n{get_val('context_paragraphs')}")
 
+def show_page(paged):
+    """Richiede e stampa la pagina successiva di una ricerca paginata."""
+    # Latenza della singola pagina, solo indicativa: per le misure dell'Esperimento 5
+    # (workload, concorrenza, warm-up, percentili) usare python -m test.benchmark_search
+    t_query_start = time.perf_counter()
+
+    page = paged.next_page()
+
+    query_time_ms = (time.perf_counter() - t_query_start) * 1000
+
+    took = ", ".join(f"{idx} {resp.get('took', '?')} ms" for idx, resp in page)
+    print(f"[TIME] Pagina {paged.page} su {len(page)} indici in {query_time_ms:.2f} ms (server: {took})")
+
+    for idx, resp in page:
+        if "error" in resp:
+            # Gestiamo l'errore per singolo indice senza bloccare la shell
+            print(f"Errore ricerca su {idx}: {resp['error']}")
+            continue
+
+        hits = resp['hits']['hits']
+        total = paged.totals.get(idx, "?")
+
+        if hits:
+            print(f"\n>>> Trovati {total} risultati in '{idx}' (pagina {paged.page}):")
+            for h in hits:
+                print_hit(h, logic_type(idx))
+
 def run_shell():
     """Main loop della shell."""
     
     # 1. Connessione (Gestita con fail-fast nel main block)
     es = get_es_client()
+    service = SearchService(es, profile="shell")
 
     print("\n##################################################")
     print("#   SCIENTIFIC CORPUS SHELL (ArXiv & PubMed)     #")
@@ -137,8 +122,8 @@ def run_shell():
     
     while True:
         # 2. Scelta Indice
-        logic_type, target_indices = choose_index()
-        if not target_indices:
+        mode = choose_index()
+        if not mode:
             print("Arrivederci.")
             break
 
@@ -147,42 +132,20 @@ def run_shell():
         if not query_string or query_string.lower() == "q":
             continue
 
-        # 4. Esecuzione su tutti gli indici selezionati
-        for idx in target_indices:
-            
-            # Determina il tipo logico corrente (per formattare l'output)
-            current_logic = "docs"
-            if idx == Config.INDEX_TABLES: 
-                current_logic = "tables"
-            if idx == Config.INDEX_FIGURES: 
-                current_logic = "figures"
-
-            body = build_query(current_logic, query_string)
-
-            try:
-                # ------------------------------------------------------
-                # [AGGIUNTO] Timer latenza query (Esperimento 5)
-                # ------------------------------------------------------
-                t_query_start = time.time()
-
-                resp = es.search(index=idx, body=body)
-
-                t_query_end = time.time()
-                query_time_ms = (t_query_end - t_query_start) * 1000
-
-                hits = resp['hits']['hits']
-                total = resp['hits']['total']['value']
-
-                print(f"[TIME] Query su '{idx}' eseguita in {query_time_ms:.2f} ms")
-
-                if hits:
-                    print(f"\n>>> Trovati {total} risultati in '{idx}' (Top 5):")
-                    for h in hits:
-                        print_hit(h, current_logic)
-                
-            except Exception as e:
-                # Gestiamo l'errore per singolo indice senza bloccare la shell
-                print(f"Errore ricerca su {idx}: {e}")
+        # 4. Esecuzione su tutti gli indici selezionati: una pagina alla volta
+        #    (search_after su point in time, un solo round trip _msearch per pagina)
+        paged = service.paginate(query_string, mode)
+        try:
+            while True:
+                show_page(paged)
+                if not paged.has_more:
+                    break
+                if input("\n[n] Pagina successiva, invio per una nuova ricerca > ").strip().lower() != "n":
+                    break
+        except Exception as e:
+            print(f"Errore ricerca: {e}")
+        finally:
+            paged.close()
 
 if __name__ == "__main__":
     try:
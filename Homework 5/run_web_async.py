@@ -0,0 +1,10 @@
+import argparse
+from aiohttp import web
+from src.web.async_app import create_app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Server web asincrono (aiohttp + AsyncElasticsearch)")
+    parser.add_argument("--port", type=int, default=5001, help="Porta HTTP (default: 5001)")
+    args = parser.parse_args()
+
+    web.run_app(create_app(), port=args.port)
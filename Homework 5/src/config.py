@@ -6,26 +6,113 @@ load_dotenv()
 class Config:
     # Elasticsearch
     ES_HOST = os.getenv("ES_HOST", "http://localhost:9200")
+    # Client condiviso: connessioni per nodo (keep-alive), timeout e retry
+    ES_POOL_MAXSIZE = int(os.getenv("ES_POOL_MAXSIZE", "10"))
+    # Client asincrono (run_web_async.py): connessioni contemporanee verso ogni nodo,
+    # da dimensionare sulle ricerche in corso (richieste concorrenti x indici)
+    ES_ASYNC_POOL_MAXSIZE = int(os.getenv("ES_ASYNC_POOL_MAXSIZE", "100"))
+    ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "30"))
+    ES_MAX_RETRIES = int(os.getenv("ES_MAX_RETRIES", "3"))
+    # Intervallo (secondi) dell'health check in background dell'app web
+    ES_HEALTH_INTERVAL = float(os.getenv("ES_HEALTH_INTERVAL", "15"))
     
     # Indices
     INDEX_DOCS = "content_index"
     INDEX_TABLES = "tables_index"
     INDEX_FIGURES = "figures_index"
+    # Metadati degli indici (contatore di generazione, incrementato a ogni re-indicizzazione)
+    INDEX_META = "index_meta"
 
     # PubMed Settings
     PUBMED_EMAIL = os.getenv("PUBMED_EMAIL", "example@email.com")
     USERAGENT_PUBMED = f"UniProject_CorpusBuilder/2.0 (contact: {PUBMED_EMAIL})"
     
+    # Con API key NCBI consente 10 req/s, altrimenti 3 req/s
+    NCBI_API_KEY = os.getenv("NCBI_API_KEY", "")
+    RATE_LIMIT_NCBI = float(os.getenv("RATE_LIMIT_NCBI", "10" if NCBI_API_KEY else "3"))
+    # Numero di ID per singola richiesta efetch (metadati XML a lotti)
+    PUBMED_BATCH_SIZE = int(os.getenv("PUBMED_BATCH_SIZE", "100"))
+
     # ArXiv Settings
     USERAGENT_ARXIV = "Mozilla/5.0 (Research Project)"
+    RATE_LIMIT_ARXIV = float(os.getenv("RATE_LIMIT_ARXIV", "1"))
+    # API di ricerca (feed Atom): i termini d'uso chiedono una richiesta ogni 3 secondi
+    RATE_LIMIT_ARXIV_API = float(os.getenv("RATE_LIMIT_ARXIV_API", str(1 / 3)))
+
+    # Download asincrono (richieste in parallelo, tentativi, backoff in secondi)
+    FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))
+    FETCH_RETRIES = int(os.getenv("FETCH_RETRIES", "3"))
+    FETCH_BACKOFF = float(os.getenv("FETCH_BACKOFF", "1"))
+    FETCH_DEFAULT_RATE = float(os.getenv("FETCH_DEFAULT_RATE", "1"))
+
+    # Cache HTTP su disco (risposte compresse, eviction LRU oltre il limite in MB).
+    # Con HTTP_OFFLINE=1 tutte le risposte arrivano dalla cache, senza rete
+    HTTP_CACHE_ENABLED = os.getenv("HTTP_CACHE_ENABLED", "1") == "1"
+    HTTP_CACHE_MAX_MB = int(os.getenv("HTTP_CACHE_MAX_MB", "2048"))
+    HTTP_OFFLINE = os.getenv("HTTP_OFFLINE", "0") == "1"
     
     # Paths
     OUTPUT_DIR_ARXIV = os.path.join(os.getcwd(), "data", "arxiv")
     OUTPUT_DIR_PUBMED = os.path.join(os.getcwd(), "data", "pubmed")
+    # Manifest del re-indexing incrementale (hash HTML + id figure/tabelle)
+    MANIFEST_PATH = os.path.join(os.getcwd(), "data", "manifest.json")
+    # Checkpoint della pipeline (cursore dell'harvest, ecc.)
+    CHECKPOINT_DIR = os.path.join(os.getcwd(), "data", "checkpoints")
+    # Risultati di estrazione per paper, riusati da --resume dopo un'interruzione
+    RESULTS_DIR = os.path.join(os.getcwd(), "data", "checkpoints", "results")
+    # Cache HTTP (fuori dalle cartelle di output, che possono essere ripulite)
+    HTTP_CACHE_DIR = os.path.join(os.getcwd(), "data", "http_cache")
+    # Statistiche IDF di corpus (TFIDF_MODE=corpus)
+    TFIDF_MODEL_PATH = os.path.join(os.getcwd(), "data", "tfidf_corpus.npz")
+    # Paragrafi e matrici TF-IDF per paper (re-link del contesto senza HTML)
+    ARTIFACTS_DIR = os.path.join(os.getcwd(), "data", "artifacts")
+    # Testi dei paragrafi per paper (file mappati in memoria)
+    PARAGRAPH_STORE_DIR = os.path.join(os.getcwd(), "data", "paragraphs")
+    # Metriche di estrazione (extraction.jsonl / extraction.prom)
+    METRICS_DIR = os.path.join(os.getcwd(), "data", "metrics")
     
     # Algorithms
     TFIDF_THRESHOLD = 0.15
-    MAX_DOCS = 10
+    # "paper": TF-IDF calcolato su ogni singolo paper
+    # "corpus": IDF condivisa di corpus (HashingVectorizer), salvata su disco
+    TFIDF_MODE = os.getenv("TFIDF_MODE", "paper")
+    TFIDF_HASH_FEATURES = 2 ** 20
+    MAX_DOCS = int(os.getenv("MAX_DOCS", "10"))
+    # Paper per pagina nell'harvest paginato (granularità del checkpoint)
+    INGEST_PAGE_SIZE = int(os.getenv("INGEST_PAGE_SIZE", "100"))
+
+    # Pipeline
+    # Backend HTML per BeautifulSoup: "html.parser" (libreria standard) o "lxml" (più veloce, opzionale)
+    HTML_PARSER = os.getenv("HTML_PARSER", "html.parser")
+    # Numero di processi per l'estrazione multimediale (1 = sequenziale)
+    EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", "1"))
+    # Salvataggio di paragrafi e matrici TF-IDF per il re-link (run_relink.py), disattivato di default
+    SAVE_ARTIFACTS = os.getenv("SAVE_ARTIFACTS", "0") == "1"
+    # Estrazione con indici di paragrafo al posto dei testi (materializzati in indicizzazione), opzionale
+    PARAGRAPH_STORE = os.getenv("PARAGRAPH_STORE", "0") == "1"
+    # Formati delle metriche, separati da virgola: "jsonl", "prometheus" (vuoto = nessun file)
+    METRICS_FORMATS = [f.strip() for f in os.getenv("METRICS_FORMATS", "jsonl").split(",") if f.strip()]
+    # Indicizzazione bulk in streaming (azioni per blocco, byte massimi, thread)
+    BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+    BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES", str(10 * 1024 * 1024)))
+    BULK_THREADS = int(os.getenv("BULK_THREADS", "1"))
+    # Paper confermati tra due salvataggi del manifest (marcatori di completamento)
+    MANIFEST_SAVE_EVERY = int(os.getenv("MANIFEST_SAVE_EVERY", "25"))
+    # Modalità --pipelined: capacità delle code tra download, estrazione e indicizzazione
+    PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "16"))
+
+    # Paginazione (search_after + point in time): durata del PIT in secondi tra
+    # due pagine, prefetch della pagina successiva, ricerche paginate aperte nell'app web
+    PIT_KEEP_ALIVE = int(os.getenv("PIT_KEEP_ALIVE", "120"))
+    SEARCH_PREFETCH = os.getenv("SEARCH_PREFETCH", "1") == "1"
+    WEB_PAGING_SESSIONS = int(os.getenv("WEB_PAGING_SESSIONS", "64"))
+
+    # Web: cache dei risultati di ricerca (voci massime, durata in secondi)
+    WEB_CACHE_SIZE = int(os.getenv("WEB_CACHE_SIZE", "256"))
+    WEB_CACHE_TTL = float(os.getenv("WEB_CACHE_TTL", "300"))
+    # Età massima (secondi) della generazione degli indici usata dalla cache: limite
+    # al ritardo con cui una re-indicizzazione invalida i risultati in cache
+    WEB_CACHE_GENERATION_MAX_AGE = float(os.getenv("WEB_CACHE_GENERATION_MAX_AGE", "1"))
 
     # Queries
     QUERY_ARXIV = "text to speech"
@@ -1,2 +1,11 @@
-from .es import get_es_client
+from .es import get_es_client, close_es_client, es_health, start_health_monitor, multi_search
+from .es import new_health_state, check_health, check_health_async, health_monitor_async
+from .es import get_index_generation, bump_index_generation, build_async_es_client, IndexGeneration
+from .indexing import stream_bulk
+from .manifest import Manifest
+from .result_cache import ResultCache, normalize_query
+from .checkpoint import load_checkpoint, save_checkpoint, clear_checkpoint
+from .paragraph_store import ParagraphStore
+from .metrics import SpanTimer, MetricsCollector, percentiles
+from .pipeline import BoundedQueue, StageThread, PipelineAborted
 from .utils import clean_text, sanitize_filename, prepare_directory
\ No newline at end of file
@@ -0,0 +1,37 @@
+import os
+import json
+from src.config import Config
+
+
+def _checkpoint_path(name):
+    return os.path.join(Config.CHECKPOINT_DIR, f"{name}.json")
+
+
+def load_checkpoint(name):
+    """Carica un checkpoint salvato (dizionario vuoto se assente o illeggibile)."""
+    path = _checkpoint_path(name)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"[CHECKPOINT] File non leggibile, ignorato: {path}")
+        return {}
+
+
+def save_checkpoint(name, data):
+    """Salva un checkpoint in modo atomico (file temporaneo + rename)."""
+    os.makedirs(Config.CHECKPOINT_DIR, exist_ok=True)
+    path = _checkpoint_path(name)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def clear_checkpoint(name):
+    """Rimuove un checkpoint (es. a fine harvest completato)."""
+    path = _checkpoint_path(name)
+    if os.path.exists(path):
+        os.remove(path)
\ No newline at end of file
@@ -1,15 +1,240 @@
-from elasticsearch import Elasticsearch, ConnectionError
+import os
+import time
+import asyncio
+import threading
+from elasticsearch import Elasticsearch, AsyncElasticsearch, ConnectionError
 from src.config import Config
 
-def get_es_client():
+# Client condiviso dal processo (creato una sola volta, vedi get_es_client)
+_client = None
+_client_pid = None
+_checked = False
+_lock = threading.Lock()
+
+def new_health_state():
+    """Stato di un health check non ancora eseguito (aggiornato da check_health)."""
+    return {"ok": None, "checked_at": None, "error": None, "generation": None}
+
+
+# Stato dell'ultimo health check in background
+_health = new_health_state()
+_monitor = None
+
+
+def _build_client():
+    """Client con pool di connessioni persistenti (keep-alive) e timeout configurabili."""
+    return Elasticsearch(
+        Config.ES_HOST,
+        connections_per_node=Config.ES_POOL_MAXSIZE,
+        request_timeout=Config.ES_REQUEST_TIMEOUT,
+        max_retries=Config.ES_MAX_RETRIES,
+        retry_on_timeout=True
+    )
+
+
+def build_async_es_client():
+    """
+    Client asincrono (AsyncElasticsearch) con gli stessi timeout e retry; il pool è
+    più ampio perché ogni richiesta web tiene aperte più ricerche contemporaneamente.
+    È legato all'event loop in cui viene usato: va creato all'avvio del server
+    asincrono e chiuso (await client.close()) allo spegnimento.
+    """
+    return AsyncElasticsearch(
+        Config.ES_HOST,
+        connections_per_node=Config.ES_ASYNC_POOL_MAXSIZE,
+        request_timeout=Config.ES_REQUEST_TIMEOUT,
+        max_retries=Config.ES_MAX_RETRIES,
+        retry_on_timeout=True
+    )
+
+
+def get_es_client(check=True):
+    """
+    Restituisce il client Elasticsearch condiviso dal processo.
+    Il client (e il suo pool di connessioni) viene creato alla prima chiamata
+    e riusato dalle successive; dopo un fork ne viene creato uno nuovo.
+    check=True: ping alla prima richiesta (una sola volta per processo),
+    solleva ConnectionError se la connessione fallisce.
+    check=False: nessun ping sul percorso della richiesta (es. app web,
+    dove lo stato è verificato in background da start_health_monitor).
+    """
+    global _client, _client_pid, _checked
+
+    with _lock:
+        if _client is None or _client_pid != os.getpid():
+            _client = _build_client()
+            _client_pid = os.getpid()
+            _checked = False
+        es = _client
+
+        # Ping immediato (solo la prima volta) per verificare la connettività reale
+        if check and not _checked:
+            if not es.ping():
+                raise ConnectionError(f"Impossibile connettersi a Elasticsearch su {Config.ES_HOST}")
+            _checked = True
+
+    return es
+
+
+def close_es_client():
+    """Chiude il client condiviso e le sue connessioni."""
+    global _client, _checked
+    with _lock:
+        if _client is not None:
+            _client.close()
+        _client = None
+        _checked = False
+
+
+def es_health():
+    """Esito dell'ultimo health check in background (ok=None se non ancora eseguito)."""
+    return dict(_health)
+
+
+def check_health(es, health):
+    """Ping e generazione degli indici: aggiorna il dict health (vedi new_health_state)."""
+    try:
+        ok = bool(es.ping())
+        health.update(ok=ok, error=None if ok else "ping fallito")
+        if ok:
+            health["generation"] = get_index_generation(es)
+    except Exception as e:
+        health.update(ok=False, error=str(e))
+    health["checked_at"] = time.time()
+
+
+async def check_health_async(es, health):
+    """Come check_health, con il client asincrono."""
+    try:
+        ok = bool(await es.ping())
+        health.update(ok=ok, error=None if ok else "ping fallito")
+        if ok:
+            health["generation"] = await get_index_generation_async(es)
+    except Exception as e:
+        health.update(ok=False, error=str(e))
+    health["checked_at"] = time.time()
+
+
+def start_health_monitor(interval=None):
+    """
+    Avvia (una sola volta) un thread che verifica periodicamente Elasticsearch
+    e legge la generazione degli indici, così né il ping né la lettura del
+    contatore pesano sulle singole richieste.
+    """
+    global _monitor
+    interval = interval or Config.ES_HEALTH_INTERVAL
+
+    def loop():
+        while True:
+            check_health(get_es_client(check=False), _health)
+            time.sleep(interval)
+
+    with _lock:
+        if _monitor is None or not _monitor.is_alive():
+            _monitor = threading.Thread(target=loop, name="es-health", daemon=True)
+            _monitor.start()
+
+
+async def health_monitor_async(es, health, interval=None):
+    """
+    Variante asincrona di start_health_monitor per un client AsyncElasticsearch:
+    coroutine da avviare come task nell'event loop del server (si ferma con cancel()).
+    """
+    interval = interval or Config.ES_HEALTH_INTERVAL
+    while True:
+        await check_health_async(es, health)
+        await asyncio.sleep(interval)
+
+
+def get_index_generation(es):
+    """Contatore di generazione degli indici (0 se non ancora creato)."""
+    resp = es.options(ignore_status=404).get(index=Config.INDEX_META, id="generation")
+    if not resp.get("found"):
+        return 0
+    return resp["_source"].get("generation", 0)
+
+
+async def get_index_generation_async(es):
+    """Come get_index_generation, con il client asincrono."""
+    resp = await es.options(ignore_status=404).get(index=Config.INDEX_META, id="generation")
+    if not resp.get("found"):
+        return 0
+    return resp["_source"].get("generation", 0)
+
+
+class IndexGeneration:
+    """
+    Generazione degli indici per la cache dei risultati, controllata a ogni lookup.
+    Il valore viene riletto da Elasticsearch (get per id, in tempo reale) se
+    l'ultima lettura è più vecchia di max_age secondi: dopo un bump la cache
+    viene invalidata entro max_age secondi più la durata della lettura, con al
+    più una lettura ogni max_age secondi anche sotto carico.
+    Se Elasticsearch non risponde resta l'ultimo valore letto.
+    """
+
+    def __init__(self, max_age=None):
+        self.max_age = Config.WEB_CACHE_GENERATION_MAX_AGE if max_age is None else max_age
+        self.value = None
+        self._read_at = None
+        self._reading = False
+        self._lock = threading.Lock()
+
+    def _expired(self):
+        return self._read_at is None or time.monotonic() - self._read_at >= self.max_age
+
+    def get(self, es):
+        """Generazione corrente (client sincrono): i thread concorrenti attendono una sola lettura."""
+        with self._lock:
+            if self._expired():
+                try:
+                    self.value = get_index_generation(es)
+                except Exception:
+                    pass
+                self._read_at = time.monotonic()
+            return self.value
+
+    async def get_async(self, es):
+        """Generazione corrente (client asincrono): durante una lettura le altre richieste usano l'ultimo valore."""
+        if self._expired() and not self._reading:
+            self._reading = True
+            try:
+                self.value = await get_index_generation_async(es)
+            except Exception:
+                pass
+            finally:
+                self._read_at = time.monotonic()
+                self._reading = False
+        return self.value
+
+
+def bump_index_generation(es):
+    """
+    Incrementa il contatore di generazione dopo una re-indicizzazione:
+    le cache dei risultati (es. app web) vengono invalidate al controllo successivo.
+    """
+    resp = es.update(
+        index=Config.INDEX_META, id="generation",
+        script={"source": "ctx._source.generation += 1; ctx._source.updated_at = params.now", "params": {"now": int(time.time())}},
+        upsert={"generation": 1, "updated_at": int(time.time())},
+        refresh=True, source=True
+    )
+    return resp["get"]["_source"]["generation"]
+
+
+def multi_search(es, searches):
     """
-    Restituisce il client Elasticsearch.
-    Solleva ConnectionError se la connessione fallisce.
+    Esegue più ricerche in una sola richiesta _msearch (un solo round trip).
+    searches: lista di (indice, body); indice None per le ricerche su un
+    point in time (l'indice è implicito nel PIT).
+    Restituisce la lista delle risposte nello stesso ordine: ogni risposta
+    contiene "took" (ms lato server) oppure "error" se la ricerca su
+    quell'indice è fallita (gli altri indici non ne risentono).
     """
-    es = Elasticsearch(Config.ES_HOST)
-    
-    # Ping immediato per verificare la connettività reale
-    if not es.ping():
-        raise ConnectionError(f"Impossibile connettersi a Elasticsearch su {Config.ES_HOST}")
-    
-    return es
\ No newline at end of file
+    if not searches:
+        return []
+    lines = []
+    for index, body in searches:
+        lines.append({"index": index} if index else {})
+        lines.append(body)
+    resp = es.msearch(searches=lines)
+    return list(resp["responses"])
@@ -0,0 +1,131 @@
+from collections import deque
+
+from elasticsearch import helpers
+from src.config import Config
+
+
+def stream_bulk(es, actions, label="", chunk_size=None, max_chunk_bytes=None, threads=None, on_result=None):
+    """
+    Indicizza un iterabile (anche generatore) di azioni bulk senza materializzarlo.
+    Usa helpers.streaming_bulk (o parallel_bulk se threads > 1): le azioni
+    vengono consumate a blocchi di chunk_size / max_chunk_bytes, quindi la
+    memoria resta limitata indipendentemente dal numero di documenti.
+    on_result(ok, info), se indicato, viene chiamata per ogni risposta
+    (es. per registrare il completamento dei singoli paper).
+    Il report "blocco N" corrisponde a una richiesta _bulk reale: i blocchi
+    vengono delimitati qui con le stesse regole dell'helper (vedi _chunk_actions).
+    Restituisce: (numero_successi, lista_errori)
+    """
+    chunk_size = chunk_size or Config.BULK_CHUNK_SIZE
+    max_chunk_bytes = max_chunk_bytes or Config.BULK_MAX_CHUNK_BYTES
+    threads = threads or Config.BULK_THREADS
+
+    # Numero di azioni di ciascun blocco già chiuso, nell'ordine di invio
+    blocks = deque()
+    serializer = es.transport.serializers.get_serializer("application/json")
+    actions = _chunk_actions(actions, chunk_size, max_chunk_bytes, serializer, blocks)
+
+    if threads > 1:
+        results = helpers.parallel_bulk(
+            es, actions,
+            thread_count=threads,
+            expand_action_callback=_expanded,
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False
+        )
+    else:
+        results = helpers.streaming_bulk(
+            es, actions,
+            expand_action_callback=_expanded,
+            chunk_size=chunk_size,
+            max_chunk_bytes=max_chunk_bytes,
+            raise_on_error=False,
+            raise_on_exception=False
+        )
+
+    success = 0
+    errors = []
+
+    # Contatori del blocco corrente (un report per ogni richiesta _bulk)
+    block = 0
+    block_ok = 0
+    block_failed = 0
+
+    for ok, info in results:
+        # Cancellazione di un documento già assente: non è un errore.
+        # Un update su un documento assente resta un errore (il testo non è stato scritto)
+        if not ok and info.get("delete", {}).get("status") == 404:
+            ok = True
+
+        if on_result is not None:
+            on_result(ok, info)
+
+        if ok:
+            success += 1
+            block_ok += 1
+        else:
+            errors.append(info)
+            block_failed += 1
+
+        # Le risposte arrivano nell'ordine delle azioni: il blocco in testa
+        # è completo quando ha ricevuto tutte le sue risposte
+        if blocks and block_ok + block_failed >= blocks[0]:
+            blocks.popleft()
+            block += 1
+            _report_block(label, block, block_ok, block_failed)
+            block_ok = 0
+            block_failed = 0
+
+    if block_ok + block_failed > 0:
+        block += 1
+        _report_block(label, block, block_ok, block_failed)
+
+    return success, errors
+
+
+def _chunk_actions(actions, chunk_size, max_chunk_bytes, serializer, blocks):
+    """
+    Espande e serializza le azioni, registrando in blocks la dimensione di
+    ogni blocco con le stesse regole di helpers._ActionChunker (chunk_size
+    azioni o max_chunk_bytes, +1 byte per il newline di ogni riga).
+    Il corpo viene passato già serializzato: l'helper non lo serializza di nuovo.
+    """
+    size = 0
+    count = 0
+    for action in actions:
+        header, data = helpers.expand_action(action)
+        cur_size = len(_to_bytes(serializer.dumps(header))) + 1
+        if data is not None:
+            data = _to_bytes(serializer.dumps(data))
+            cur_size += len(data) + 1
+
+        if count and (size + cur_size > max_chunk_bytes or count == chunk_size):
+            blocks.append(count)
+            size = 0
+            count = 0
+
+        size += cur_size
+        count += 1
+        yield header, data
+
+    if count:
+        blocks.append(count)
+
+
+def _expanded(action):
+    """Le azioni prodotte da _chunk_actions sono già espanse in (header, corpo)."""
+    return action
+
+
+def _to_bytes(value):
+    return value if isinstance(value, bytes) else value.encode("utf-8")
+
+
+def _report_block(label, block, ok, failed):
+    """Stampa l'esito di un blocco bulk (dettaglio solo se ci sono errori)."""
+    if failed:
+        print(f"[BULK] {label} blocco {block}: {ok} ok, {failed} ERRORI")
+    else:
+        print(f"[BULK] {label} blocco {block}: {ok} ok")
@@ -0,0 +1,170 @@
+import os
+import json
+import hashlib
+
+
+def file_hash(path):
+    """Calcola l'hash SHA-256 del contenuto di un file (lettura a blocchi)."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def text_hash(text):
+    """Hash SHA-256 di un HTML così come viene salvato su disco (UTF-8): coincide con file_hash."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def validator_headers(validator):
+    """Header condizionali (If-None-Match) per riscaricare un paper già indicizzato."""
+    if validator and validator.get("etag"):
+        return {"If-None-Match": validator["etag"]}
+    return {}
+
+
+class Manifest:
+    """
+    Manifest locale per il re-indexing incrementale.
+    Per ogni paper memorizza hash dell'HTML (più mtime/size come scorciatoia),
+    ETag della risposta e gli _id di figure e tabelle indicizzate, così da:
+      - saltare i paper invariati (download, estrazione e indicizzazione):
+        l'harvest rivalida ogni paper con l'ETag e confronta l'hash del contenuto
+      - rimuovere le figure/tabelle obsolete dei paper modificati
+    Con expect/acknowledge ogni paper viene confermato appena tutte le sue
+    azioni bulk hanno avuto esito positivo (marcatore di completamento):
+    con save_every > 0 il manifest viene salvato ogni save_every paper
+    confermati, così una pipeline interrotta riprende dal punto raggiunto.
+    """
+
+    def __init__(self, path, papers=None, save_every=0):
+        self.path = path
+        self.papers = papers or {}
+        self.save_every = save_every
+        self._staged = {}
+        self._hashes = {}
+        self._etags = {}
+        self._pending = {}      # paper_id -> azioni bulk senza risposta
+        self._actions = {}      # (indice, _id) -> paper_id in attesa di risposta
+        self._failed = set()
+        self._unsaved = 0
+
+    @classmethod
+    def load(cls, path):
+        """Carica il manifest da disco (vuoto se non esiste o è corrotto)."""
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return cls(path, data.get("papers", {}))
+        except (OSError, ValueError):
+            print(f"[MANIFEST] File non leggibile, ricostruzione da zero: {path}")
+            return cls(path)
+
+    def save(self):
+        """Salva il manifest in modo atomico (scrittura su file temporaneo + rename)."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"papers": self.papers}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+        self._unsaved = 0
+
+    def validators(self):
+        """
+        Hash ed ETag dell'HTML dei paper indicizzati: {paper_id: {"hash": ..., "etag": ...}}.
+        Un paper viene saltato dall'harvest solo se il server risponde 304 o se
+        l'hash del contenuto scaricato coincide (un ID già visto non basta).
+        """
+        return {
+            paper_id: {"hash": entry.get("hash"), "etag": entry.get("etag")}
+            for paper_id, entry in self.papers.items()
+        }
+
+    def set_etag(self, paper_id, etag):
+        """ETag dell'HTML appena scaricato (salvato con il paper quando viene confermato)."""
+        self._etags[paper_id] = etag
+
+    def has_changed(self, path, paper_id):
+        """
+        Verifica se il file HTML di un paper è nuovo o modificato.
+        Se mtime e dimensione coincidono con il manifest evita di ricalcolare l'hash.
+        """
+        stat = os.stat(path)
+        entry = self.papers.get(paper_id)
+
+        if entry and entry.get("mtime") == stat.st_mtime and entry.get("size") == stat.st_size:
+            return False
+
+        digest = file_hash(path)
+        self._hashes[paper_id] = (digest, stat.st_mtime, stat.st_size)
+
+        if entry and entry.get("hash") == digest:
+            # Contenuto identico (es. file riscritto): aggiorna solo mtime/size
+            entry["mtime"] = stat.st_mtime
+            entry["size"] = stat.st_size
+            return False
+        return True
+
+    def stale_ids(self, paper_id, figure_ids, table_ids):
+        """
+        _id indicizzati in precedenza per il paper che non esistono più
+        nella nuova estrazione. Restituisce: (figure_obsolete, tabelle_obsolete)
+        """
+        entry = self.papers.get(paper_id)
+        if not entry:
+            return [], []
+        old_figs = set(entry.get("figures", [])) - set(figure_ids)
+        old_tabs = set(entry.get("tables", [])) - set(table_ids)
+        return sorted(old_figs), sorted(old_tabs)
+
+    def stage(self, paper_id, source, figure_ids, table_ids):
+        """
+        Prepara l'aggiornamento di un paper (confermato solo dopo il bulk).
+        Va chiamata dopo aver generato tutte le azioni del paper.
+        """
+        digest, mtime, size = self._hashes.get(paper_id, (None, None, None))
+        self._staged[paper_id] = {
+            "source": source,
+            "hash": digest,
+            "mtime": mtime,
+            "size": size,
+            # Senza un nuovo download l'ETag precedente non descrive più il contenuto
+            "etag": self._etags.pop(paper_id, None),
+            "figures": list(figure_ids),
+            "tables": list(table_ids)
+        }
+        self._commit_if_done(paper_id)
+
+    def expect(self, paper_id, index, doc_id):
+        """Registra un'azione bulk del paper di cui attendere l'esito."""
+        self._actions.setdefault((index, doc_id), []).append(paper_id)
+        self._pending[paper_id] = self._pending.get(paper_id, 0) + 1
+
+    def acknowledge(self, index, doc_id, ok):
+        """Esito di un'azione bulk: il paper è confermato quando tutte le sue azioni sono riuscite."""
+        papers = self._actions.get((index, doc_id))
+        if not papers:
+            return
+        paper_id = papers.pop(0)
+        if not papers:
+            del self._actions[(index, doc_id)]
+        if not ok:
+            self._failed.add(paper_id)
+        self._pending[paper_id] -= 1
+        self._commit_if_done(paper_id)
+
+    def _commit_if_done(self, paper_id):
+        if paper_id not in self._staged or self._pending.get(paper_id, 0) > 0:
+            return
+        self._pending.pop(paper_id, None)
+        entry = self._staged.pop(paper_id)
+        if paper_id in self._failed:
+            # Verrà rielaborato al prossimo run
+            return
+        self.papers[paper_id] = entry
+        self._unsaved += 1
+        if self.save_every and self._unsaved >= self.save_every:
+            self.save()
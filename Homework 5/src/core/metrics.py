@@ -0,0 +1,172 @@
+import os
+import json
+import time
+from contextlib import contextmanager
+import numpy as np
+
+# Quantili riportati nei riepiloghi e nel file Prometheus
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class SpanTimer:
+    """
+    Misura la durata di fasi nominate (span) con time.perf_counter (monotono).
+    Più span con lo stesso nome vengono sommati.
+    """
+
+    def __init__(self):
+        self.spans = {}
+
+    @contextmanager
+    def span(self, name):
+        t_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.spans[name] = self.spans.get(name, 0.0) + time.perf_counter() - t_start
+
+
+def percentiles(values, quantiles=QUANTILES):
+    """Quantili (interpolazione lineare) di una lista di valori; vuoto se non ci sono valori."""
+    if not values:
+        return {}
+    points = np.percentile(np.asarray(values, dtype=float), [q * 100 for q in quantiles])
+    return {q: float(p) for q, p in zip(quantiles, points)}
+
+
+class MetricsCollector:
+    """
+    Raccoglie le metriche di estrazione per paper (span e conteggi) e le
+    durate delle fasi della pipeline.
+      - ogni record viene scritto subito come riga JSON (formato "jsonl")
+      - a fine run: riepilogo p50/p95/p99 per fase e sorgente, ed eventuale
+        file di testo in formato Prometheus (formato "prometheus")
+    formats: insieme di "jsonl" / "prometheus" (vuoto = solo in memoria)
+    """
+
+    def __init__(self, folder, formats=()):
+        self.folder = folder
+        self.formats = set(formats)
+        self.papers = []
+        self.stages = {}
+        self._jsonl = None
+
+        if "jsonl" in self.formats:
+            os.makedirs(folder, exist_ok=True)
+            self._jsonl = open(os.path.join(folder, "extraction.jsonl"), "w", encoding="utf-8")
+
+    def _write(self, record):
+        if self._jsonl is not None:
+            self._jsonl.write(json.dumps(record) + "\n")
+            self._jsonl.flush()
+
+    def record_paper(self, paper_id, source, spans, counts):
+        """Metriche di un paper: span in secondi e conteggi (figure, tabelle, paragrafi)."""
+        record = {"type": "paper", "paper_id": paper_id, "source": source, "spans": spans, "counts": counts}
+        self.papers.append(record)
+        self._write(record)
+
+    def record_stage(self, stage, seconds, **extra):
+        """Durata di una fase della pipeline (harvest, estrazione, bulk, ...)."""
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        self._write({"type": "stage", "stage": stage, "seconds": seconds, **extra})
+
+    def span_values(self, span, source=None):
+        return [
+            p["spans"][span] for p in self.papers
+            if span in p["spans"] and (source is None or p["source"] == source)
+        ]
+
+    def span_names(self):
+        names = []
+        for p in self.papers:
+            for name in p["spans"]:
+                if name not in names:
+                    names.append(name)
+        return names
+
+    def sources(self):
+        return sorted({p["source"] for p in self.papers})
+
+    def totals(self, source=None):
+        """Somma dei conteggi (figure, tabelle, paragrafi) dei paper."""
+        totals = {}
+        for p in self.papers:
+            if source is None or p["source"] == source:
+                for key, value in p["counts"].items():
+                    totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def summary(self):
+        """
+        Riepilogo dei quantili per span, complessivo e per sorgente.
+        Restituisce: dict sorgente ("all", "arxiv", ...) -> span -> {n, p50, p95, p99}
+        """
+        out = {}
+        for source in [None] + self.sources():
+            rows = {}
+            for span in self.span_names():
+                values = self.span_values(span, source)
+                if values:
+                    q = percentiles(values)
+                    rows[span] = {"n": len(values), "p50": q[0.5], "p95": q[0.95], "p99": q[0.99]}
+            out[source or "all"] = rows
+        return out
+
+    def print_summary(self):
+        print("\n=== EXTRACTION SPANS (p50 / p95 / p99) ===")
+        for source, rows in self.summary().items():
+            counts = self.totals(None if source == "all" else source)
+            print(
+                f"[{source}] figure: {counts.get('figures', 0)} | tabelle: {counts.get('tables', 0)} | "
+                f"paragrafi: {counts.get('paragraphs', 0)}"
+            )
+            for span, row in rows.items():
+                print(
+                    f"   {span:<12} n={row['n']:<5} p50={row['p50']:.3f}s "
+                    f"p95={row['p95']:.3f}s p99={row['p99']:.3f}s"
+                )
+        for stage, seconds in self.stages.items():
+            print(f"[stage] {stage:<12} {seconds:.2f}s")
+
+    def to_prometheus(self):
+        """Metriche in formato testo Prometheus (summary per span, contatori per oggetti)."""
+        lines = [
+            "# HELP extraction_span_seconds Durata delle fasi di estrazione per paper.",
+            "# TYPE extraction_span_seconds summary"
+        ]
+        for source in self.sources():
+            for span in self.span_names():
+                values = self.span_values(span, source)
+                if not values:
+                    continue
+                labels = f'span="{span}",source="{source}"'
+                for q, value in percentiles(values).items():
+                    lines.append(f'extraction_span_seconds{{{labels},quantile="{q}"}} {value:.6f}')
+                lines.append(f"extraction_span_seconds_sum{{{labels}}} {sum(values):.6f}")
+                lines.append(f"extraction_span_seconds_count{{{labels}}} {len(values)}")
+
+        lines.append("# HELP extraction_objects_total Oggetti estratti (figure, tabelle, paragrafi).")
+        lines.append("# TYPE extraction_objects_total counter")
+        for source in self.sources():
+            for kind, value in self.totals(source).items():
+                lines.append(f'extraction_objects_total{{kind="{kind}",source="{source}"}} {value}')
+
+        lines.append("# HELP pipeline_stage_seconds Durata delle fasi della pipeline.")
+        lines.append("# TYPE pipeline_stage_seconds gauge")
+        for stage, seconds in self.stages.items():
+            lines.append(f'pipeline_stage_seconds{{stage="{stage}"}} {seconds:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def close(self):
+        """Chiude il file JSON lines e scrive il file Prometheus (se richiesti)."""
+        if self._jsonl is not None:
+            self._jsonl.close()
+            self._jsonl = None
+        if "prometheus" in self.formats:
+            os.makedirs(self.folder, exist_ok=True)
+            path = os.path.join(self.folder, "extraction.prom")
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(tmp_path, path)
@@ -0,0 +1,77 @@
+import os
+import mmap
+import numpy as np
+
+
+class ParagraphStore:
+    """
+    Archivio dei paragrafi dei paper, indirizzato per (paper_id, indice paragrafo).
+    Per ogni paper due file:
+      - <paper_id>.txt: testi UTF-8 concatenati
+      - <paper_id>.off.npy: offset in byte (n_paragrafi + 1 valori)
+    In lettura i file sono mappati in memoria (mmap): l'estrazione scambia solo
+    indici tra i processi e i testi vengono materializzati al momento di
+    costruire le azioni bulk, senza tenere copie duplicate in RAM.
+    Un file per paper: i processi del pool scrivono senza coordinarsi.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self._open = {}
+
+    def _paths(self, paper_id):
+        return (
+            os.path.join(self.folder, f"{paper_id}.txt"),
+            os.path.join(self.folder, f"{paper_id}.off.npy")
+        )
+
+    def write(self, paper_id, texts):
+        """Salva (sovrascrivendo) i paragrafi di un paper, in modo atomico."""
+        os.makedirs(self.folder, exist_ok=True)
+        text_path, offsets_path = self._paths(paper_id)
+        self.release(paper_id)
+
+        encoded = [t.encode("utf-8") for t in texts]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        if encoded:
+            offsets[1:] = np.cumsum([len(b) for b in encoded])
+
+        tmp_text = f"{text_path}.{os.getpid()}.tmp"
+        with open(tmp_text, "wb") as f:
+            f.write(b"".join(encoded))
+        tmp_offsets = f"{offsets_path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_offsets, offsets)
+
+        os.replace(tmp_text, text_path)
+        os.replace(tmp_offsets, offsets_path)
+
+    def _mapping(self, paper_id):
+        if paper_id not in self._open:
+            text_path, offsets_path = self._paths(paper_id)
+            offsets = np.load(offsets_path, mmap_mode="r")
+            data = b""
+            # mmap non accetta file vuoti (paper senza paragrafi)
+            if offsets[-1] > 0:
+                with open(text_path, "rb") as f:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._open[paper_id] = (data, offsets)
+        return self._open[paper_id]
+
+    def get(self, paper_id, idx):
+        """Testo del paragrafo idx del paper."""
+        data, offsets = self._mapping(paper_id)
+        return data[offsets[idx]:offsets[idx + 1]].decode("utf-8")
+
+    def texts(self, paper_id, indices):
+        """Testi dei paragrafi indicati (stesso ordine degli indici)."""
+        return [self.get(paper_id, idx) for idx in indices]
+
+    def release(self, paper_id):
+        """Chiude la mappatura di un paper (dopo averne costruito le azioni bulk)."""
+        data, _ = self._open.pop(paper_id, (None, None))
+        if isinstance(data, mmap.mmap):
+            data.close()
+
+    def close(self):
+        for paper_id in list(self._open):
+            self.release(paper_id)
@@ -0,0 +1,77 @@
+import queue
+import threading
+
+# Marcatore di fine flusso tra due stadi
+_DONE = object()
+
+
+class PipelineAborted(RuntimeError):
+    """Uno stadio della pipeline è fallito: gli altri stadi si fermano."""
+
+
+class BoundedQueue:
+    """
+    Coda limitata tra due stadi della pipeline (producer/consumer).
+    Quando è piena il producer si blocca (backpressure): la memoria resta
+    costante anche se uno stadio è più lento degli altri.
+    Se un qualsiasi stadio fallisce (evento abort) put e iterazione si
+    interrompono con PipelineAborted invece di restare bloccati.
+    """
+
+    def __init__(self, maxsize, abort):
+        self._queue = queue.Queue(maxsize=maxsize)
+        self.abort = abort
+        self.high_water = 0
+
+    def put(self, item):
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                self._queue.put(item, timeout=0.2)
+                self.high_water = max(self.high_water, self._queue.qsize())
+                return
+            except queue.Full:
+                continue
+
+    def close(self):
+        """Segnala al consumer che non arriveranno altri elementi."""
+        try:
+            self.put(_DONE)
+        except PipelineAborted:
+            pass
+
+    def __iter__(self):
+        while True:
+            if self.abort.is_set():
+                raise PipelineAborted()
+            try:
+                item = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                return
+            yield item
+
+
+class StageThread(threading.Thread):
+    """
+    Thread che esegue uno stadio della pipeline.
+    Un'eccezione viene conservata in self.error (rilanciata dal chiamante
+    dopo join) e attiva l'evento abort, così gli altri stadi si fermano.
+    """
+
+    def __init__(self, name, target, abort):
+        super().__init__(name=name, daemon=True)
+        self.target = target
+        self.abort = abort
+        self.error = None
+
+    def run(self):
+        try:
+            self.target()
+        except PipelineAborted:
+            pass
+        except BaseException as e:
+            self.error = e
+            self.abort.set()
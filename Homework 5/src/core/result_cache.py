@@ -0,0 +1,75 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+def normalize_query(query):
+    """Query normalizzata per la chiave di cache (spazi multipli compressi)."""
+    return " ".join(query.split())
+
+
+class ResultCache:
+    """
+    Cache in memoria dei risultati di ricerca, con TTL ed eviction LRU.
+    Le voci sono legate alla generazione degli indici: quando una
+    re-indicizzazione incrementa il contatore la cache viene svuotata.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()   # chiave -> (scadenza, valore)
+        self._lock = threading.Lock()
+
+    def _sync_generation(self, generation):
+        if generation != self.generation:
+            self._entries.clear()
+            self.generation = generation
+
+    def get(self, key, generation=None):
+        """Valore in cache per la chiave (None se assente, scaduto o di una generazione precedente)."""
+        with self._lock:
+            self._sync_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value, generation=None):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._sync_generation(generation)
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Contatori di hit/miss (per il monitoraggio)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "generation": self.generation,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
@@ -1,2 +1,2 @@
-from .arxiv import download_arxiv_data
-from .pubmed import download_pubmed_data
\ No newline at end of file
+from .arxiv import download_arxiv_data, iter_arxiv_pages
+from .pubmed import download_pubmed_data, iter_pubmed_pages
\ No newline at end of file
@@ -1,44 +1,147 @@
-import arxiv
-import requests
-import time
 import os
+import xml.etree.ElementTree as ET
+from datetime import datetime
 import pandas as pd
-from bs4 import BeautifulSoup
 from src.config import Config
-from src.core.utils import clean_text, sanitize_filename
+from src.core.utils import sanitize_filename
+from src.core.manifest import text_hash, validator_headers
+from src.ingestion.fetcher import fetch_many
 
-def download_arxiv_data():
-    """Scarica metadati e HTML da ArXiv."""
+# API di ricerca ArXiv (feed Atom con estensioni OpenSearch)
+API_URL = "https://export.arxiv.org/api/query"
+ATOM = "{http://www.w3.org/2005/Atom}"
+OPENSEARCH = "{http://a9.com/-/spec/opensearch/1.1/}"
+
+def download_arxiv_data(known=None):
+    """
+    Scarica metadati e HTML da ArXiv.
+    known: hash/ETag dei paper già indicizzati (Manifest.validators()): vengono
+    saltati solo se l'HTML non è cambiato.
+    Nota: full_text contiene l'abstract (full_text_pending=True se l'HTML è
+    stato salvato); il testo completo viene ricavato dall'HTML in fase di
+    elaborazione (process_document).
+    """
+    data_buffer = []
+    for _, docs in iter_arxiv_pages(known):
+        data_buffer.extend(docs)
+    return pd.DataFrame(data_buffer)
+
+
+def _parse_entry(entry):
+    """Campi usati dall'harvest da un <entry> del feed Atom."""
+    published = entry.findtext(f"{ATOM}published", "").strip()
+    return {
+        "entry_id": entry.findtext(f"{ATOM}id", "").strip(),
+        "title": " ".join(entry.findtext(f"{ATOM}title", "").split()),
+        "summary": entry.findtext(f"{ATOM}summary", "").strip(),
+        "authors": [a.findtext(f"{ATOM}name", "").strip() for a in entry.findall(f"{ATOM}author")],
+        "published": datetime.fromisoformat(published.replace("Z", "+00:00")) if published else None
+    }
+
+
+def _search_page(start, size):
+    """
+    Una pagina dell'API di ricerca, scaricata con fetch_many (cache HTTP,
+    rate limit per host e retry condivisi con il resto dell'ingestion).
+    Restituisce: (totale_risultati, voci_della_pagina)
+    """
+    params = {
+        "search_query": f'ti:"{Config.QUERY_ARXIV}"',
+        "sortBy": "submittedDate",
+        "sortOrder": "descending",
+        "start": str(start),
+        "max_results": str(size)
+    }
+    resp = fetch_many(
+        [(API_URL, params, {'User-Agent': Config.USERAGENT_ARXIV})],
+        rate_limits={"export.arxiv.org": Config.RATE_LIMIT_ARXIV_API}
+    )[0]
+    resp.raise_for_status()
+    root = ET.fromstring(resp.content)
+    total = int(root.findtext(f"{OPENSEARCH}totalResults", "0"))
+    return total, [_parse_entry(e) for e in root.findall(f"{ATOM}entry")]
+
+
+def iter_arxiv_pages(known=None, start=0):
+    """
+    Harvest paginato da ArXiv (memoria costante).
+    start: offset da cui riprendere (cursore salvato da un harvest interrotto).
+    Restituisce (generatore): coppie (offset_successivo, documenti_della_pagina)
+    """
     print(f"\n[ArXiv] Ricerca: '{Config.QUERY_ARXIV}'")
+    if start:
+        print(f"[ArXiv] Ripresa dall'offset {start}")
     
-    client = arxiv.Client()
-    search = arxiv.Search(
-        query=f'ti:"{Config.QUERY_ARXIV}"',
-        max_results=Config.MAX_DOCS,
-        sort_by=arxiv.SortCriterion.SubmittedDate
-    )
-    
-    results = list(client.results(search))
-    data_buffer = []
+    page_size = max(1, Config.INGEST_PAGE_SIZE)
+    known = known or {}
 
     if not os.path.exists(Config.OUTPUT_DIR_ARXIV):
         os.makedirs(Config.OUTPUT_DIR_ARXIV)
 
-    for i, result in enumerate(results, 1):
-        doc_id = result.entry_id.split("/")[-1]
+    offset = start
+    while offset < Config.MAX_DOCS:
+        size = min(page_size, Config.MAX_DOCS - offset)
+        # L'API a volte restituisce pagine vuote a metà risultati: si ritenta
+        for attempt in range(Config.FETCH_RETRIES + 1):
+            try:
+                total, entries = _search_page(offset, size)
+            except Exception as e:
+                print(f"Errore ricerca ArXiv (start={offset}): {e}")
+                return
+            if entries or offset >= total:
+                break
+
+        if not entries:
+            return
+        offset += len(entries)
+        yield offset, _process_page(entries, known)
+        if offset >= total:
+            return
+
+
+def _process_page(entries, known):
+    """
+    Scarica l'HTML di una pagina di risultati e costruisce i documenti.
+    I paper già indicizzati vengono richiesti con l'ETag salvato e saltati
+    se il server risponde 304 o se l'hash dell'HTML non è cambiato.
+    """
+    data_buffer = []
+
+    # Download HTML concorrente (rate limit per host al posto di sleep fissi)
+    headers = {'User-Agent': Config.USERAGENT_ARXIV}
+    responses = fetch_many(
+        [
+            (e["entry_id"].replace("/abs/", "/html/"), None,
+             {**headers, **validator_headers(known.get(sanitize_filename(e["entry_id"].split("/")[-1])))})
+            for e in entries
+        ],
+        rate_limits={"arxiv.org": Config.RATE_LIMIT_ARXIV}
+    )
+
+    for entry, resp in zip(entries, responses):
+        doc_id = entry["entry_id"].split("/")[-1]
         safe_title = sanitize_filename(doc_id)
+        previous = known.get(safe_title)
+
+        if previous and resp.status_code == 304:
+            print(f"ArXiv Invariato (skip): {doc_id}")
+            continue
         
-        print(f"[{i}/{len(results)}] ArXiv Processing: {doc_id}")
+        print(f"[ArXiv] Processing: {doc_id}")
 
-        # Download HTML
-        html_url = result.entry_id.replace("/abs/", "/html/")
+        # Salvataggio HTML
+        html_url = entry["entry_id"].replace("/abs/", "/html/")
         raw_html = ""
         file_saved = False
         
         try:
-            resp = requests.get(html_url, headers={'User-Agent': Config.USERAGENT_ARXIV}, timeout=15)
+            if resp.error is not None:
+                raise resp.error
             if resp.status_code == 200 and len(resp.content) > 2000:
                 raw_html = resp.text
+                if previous and text_hash(raw_html) == previous["hash"]:
+                    print(f"ArXiv Invariato (skip): {doc_id}")
+                    continue
                 # Salvataggio su file
                 file_path = os.path.join(Config.OUTPUT_DIR_ARXIV, f"{safe_title}.html")
                 with open(file_path, "w", encoding="utf-8") as f:
@@ -47,29 +150,31 @@ def download_arxiv_data():
         except Exception as e:
             print(f"   Errore download HTML: {e}")
 
-        # Pulizia testo per full_text index
-        cleaned_text = ""
-        if raw_html:
-            soup = BeautifulSoup(raw_html, "html.parser")
-            for tag in soup(["script", "style", "head", "meta"]):
-                tag.extract()
-            cleaned_text = clean_text(soup.get_text())
-        else:
-            cleaned_text = result.summary
+        if previous and not file_saved:
+            # Download fallito: resta indicizzata la versione precedente
+            print(f"   {doc_id} già indicizzato: mantenuta la versione precedente")
+            continue
+
+        # Il full_text definitivo viene calcolato in fase di estrazione
+        # (process_document), con un unico parsing dell'HTML salvato:
+        # qui si indicizza l'abstract come testo provvisorio, segnalato da
+        # full_text_pending finché l'estrazione non lo sostituisce
+        cleaned_text = entry["summary"]
 
         data_buffer.append({
             "source": "arxiv",
             "document_id": doc_id,
-            "title": result.title,
-            "authors": [a.name for a in result.authors],
-            "date": result.published,
-            "abstract": result.summary,
+            "title": entry["title"],
+            "authors": entry["authors"],
+            "date": entry["published"],
+            "abstract": entry["summary"],
             "full_text": cleaned_text,
+            "full_text_pending": file_saved,
             "pdf_url": html_url,
             "local_file_saved": file_saved,
-            "local_filename": f"{safe_title}.html" if file_saved else None
+            "local_filename": f"{safe_title}.html" if file_saved else None,
+            # Validatore dell'HTML salvato (registrato nel manifest, non indicizzato)
+            "etag": resp.headers.get("ETag")
         })
-        
-        time.sleep(2) # Rate limit
 
-    return pd.DataFrame(data_buffer)
\ No newline at end of file
+    return data_buffer
\ No newline at end of file
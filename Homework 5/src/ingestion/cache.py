@@ -0,0 +1,348 @@
+import os
+import gzip
+import time
+import hashlib
+import sqlite3
+import threading
+import itertools
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from src.config import Config
+
+# Parametri esclusi dalla chiave di cache (non influenzano la risposta)
+_IGNORED_PARAMS = {"api_key"}
+
+# Parametri di sessione del History Server NCBI: cambiano a ogni esearch, quindi
+# vengono esclusi dalla chiave quando il chiamante indica cosa identifica il
+# result set (vary, es. termine di ricerca e ordinamento)
+_SESSION_PARAMS = {"WebEnv", "query_key"}
+
+# Header interno con cui le richieste requests passano vary all'adapter (non viene inviato)
+CACHE_VARY_HEADER = "X-Cache-Vary"
+
+# Contatore per i nomi dei file temporanei delle scritture in streaming
+_tmp_ids = itertools.count()
+
+
+class OfflineCacheMiss(requests.exceptions.ConnectionError):
+    """Richiesta non presente in cache con la modalità offline attiva."""
+
+
+def build_url(url, params=None):
+    """URL completo con i parametri di query (stessa codifica di requests)."""
+    return requests.Request("GET", url, params=params).prepare().url
+
+
+def cache_key(url, vary=None):
+    """
+    Chiave di cache di una richiesta GET: hash dell'URL normalizzato
+    (parametri ordinati, senza credenziali come api_key).
+    Con vary (stringa) WebEnv e query_key vengono sostituiti da vary, così le
+    pagine efetch dello stesso result set restano in cache tra un run e l'altro.
+    """
+    ignored = _IGNORED_PARAMS | _SESSION_PARAMS if vary else _IGNORED_PARAMS
+    parts = urlsplit(url)
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if k not in ignored)
+    normalized = urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), vary or ""))
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class HttpCache:
+    """
+    Cache HTTP persistente su disco, condivisa da ArXiv e PubMed.
+      - corpi indirizzati per contenuto (sha256) e compressi con gzip:
+        risposte identiche occupano spazio una sola volta
+      - indice SQLite: chiave richiesta -> corpo, ETag, Last-Modified, ultimo accesso
+      - richieste condizionali (If-None-Match / If-Modified-Since)
+      - limite di dimensione con eviction LRU
+      - modalità offline: risponde solo dalla cache, senza toccare la rete
+    """
+
+    def __init__(self, path, max_bytes, offline=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.objects_dir = os.path.join(path, "objects")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(path, "index.sqlite"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, url TEXT, body_hash TEXT, size INTEGER,"
+            " status INTEGER, content_type TEXT, encoding TEXT, etag TEXT,"
+            " last_modified TEXT, stored_at REAL, last_access REAL)"
+        )
+        self._db.commit()
+
+    def _object_path(self, body_hash):
+        return os.path.join(self.objects_dir, body_hash[:2], f"{body_hash}.gz")
+
+    def lookup(self, url, vary=None):
+        """Restituisce la voce di cache per l'URL (dict) oppure None."""
+        key = cache_key(url, vary)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body_hash, status, content_type, encoding, etag, last_modified"
+                " FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        body_hash, status, content_type, encoding, etag, last_modified = row
+        return {
+            "key": key, "body_hash": body_hash, "status": status,
+            "content_type": content_type, "encoding": encoding,
+            "etag": etag, "last_modified": last_modified
+        }
+
+    def open_body(self, entry):
+        """Apre il corpo di una voce come stream decompresso (lettura a blocchi); None se il file manca."""
+        try:
+            f = gzip.open(self._object_path(entry["body_hash"]), "rb")
+        except OSError:
+            return None
+        with self._lock:
+            self._db.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), entry["key"]))
+            self._db.commit()
+        return f
+
+    def load_body(self, entry):
+        """Legge (e decomprime) il corpo di una voce; None se il file manca."""
+        f = self.open_body(entry)
+        if f is None:
+            return None
+        with f:
+            return f.read()
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Header per la richiesta condizionale di una voce già in cache."""
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(self, url, status, body, headers, encoding=None, vary=None):
+        """Salva una risposta 200 (corpo compresso, deduplicato per hash)."""
+        if status != 200 or body is None:
+            return
+        headers = CaseInsensitiveDict(headers or {})
+        body_hash = hashlib.sha256(body).hexdigest()
+        obj_path = self._object_path(body_hash)
+
+        if not os.path.exists(obj_path):
+            os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+            tmp_path = f"{obj_path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wb", compresslevel=6) as f:
+                f.write(body)
+            os.replace(tmp_path, obj_path)
+        self._index(url, body_hash, obj_path, status, headers, encoding, vary)
+
+    def writer(self, url, status, headers, encoding=None, vary=None):
+        """Scrittura in streaming di una risposta (corpo letto a blocchi, confermato con commit())."""
+        return BodyWriter(self, url, status, headers, encoding, vary)
+
+    def _index(self, url, body_hash, obj_path, status, headers, encoding, vary=None):
+        headers = CaseInsensitiveDict(headers or {})
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    cache_key(url, vary), url, body_hash, os.path.getsize(obj_path), status,
+                    headers.get("Content-Type"), encoding, headers.get("ETag"),
+                    headers.get("Last-Modified"), now, now
+                )
+            )
+            self._db.commit()
+        self._evict()
+
+    def _evict(self):
+        """Elimina le voci usate meno di recente finché la cache supera il limite."""
+        with self._lock:
+            total = self._db.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT body_hash, size FROM entries)"
+            ).fetchone()[0]
+            if total <= self.max_bytes:
+                return
+
+            rows = self._db.execute("SELECT key, body_hash, size FROM entries ORDER BY last_access ASC").fetchall()
+            for key, body_hash, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                # Il corpo viene rimosso solo se nessun'altra voce lo referenzia
+                still_used = self._db.execute(
+                    "SELECT 1 FROM entries WHERE body_hash = ? LIMIT 1", (body_hash,)
+                ).fetchone()
+                if not still_used:
+                    try:
+                        os.remove(self._object_path(body_hash))
+                    except OSError:
+                        pass
+                    total -= size
+            self._db.commit()
+
+
+class BodyWriter:
+    """
+    Corpo di una risposta scritto in cache man mano che viene letto:
+    compresso su un file temporaneo, con hash calcolato a blocchi; con
+    commit() diventa l'oggetto indirizzato per contenuto, con discard()
+    (risposta letta solo in parte) viene scartato.
+    """
+
+    def __init__(self, cache, url, status, headers, encoding, vary=None):
+        self.cache = cache
+        self.url = url
+        self.vary = vary
+        self.status = status
+        self.headers = headers
+        self.encoding = encoding
+        self._hash = hashlib.sha256()
+        self._tmp_path = os.path.join(cache.objects_dir, f"tmp-{os.getpid()}-{next(_tmp_ids)}.gz")
+        self._file = gzip.open(self._tmp_path, "wb", compresslevel=6)
+
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self._file.write(chunk)
+
+    def commit(self):
+        self._file.close()
+        body_hash = self._hash.hexdigest()
+        obj_path = self.cache._object_path(body_hash)
+        if os.path.exists(obj_path):
+            os.remove(self._tmp_path)
+        else:
+            os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+            os.replace(self._tmp_path, obj_path)
+        self.cache._index(self.url, body_hash, obj_path, self.status, self.headers, self.encoding, self.vary)
+
+    def discard(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except OSError:
+            pass
+
+
+class _TeeRaw:
+    """
+    Sostituto di response.raw per le richieste in streaming: restituisce il
+    corpo decompresso a blocchi e lo scrive in cache (solo se letto per intero).
+    """
+
+    def __init__(self, raw, writer):
+        self._raw = raw
+        self._writer = writer
+        self._done = False
+
+    def read(self, amt=None, **kwargs):
+        data = self._raw.read(amt, decode_content=True)
+        if self._done:
+            return data
+        if data:
+            self._writer.write(data)
+        else:
+            self._done = True
+            self._writer.commit()
+        return data
+
+    def close(self):
+        if not self._done:
+            self._done = True
+            self._writer.discard()
+        self._raw.close()
+
+    def release_conn(self):
+        self._raw.release_conn()
+
+
+class CachingAdapter(HTTPAdapter):
+    """
+    Transport adapter per requests.Session che passa dalla HttpCache.
+    Usato per le chiamate sincrone (esearch PubMed, API ArXiv).
+    """
+
+    def __init__(self, cache, **kwargs):
+        super().__init__(**kwargs)
+        self.cache = cache
+
+    def _cached_response(self, request, entry, body):
+        resp = requests.Response()
+        resp.status_code = entry["status"]
+        if isinstance(body, bytes):
+            resp._content = body
+        else:
+            # Richiesta in streaming: il corpo resta su disco e viene letto a blocchi
+            resp.raw = body
+        resp.headers = CaseInsensitiveDict({"Content-Type": entry["content_type"] or ""})
+        if entry["etag"]:
+            resp.headers["ETag"] = entry["etag"]
+        resp.encoding = entry["encoding"]
+        resp.url = request.url
+        resp.request = request
+        resp.reason = "OK (cache)"
+        return resp
+
+    def send(self, request, **kwargs):
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        stream = kwargs.get("stream", False)
+        vary = request.headers.pop(CACHE_VARY_HEADER, None)
+        entry = self.cache.lookup(request.url, vary)
+        body = None
+        if entry:
+            body = self.cache.open_body(entry) if stream else self.cache.load_body(entry)
+
+        if self.cache.offline:
+            if body is None:
+                raise OfflineCacheMiss(f"Modalità offline: {request.url} non presente in cache")
+            return self._cached_response(request, entry, body)
+
+        if body is not None:
+            request.headers.update(self.cache.conditional_headers(entry))
+
+        resp = super().send(request, **kwargs)
+        if resp.status_code == 304 and body is not None:
+            return self._cached_response(request, entry, body)
+        if stream and body is not None:
+            body.close()
+        if resp.status_code == 200:
+            if stream:
+                resp.raw = _TeeRaw(resp.raw, self.cache.writer(request.url, 200, resp.headers, resp.encoding, vary))
+            else:
+                self.cache.store(request.url, 200, resp.content, resp.headers, resp.encoding, vary)
+        return resp
+
+
+_cache = None
+
+
+def get_cache():
+    """Istanza condivisa della cache (None se disabilitata da configurazione)."""
+    global _cache
+    if not Config.HTTP_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        _cache = HttpCache(
+            Config.HTTP_CACHE_DIR,
+            Config.HTTP_CACHE_MAX_MB * 1024 * 1024,
+            offline=Config.HTTP_OFFLINE
+        )
+    return _cache
+
+
+def mount_cache(session):
+    """Installa la cache su una requests.Session (se abilitata) e la restituisce."""
+    cache = get_cache()
+    if cache is not None:
+        adapter = CachingAdapter(cache)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
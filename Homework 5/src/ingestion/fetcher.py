@@ -0,0 +1,306 @@
+import os
+import atexit
+import asyncio
+import json
+import random
+import time
+import threading
+from urllib.parse import urlsplit
+import aiohttp
+import requests
+from src.config import Config
+from src.ingestion.cache import get_cache, build_url, mount_cache, OfflineCacheMiss, CACHE_VARY_HEADER
+
+# Status HTTP per cui ha senso ritentare (rate limit o errori temporanei del server)
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# Token bucket per (host, rate) condivisi da tutti i fetcher del processo:
+# il rate limit vale tra pagine e chiamate diverse, non solo all'interno di una
+_buckets = {}
+
+
+class TokenBucket:
+    """
+    Rate limiter a token bucket (asincrono).
+    rate: richieste al secondo sostenute, burst: richieste consecutive consentite.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Il lock serializza i richiedenti: ognuno attende il proprio token
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class FetchResult:
+    """
+    Risposta di una richiesta HTTP, con un'interfaccia minima compatibile
+    con requests.Response (status_code, content, text, json, raise_for_status).
+    """
+
+    def __init__(self, url, status_code=None, content=b"", encoding=None, headers=None, error=None):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.encoding = encoding or "utf-8"
+        self.headers = headers or {}
+        self.error = error
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.error is not None:
+            raise self.error
+        if self.status_code is None or self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code} per {self.url}")
+
+
+class AsyncFetcher:
+    """
+    Motore di download asincrono:
+      - sessione HTTP condivisa (connection pooling / keep-alive), mantenuta
+        aperta tra una chiamata e l'altra (chiusa con close())
+      - rate limit token bucket per host (es. 3 o 10 req/s per NCBI)
+      - concorrenza limitata da semaforo
+      - retry con backoff esponenziale (rispetta Retry-After)
+      - cache HTTP su disco con richieste condizionali e modalità offline
+    """
+
+    def __init__(self, rate_limits=None, concurrency=None, retries=None, backoff=None, timeout=15, default_rate=None, use_cache=True, cache=None):
+        self.rate_limits = rate_limits or {}
+        self.default_rate = default_rate or Config.FETCH_DEFAULT_RATE
+        self.concurrency = concurrency or Config.FETCH_CONCURRENCY
+        self.retries = Config.FETCH_RETRIES if retries is None else retries
+        self.backoff = Config.FETCH_BACKOFF if backoff is None else backoff
+        self.timeout = timeout
+        self.cache = cache or (get_cache() if use_cache else None)
+        self._session = None
+        self._semaphore = None
+
+    def _bucket(self, url):
+        return _get_bucket(url, self.rate_limits, self.default_rate)
+
+    def _open(self):
+        # Sessione e semaforo vanno creati nell'event loop che li userà
+        if self._session is None or self._session.closed:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session, self._semaphore
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _cache_lookup(self, full_url):
+        entry = self.cache.lookup(full_url)
+        return entry, (self.cache.load_body(entry) if entry else None)
+
+    async def _fetch(self, session, semaphore, url, params=None, headers=None):
+        # Cache: in offline si risponde solo da disco, altrimenti richiesta condizionale.
+        # SQLite e gzip sono IO bloccante: girano in un thread, non nell'event loop
+        entry = body = None
+        full_url = build_url(url, params)
+        if self.cache is not None:
+            entry, body = await asyncio.to_thread(self._cache_lookup, full_url)
+
+            if self.cache.offline:
+                if body is None:
+                    return FetchResult(url, error=OfflineCacheMiss(f"Modalità offline: {full_url} non presente in cache"))
+                return self._cached_result(url, entry, body)
+
+            if body is not None:
+                headers = {**(headers or {}), **self.cache.conditional_headers(entry)}
+
+        last_error = None
+
+        for attempt in range(self.retries + 1):
+            await self._bucket(url).acquire()
+            retry_after = None
+
+            try:
+                async with semaphore:
+                    async with session.get(url, params=params, headers=headers) as resp:
+                        content = await resp.read()
+                        result = FetchResult(
+                            url, resp.status, content,
+                            encoding=resp.get_encoding() if content else None,
+                            headers=dict(resp.headers)
+                        )
+                if result.status_code == 304 and body is not None:
+                    return self._cached_result(url, entry, body)
+                if result.status_code == 200 and self.cache is not None:
+                    await asyncio.to_thread(self.cache.store, full_url, 200, result.content, result.headers, result.encoding)
+                if result.status_code not in RETRY_STATUS:
+                    return result
+                retry_after = result.headers.get("Retry-After")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                result = None
+                last_error = e
+
+            if attempt < self.retries:
+                delay = self.backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                await asyncio.sleep(delay)
+
+        if result is not None:
+            return result
+        return FetchResult(url, error=last_error)
+
+    @staticmethod
+    def _cached_result(url, entry, body):
+        return FetchResult(
+            url, entry["status"], body,
+            encoding=entry["encoding"],
+            headers={"Content-Type": entry["content_type"] or "", **({"ETag": entry["etag"]} if entry["etag"] else {})}
+        )
+
+    async def fetch_all(self, requests_list):
+        """
+        Scarica in concorrenza una lista di richieste.
+        Ogni richiesta è un URL o una tupla (url, params, headers).
+        Restituisce: lista di FetchResult nello stesso ordine dell'input.
+        """
+        session, semaphore = self._open()
+        tasks = []
+        for req in requests_list:
+            if isinstance(req, str):
+                req = (req, None, None)
+            url, params, headers = (tuple(req) + (None, None))[:3]
+            tasks.append(self._fetch(session, semaphore, url, params, headers))
+        return await asyncio.gather(*tasks)
+
+
+def _get_bucket(url, rate_limits, default_rate):
+    host = urlsplit(url).hostname or ""
+    key = (host, rate_limits.get(host, default_rate))
+    if key not in _buckets:
+        _buckets[key] = TokenBucket(key[1])
+    return _buckets[key]
+
+
+# Event loop di ingestion in un thread dedicato, con i fetcher (sessioni e
+# connessioni) riusati da tutte le chiamate sincrone di fetch_many
+_loop = None
+_loop_pid = None
+_fetchers = {}
+_loop_lock = threading.Lock()
+
+
+def _get_loop():
+    global _loop, _loop_pid
+    with _loop_lock:
+        # Dopo un fork il thread del loop non esiste nel processo figlio
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            _fetchers.clear()
+            _buckets.clear()
+            threading.Thread(target=_loop.run_forever, name="fetch-loop", daemon=True).start()
+        return _loop
+
+
+def fetch_many(requests_list, **kwargs):
+    """
+    Wrapper sincrono di AsyncFetcher.fetch_all (per il codice di ingestion).
+    Le chiamate con gli stessi parametri riusano lo stesso fetcher: sessione,
+    connessioni keep-alive e rate limit restano validi da una pagina all'altra.
+    """
+    if not requests_list:
+        return []
+    loop = _get_loop()
+    key = repr(sorted(kwargs.items()))
+    with _loop_lock:
+        fetcher = _fetchers.get(key)
+        if fetcher is None:
+            fetcher = _fetchers[key] = AsyncFetcher(**kwargs)
+    return asyncio.run_coroutine_threadsafe(fetcher.fetch_all(requests_list), loop).result()
+
+
+@atexit.register
+def close_fetchers():
+    """Chiude le sessioni HTTP dei fetcher condivisi (all'uscita del processo)."""
+    if _loop is None or _loop_pid != os.getpid() or not _loop.is_running():
+        return
+    fetchers = list(_fetchers.values())
+    _fetchers.clear()
+
+    async def _close():
+        for fetcher in fetchers:
+            await fetcher.close()
+
+    asyncio.run_coroutine_threadsafe(_close(), _loop).result(timeout=5)
+
+
+_stream_session = None
+_stream_pid = None
+
+
+def stream_get(url, params=None, headers=None, rate_limits=None, retries=None, backoff=None, timeout=60, cache_vary=None):
+    """
+    GET in streaming (requests, stream=True) per risposte grandi da elaborare
+    man mano, come l'XML di efetch: il corpo non viene caricato in memoria,
+    si legge a blocchi da response.raw (già decompresso).
+    Usa gli stessi token bucket per host di fetch_many e la cache HTTP
+    (scritta mentre il corpo viene letto, servita da disco a blocchi).
+    cache_vary: identifica il result set al posto di WebEnv/query_key nella
+    chiave di cache (vedi cache_key), per risposte riusabili tra run diversi.
+    Restituisce la requests.Response, da chiudere dopo la lettura.
+    """
+    global _stream_session, _stream_pid
+    if _stream_session is None or _stream_pid != os.getpid():
+        _stream_session = mount_cache(requests.Session())
+        _stream_pid = os.getpid()
+
+    retries = Config.FETCH_RETRIES if retries is None else retries
+    backoff = Config.FETCH_BACKOFF if backoff is None else backoff
+    cache = get_cache()
+    loop = _get_loop()
+    bucket = _get_bucket(url, rate_limits or {}, Config.FETCH_DEFAULT_RATE)
+    last_error = None
+    if cache is not None and cache_vary:
+        headers = {**(headers or {}), CACHE_VARY_HEADER: cache_vary}
+
+    for attempt in range(retries + 1):
+        # In offline si risponde dalla cache: nessuna attesa per il rate limit
+        if cache is None or not cache.offline:
+            asyncio.run_coroutine_threadsafe(bucket.acquire(), loop).result()
+        try:
+            resp = _stream_session.get(url, params=params, headers=headers, stream=True, timeout=timeout)
+        except OfflineCacheMiss:
+            raise
+        except requests.exceptions.RequestException as e:
+            last_error = e
+        else:
+            if resp.status_code not in RETRY_STATUS or attempt == retries:
+                if hasattr(resp.raw, "decode_content"):
+                    resp.raw.decode_content = True
+                return resp
+            resp.close()
+
+        if attempt < retries:
+            time.sleep(backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+
+    raise last_error
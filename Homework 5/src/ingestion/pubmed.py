@@ -1,10 +1,13 @@
 import requests
-import time
 import os
+from urllib.parse import urlencode
 import xml.etree.ElementTree as ET
 from datetime import datetime
 import pandas as pd
 from src.config import Config
+from src.ingestion.fetcher import fetch_many, stream_get
+from src.ingestion.cache import mount_cache
+from src.core.manifest import text_hash, validator_headers
 
 # --- Helper Functions per parsing sicuro XML ---
 def _safe_get_text(element, xpath):
@@ -40,47 +43,251 @@ def _safe_get_int(element, xpath, default_val):
         return int(text_val.strip())
     except ValueError:
         return default_val
+
+def _article_pmc_id(article):
+    """
+    Estrae l'ID PMC (es. 'PMC123456') da un nodo <article> di efetch.
+    A seconda della versione dell'XML il tipo è 'pmc', 'pmcid' o 'pmcaid'.
+    """
+    for node in article.iter("article-id"):
+        if node.get("pub-id-type") in ("pmc", "pmcid", "pmcaid") and node.text:
+            value = node.text.strip()
+            return value if value.startswith("PMC") else f"PMC{value}"
+    return None
+
+
+def _parse_article(article):
+    """Estrae titolo, autori, abstract, data e full text da un nodo <article>."""
+
+    # 1. Titolo (Sicuro)
+    title = _safe_get_text(article, ".//article-title")
+    if not title:
+        title = "Title Unknown"
+    
+    # 2. Autori (Sicuro)
+    authors = []
+    for contrib in article.findall(".//contrib"):
+        if contrib.get("contrib-type") == "author":
+            name_node = contrib.find("name")
+            if name_node is not None:
+                s = _safe_get_text(name_node, "surname")
+                g = _safe_get_text(name_node, "given-names")
+                full = f"{g} {s}".strip()
+                if full: authors.append(full)
+
+    # 3. Abstract (Sicuro)
+    abstract = ""
+    abs_node = article.find(".//abstract")
+    if abs_node is not None:
+        # Rimuove titoli interni per pulizia (es. "Background", "Methods")
+        for t in abs_node.findall("title"): 
+            t.text = "" 
+        abstract = "".join(abs_node.itertext()) # itertext su abs_node (non None)
+        abstract = " ".join(abstract.split())
+
+    # 4. Data (Sicuro - con logica priorità epub > pub)
+    dt = datetime(1970, 1, 1) # Default
+    
+    date_node = None
+    # Cerca data epub
+    for node in article.findall(".//pub-date"):
+        if node.get("pub-type") == "epub": 
+            date_node = node
+            break
+    
+    # Se non trova epub, cerca ppub o pub generico
+    if date_node is None:
+        for node in article.findall(".//pub-date"):
+            if node.get("date-type") == "pub" or node.get("pub-type") == "ppub": 
+                date_node = node
+                break
+    
+    if date_node is not None:
+        # Usa la helper function che gestisce None e errori di conversione
+        y = _safe_get_int(date_node, "year", 1970)
+        m = _safe_get_int(date_node, "month", 1)
+        d = _safe_get_int(date_node, "day", 1)
+        try:
+            dt = datetime(y, m, d)
+        except ValueError:
+            dt = datetime(1970, 1, 1) # Fallback se data invalida (es. 30 Febbraio)
+
+    # 5. Full Text da XML Body (Sicuro)
+    full_text = _safe_get_text(article, ".//body")
+    full_text = " ".join(full_text.split())
+
+    return {
+        "title": title,
+        "authors": authors,
+        "date": dt,
+        "abstract": abstract,
+        "full_text": full_text
+    }
+
+
+def _iter_articles(source):
+    """
+    Parsing in streaming di un <pmc-articleset> con ET.iterparse.
+    source: file-like letto a blocchi (es. response.raw di una richiesta in
+    streaming), quindi la risposta non viene mai caricata per intero.
+    Ogni figlio della radice (<article>) viene elaborato e poi rimosso
+    dall'albero, così la memoria resta costante anche con lotti di molti articoli.
+    Restituisce (generatore): coppie (pmc_id, metadati)
+    """
+    level = 0
+    root = None
+
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            level += 1
+            continue
+
+        level -= 1
+        # Solo i figli diretti della radice (non eventuali articoli annidati)
+        if level != 1:
+            continue
+
+        if elem.tag == "article":
+            pmc_id_str = _article_pmc_id(elem)
+            if pmc_id_str:
+                yield pmc_id_str, _parse_article(elem)
+
+        # Libera il nodo elaborato e lo stacca dalla radice
+        elem.clear()
+        root.remove(elem)
 # -----------------------------------------------
 
-def download_pubmed_data():
-    """Scarica metadati (XML) e HTML da PubMed Central."""
+BASE_URL = "https://pmc.ncbi.nlm.nih.gov/articles/"
+SEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
+FETCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
+
+
+def download_pubmed_data(known=None):
+    """
+    Scarica metadati (XML) e HTML da PubMed Central.
+    known: hash/ETag dei paper già indicizzati (Manifest.validators()): vengono
+    saltati solo se l'HTML non è cambiato.
+    """
+    data_buffer = []
+    for _, docs in iter_pubmed_pages(known):
+        data_buffer.extend(docs)
+    return pd.DataFrame(data_buffer)
+
+
+def _eutils_params(**params):
+    """Parametri comuni E-utilities (api_key se configurata)."""
+    if Config.NCBI_API_KEY:
+        params["api_key"] = Config.NCBI_API_KEY
+    return params
+
+
+def iter_pubmed_pages(known=None, start=0):
+    """
+    Harvest paginato da PubMed Central tramite History Server (memoria costante).
+    Una sola esearch con usehistory=y salva il result set su NCBI (WebEnv +
+    query_key); le pagine vengono poi lette con efetch usando retstart/retmax.
+    start: retstart da cui riprendere (cursore salvato da un harvest interrotto).
+    Restituisce (generatore): coppie (retstart_successivo, documenti_della_pagina)
+    """
     print(f"\n[PubMed] Ricerca: '{Config.QUERY_PUBMED}'")
     
-    base_url = "https://pmc.ncbi.nlm.nih.gov/articles/"
-    search_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
-    fetch_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/efetch.fcgi"
-    
     if not os.path.exists(Config.OUTPUT_DIR_PUBMED):
         os.makedirs(Config.OUTPUT_DIR_PUBMED)
 
-    # 1. Cerca ID
+    # 1. Ricerca con History Server (solo conteggio + WebEnv, nessun ID)
     try:
-        resp = requests.get(search_url, params={
-            "db": "pmc", 
-            "term": Config.QUERY_PUBMED, 
-            "retmode": "json", 
-            "retmax": Config.MAX_DOCS, 
-            "sort": "relevance"
-        })
+        session = mount_cache(requests.Session())
+        resp = session.get(SEARCH_URL, params=_eutils_params(
+            db="pmc",
+            term=Config.QUERY_PUBMED,
+            retmode="json",
+            retmax=0,
+            usehistory="y",
+            sort="relevance"
+        ))
         resp.raise_for_status()
-        data = resp.json()
-        pmc_ids = data.get("esearchresult", {}).get("idlist", [])
+        data = resp.json().get("esearchresult", {})
+        count = int(data.get("count", 0))
+        # WebEnv/query_key cambiano a ogni esearch: nella chiave di cache delle
+        # pagine efetch il result set è identificato da query, ordinamento e conteggio
+        history = {
+            "WebEnv": data["webenv"], "query_key": data["querykey"],
+            "vary": urlencode({"term": Config.QUERY_PUBMED, "sort": "relevance", "count": count})
+        }
     except Exception as e:
         print(f"Errore ricerca PubMed: {e}")
-        return pd.DataFrame()
+        return
+
+    total = min(count, Config.MAX_DOCS)
+    print(f"[PubMed] {count} risultati, ne verranno elaborati {total}")
+    if start:
+        print(f"[PubMed] Ripresa da retstart={start}")
+
+    known = known or {}
+    page_size = max(1, Config.INGEST_PAGE_SIZE)
+
+    retstart = start
+    while retstart < total:
+        retmax = min(page_size, total - retstart)
+        docs = _process_page(history, retstart, retmax, known)
+        retstart += retmax
+        yield retstart, docs
+
+
+def _process_page(history, retstart, retmax, known):
+    """
+    Elabora una pagina del result set: metadati XML (efetch a lotti via
+    WebEnv) e download concorrente degli HTML. I paper già indicizzati vengono
+    richiesti con l'ETag salvato e saltati se l'HTML non è cambiato.
+    """
+    headers = {'User-Agent': Config.USERAGENT_PUBMED}
+    rate_limits = {
+        "pmc.ncbi.nlm.nih.gov": Config.RATE_LIMIT_NCBI,
+        "eutils.ncbi.nlm.nih.gov": Config.RATE_LIMIT_NCBI
+    }
+
+    # A. Metadati: efetch restituisce un unico <pmc-articleset> per lotto,
+    #    letto in streaming dalla connessione (un <article> alla volta)
+    batch_size = max(1, Config.PUBMED_BATCH_SIZE)
+    articles = []
+    for offset in range(retstart, retstart + retmax, batch_size):
+        size = min(batch_size, retstart + retmax - offset)
+        params = _eutils_params(
+            db="pmc", retmode="xml", retstart=offset, retmax=size,
+            WebEnv=history["WebEnv"], query_key=history["query_key"]
+        )
+        try:
+            with stream_get(FETCH_URL, params, headers, rate_limits=rate_limits, cache_vary=history["vary"]) as meta_resp:
+                meta_resp.raise_for_status()
+                for pmc_id_str, meta in _iter_articles(meta_resp.raw):
+                    articles.append((pmc_id_str, meta))
+        except Exception as e:
+            print(f"   Errore efetch per retstart={offset} (retmax={size}): {e}")
+
+    # B. Download concorrente degli HTML (per figure/tabelle)
+    html_resps = fetch_many(
+        [
+            (f"{BASE_URL}{pmc_id_str}/", None, {**headers, **validator_headers(known.get(pmc_id_str))})
+            for pmc_id_str, _ in articles
+        ],
+        rate_limits=rate_limits
+    )
 
     data_buffer = []
+    for (pmc_id_str, meta), r in zip(articles, html_resps):
+        previous = known.get(pmc_id_str)
+        if previous and (r.status_code == 304 or (r.status_code == 200 and text_hash(r.text) == previous["hash"])):
+            print(f"PubMed Invariato (skip): {pmc_id_str}")
+            continue
 
-    # 2. Fetch Dettagli
-    for i, pmcid in enumerate(pmc_ids, 1):
-        pmc_id_str = f"PMC{pmcid}"
-        print(f"[{i}/{len(pmc_ids)}] PubMed Processing: {pmc_id_str}")
+        print(f"[PubMed] Processing: {pmc_id_str}")
         
-        # A. Download HTML (per figure/tabelle)
-        html_url = f"{base_url}{pmc_id_str}/"
+        # Salvataggio HTML
+        html_url = f"{BASE_URL}{pmc_id_str}/"
         saved_local = False
         try:
-            r = requests.get(html_url, headers={'User-Agent': Config.USERAGENT_PUBMED})
             if r.status_code == 200 and len(r.content) > 4000:
                 fname = f"{pmc_id_str}.html"
                 with open(os.path.join(Config.OUTPUT_DIR_PUBMED, fname), "w", encoding="utf-8") as f:
@@ -89,89 +296,21 @@ def download_pubmed_data():
         except Exception:
             pass # Ignoriamo errori HTML per non bloccare il flusso
 
-        # B. Download Metadata via XML
-        try:
-            meta_resp = requests.get(fetch_url, params={"db": "pmc", "id": pmcid, "retmode": "xml"})
-            meta_resp.raise_for_status()
-            
-            # Parsing dell'XML
-            root = ET.fromstring(meta_resp.content)
-            
-            # 1. Titolo (Sicuro)
-            title = _safe_get_text(root, ".//article-title")
-            if not title:
-                title = "Title Unknown"
-            
-            # 2. Autori (Sicuro)
-            authors = []
-            for contrib in root.findall(".//contrib"):
-                if contrib.get("contrib-type") == "author":
-                    name_node = contrib.find("name")
-                    if name_node is not None:
-                        s = _safe_get_text(name_node, "surname")
-                        g = _safe_get_text(name_node, "given-names")
-                        full = f"{g} {s}".strip()
-                        if full: authors.append(full)
-
-            # 3. Abstract (Sicuro)
-            abstract = ""
-            abs_node = root.find(".//abstract")
-            if abs_node is not None:
-                # Rimuove titoli interni per pulizia (es. "Background", "Methods")
-                for t in abs_node.findall("title"): 
-                    t.text = "" 
-                abstract = "".join(abs_node.itertext()) # itertext su abs_node (non None)
-                abstract = " ".join(abstract.split())
-
-            # 4. Data (Sicuro - con logica priorità epub > pub)
-            dt = datetime(1970, 1, 1) # Default
-            
-            date_node = None
-            # Cerca data epub
-            for node in root.findall(".//pub-date"):
-                if node.get("pub-type") == "epub": 
-                    date_node = node
-                    break
-            
-            # Se non trova epub, cerca ppub o pub generico
-            if date_node is None:
-                for node in root.findall(".//pub-date"):
-                    if node.get("date-type") == "pub" or node.get("pub-type") == "ppub": 
-                        date_node = node
-                        break
-            
-            if date_node is not None:
-                # Usa la helper function che gestisce None e errori di conversione
-                y = _safe_get_int(date_node, "year", 1970)
-                m = _safe_get_int(date_node, "month", 1)
-                d = _safe_get_int(date_node, "day", 1)
-                try:
-                    dt = datetime(y, m, d)
-                except ValueError:
-                    dt = datetime(1970, 1, 1) # Fallback se data invalida (es. 30 Febbraio)
-
-            # 5. Full Text da XML Body (Sicuro)
-            full_text = _safe_get_text(root, ".//body")
-            full_text = " ".join(full_text.split())
-
-            # Aggiunta al buffer
-            data_buffer.append({
-                "source": "pubmed",
-                "document_id": pmc_id_str,
-                "title": title,
-                "authors": authors,
-                "date": dt,
-                "abstract": abstract,
-                "full_text": full_text,
-                "pdf_url": html_url,
-                "local_file_saved": saved_local,
-                "local_filename": f"{pmc_id_str}.html" if saved_local else None
-            })
-
-        except Exception as e:
-            # Stampa l'errore ma continua con il prossimo paper
-            print(f"   Errore parsing XML per {pmc_id_str}: {e}")
+        if previous and not saved_local:
+            # Download fallito: resta indicizzata la versione precedente
+            print(f"   {pmc_id_str} già indicizzato: mantenuta la versione precedente")
+            continue
 
-        time.sleep(1.0) # Rate limit cortesia
+        # Aggiunta al buffer
+        data_buffer.append({
+            "source": "pubmed",
+            "document_id": pmc_id_str,
+            **meta,
+            "pdf_url": html_url,
+            "local_file_saved": saved_local,
+            "local_filename": f"{pmc_id_str}.html" if saved_local else None,
+            # Validatore dell'HTML salvato (registrato nel manifest, non indicizzato)
+            "etag": r.headers.get("ETag")
+        })
 
-    return pd.DataFrame(data_buffer)
\ No newline at end of file
+    return data_buffer
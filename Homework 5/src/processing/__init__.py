@@ -1,2 +1,3 @@
-from .extractor import extract_multimedia
-from .analyzer import ContextAnalyzer
\ No newline at end of file
+from .extractor import extract_multimedia, process_document
+from .analyzer import ContextAnalyzer, CorpusModel, get_corpus_model
+from .parallel import list_html_files, extract_corpus, fit_corpus_model, update_corpus_model
\ No newline at end of file
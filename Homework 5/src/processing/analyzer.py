@@ -1,6 +1,9 @@
-from sklearn.feature_extraction.text import TfidfVectorizer, ENGLISH_STOP_WORDS
+import os
+from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, ENGLISH_STOP_WORDS
+from sklearn.preprocessing import normalize
 from sklearn.metrics.pairwise import cosine_similarity
 import numpy as np
+from scipy.sparse import csr_matrix
 from src.config import Config
 from src.core.utils import clean_text
 
@@ -10,14 +13,119 @@ CUSTOM_STOPWORDS = list(ENGLISH_STOP_WORDS.union([
     "left", "right", "top", "bottom", "red", "blue", "data", "results", "using"
 ]))
 
+def _hasher(n_features):
+    """Tokenizzazione stateless (stesse regole e stopwords del TfidfVectorizer)."""
+    return HashingVectorizer(
+        n_features=n_features,
+        stop_words=CUSTOM_STOPWORDS,
+        alternate_sign=False,
+        norm=None
+    )
+
+
+def paragraph_doc_freq(paragraphs, n_features=None):
+    """
+    Document frequency dei termini (hashati) in una lista di paragrafi.
+    Restituisce: (indici_feature, conteggi, numero_paragrafi), compatto da
+    trasferire tra processi e da sommare nel modello di corpus.
+    """
+    n_features = n_features or Config.TFIDF_HASH_FEATURES
+    if not paragraphs:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), 0
+    matrix = _hasher(n_features).transform(paragraphs)
+    cols, counts = np.unique(matrix.indices, return_counts=True)
+    return cols, counts, len(paragraphs)
+
+
+class CorpusModel:
+    """
+    Statistiche IDF condivise a livello di corpus.
+    Usa un HashingVectorizer (nessun vocabolario da costruire) e accumula
+    le document frequency paper per paper: il modello si aggiorna in modo
+    incrementale, si salva su disco e ogni paper richiede solo una transform.
+    """
+
+    def __init__(self, n_features=None, doc_freq=None, n_docs=0):
+        self.n_features = n_features or Config.TFIDF_HASH_FEATURES
+        self.hasher = _hasher(self.n_features)
+        self.doc_freq = doc_freq if doc_freq is not None else np.zeros(self.n_features, dtype=np.int64)
+        self.n_docs = n_docs
+        self._idf = None
+
+    def add_counts(self, cols, counts, n_docs):
+        """Somma le document frequency calcolate da paragraph_doc_freq."""
+        self.doc_freq[cols] += counts
+        self.n_docs += n_docs
+        self._idf = None
+
+    @property
+    def idf(self):
+        # Stessa formula di TfidfVectorizer (smooth_idf=True)
+        if self._idf is None:
+            self._idf = np.log((1 + self.n_docs) / (1 + self.doc_freq)) + 1
+        return self._idf
+
+    def transform(self, texts):
+        """Vettori TF-IDF normalizzati L2 (interfaccia compatibile con TfidfVectorizer)."""
+        matrix = self.hasher.transform(texts).tocsr()
+        # Pesatura IDF solo sui termini presenti (evita una matrice diagonale 2^20 x 2^20)
+        matrix.data = matrix.data * self.idf[matrix.indices]
+        return normalize(matrix)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp.npz"
+        np.savez_compressed(tmp_path, doc_freq=self.doc_freq, n_docs=self.n_docs, n_features=self.n_features)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(int(data["n_features"]), data["doc_freq"].copy(), int(data["n_docs"]))
+
+
+_corpus_model = None
+
+
+def get_corpus_model(reload=False):
+    """
+    Modello di corpus condiviso dal processo (caricato una sola volta).
+    Restituisce None se non è ancora stato calcolato.
+    """
+    global _corpus_model
+    if (_corpus_model is None or reload) and os.path.exists(Config.TFIDF_MODEL_PATH):
+        _corpus_model = CorpusModel.load(Config.TFIDF_MODEL_PATH)
+    return _corpus_model
+
+
+def set_corpus_model(model):
+    """Imposta il modello di corpus del processo (es. subito dopo il fit)."""
+    global _corpus_model
+    _corpus_model = model
+
+
 class ContextAnalyzer:
-    """Gestisce l'analisi TF-IDF per un singolo paper."""
+    """
+    Gestisce l'analisi TF-IDF per un singolo paper.
+    Senza modello: vocabolario e IDF calcolati sui soli paragrafi del paper.
+    Con un CorpusModel: IDF di corpus, per il paper basta una transform
+    (e anche i paper con pochi paragrafi ottengono un contesto).
+    """
     
-    def __init__(self, paragraphs):
+    def __init__(self, paragraphs, model=None):
         self.paragraphs = [clean_text(p) for p in paragraphs]
         self.vectorizer = None
         self.tfidf_matrix = None
-        self._fit()
+        if model is not None:
+            self._transform(model)
+        else:
+            self._fit()
+
+    def _transform(self, model):
+        if not self.paragraphs:
+            return
+        self.vectorizer = model
+        self.tfidf_matrix = model.transform(self.paragraphs)
 
     def _fit(self):
         if len(self.paragraphs) < 3:
@@ -30,21 +138,102 @@ class ContextAnalyzer:
 
     def find_context(self, query_text, exclude_indices=None):
         """Trova paragrafi semanticamente simili alla query (caption)."""
-        if self.vectorizer is None or self.tfidf_matrix is None or not query_text.strip():
-            return []
+        return self.find_context_batch([query_text], [exclude_indices])[0]
 
-        exclude_indices = exclude_indices or set()
-        context = []
-        
+    def find_context_batch(self, query_texts, exclude_indices_list=None):
+        """
+        Versione batch di find_context per tutte le caption di un paper.
+        Un'unica transform delle query e un unico prodotto sparso
+        query x paragrafi; soglia ed esclusioni applicate con maschere sparse.
+        Restituisce: lista di liste di paragrafi (una per query, stesso ordine)
+        """
+        return self.match_queries(self.transform_queries(query_texts), query_texts, exclude_indices_list)
+
+    def transform_queries(self, query_texts):
+        """Vettori TF-IDF delle query (None se il paper non ha un modello)."""
+        if self.vectorizer is None or self.tfidf_matrix is None or not query_texts:
+            return None
         try:
-            query_vec = self.vectorizer.transform([query_text])
-            similarities = cosine_similarity(query_vec, self.tfidf_matrix).flatten()
-            relevant_idx = np.where(similarities > Config.TFIDF_THRESHOLD)[0]
-
-            for idx in relevant_idx:
-                if idx not in exclude_indices:
-                    context.append(self.paragraphs[idx])
-        except:
-            pass
-            
-        return context
\ No newline at end of file
+            return self.vectorizer.transform(query_texts)
+        except ValueError:
+            return None
+
+    def match_queries(self, query_vecs, query_texts, exclude_indices_list=None, as_indices=False):
+        """Paragrafi di contesto a partire da vettori di query già calcolati."""
+        return match_context(
+            query_vecs, self.tfidf_matrix, self.paragraphs, query_texts,
+            exclude_indices_list, as_indices=as_indices
+        )
+
+
+def match_context(query_vecs, tfidf_matrix, paragraphs, query_texts, exclude_indices_list=None, threshold=None, as_indices=False):
+    """
+    Selezione dei paragrafi di contesto da matrici TF-IDF già calcolate
+    (usata anche dal re-link, senza rielaborare l'HTML).
+    Restituisce: lista di liste di paragrafi (una per query, stesso ordine);
+    con as_indices=True gli indici dei paragrafi al posto dei testi
+    """
+    n_queries = len(query_texts)
+    results = [[] for _ in range(n_queries)]
+    if query_vecs is None or tfidf_matrix is None or n_queries == 0:
+        return results
+
+    threshold = Config.TFIDF_THRESHOLD if threshold is None else threshold
+    exclude_indices_list = exclude_indices_list or [None] * n_queries
+
+    try:
+        hits = _threshold_hits(query_vecs, tfidf_matrix, exclude_indices_list, threshold)
+        rows = [(row, hits, row) for row in range(n_queries)]
+    except (ValueError, IndexError) as e:
+        # Es. vettori con un numero di feature diverso dalla matrice o indici
+        # di esclusione fuori range: si ripiega sul calcolo query per query,
+        # così un singolo oggetto non azzera il contesto di tutto il paper
+        print(f"[TFIDF] Calcolo batch fallito ({e}), ripiego per singolo oggetto")
+        rows = []
+        for row in range(n_queries):
+            try:
+                hits = _threshold_hits(query_vecs[row], tfidf_matrix, [exclude_indices_list[row]], threshold)
+            except (ValueError, IndexError):
+                continue
+            rows.append((row, hits, 0))
+
+    for row, hits, hit_row in rows:
+        # Query vuote: nessun contesto (come nella versione singola)
+        if not query_texts[row].strip():
+            continue
+        start, end = hits.indptr[hit_row], hits.indptr[hit_row + 1]
+        if as_indices:
+            results[row] = hits.indices[start:end].tolist()
+        else:
+            results[row] = [paragraphs[idx] for idx in hits.indices[start:end]]
+
+    return results
+
+
+def _threshold_hits(query_vecs, tfidf_matrix, exclude_indices_list, threshold):
+    """
+    Matrice sparsa query x paragrafi dei paragrafi sopra soglia, senza
+    quelli esclusi (un prodotto sparso e due maschere).
+    """
+    similarities = cosine_similarity(query_vecs, tfidf_matrix, dense_output=False)
+
+    # Maschera soglia (matrice sparsa 0/1)
+    hits = (similarities > threshold).astype(np.int8)
+
+    # Maschera esclusioni: paragrafi già presenti tra le menzioni
+    rows, cols = [], []
+    for row, excluded in enumerate(exclude_indices_list):
+        for idx in excluded or ():
+            rows.append(row)
+            cols.append(idx)
+    if rows:
+        excluded_mask = csr_matrix(
+            (np.ones(len(rows), dtype=np.int8), (rows, cols)),
+            shape=hits.shape
+        )
+        hits = hits - hits.multiply(excluded_mask)
+
+    hits = csr_matrix(hits)
+    hits.eliminate_zeros()
+    hits.sort_indices()
+    return hits
\ No newline at end of file
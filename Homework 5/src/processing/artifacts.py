@@ -0,0 +1,134 @@
+import os
+import gzip
+import json
+import numpy as np
+from scipy.sparse import csr_matrix
+from src.config import Config
+from src.processing.analyzer import ContextAnalyzer, CorpusModel, get_corpus_model, match_context
+
+
+def _artifact_paths(paper_id, folder=None):
+    folder = folder or Config.ARTIFACTS_DIR
+    return (
+        os.path.join(folder, f"{paper_id}.json.gz"),
+        os.path.join(folder, f"{paper_id}.npz")
+    )
+
+
+def _object_ref(obj):
+    """Indice e _id Elasticsearch di una figura o tabella (stesso schema della pipeline)."""
+    if "figure_id" in obj:
+        return Config.INDEX_FIGURES, f"{obj['paper_id']}_{obj['figure_id']}"
+    return Config.INDEX_TABLES, f"{obj['paper_id']}_{obj['table_id']}"
+
+
+def _sparse_arrays(prefix, matrix):
+    if matrix is None:
+        return {}
+    matrix = csr_matrix(matrix)
+    return {
+        f"{prefix}_data": matrix.data,
+        f"{prefix}_indices": matrix.indices,
+        f"{prefix}_indptr": matrix.indptr,
+        f"{prefix}_shape": np.array(matrix.shape)
+    }
+
+
+def _sparse_from(arrays, prefix):
+    if f"{prefix}_data" not in arrays:
+        return None
+    return csr_matrix(
+        (arrays[f"{prefix}_data"], arrays[f"{prefix}_indices"], arrays[f"{prefix}_indptr"]),
+        shape=tuple(arrays[f"{prefix}_shape"])
+    )
+
+
+def save_artifacts(paper_id, source, analyzer, context_queries, query_vecs, folder=None):
+    """
+    Salva gli artefatti di estrazione di un paper:
+      - <paper_id>.json.gz: paragrafi puliti e, per ogni figura/tabella,
+        _id, testo della query e indici delle menzioni da escludere
+      - <paper_id>.npz: matrici TF-IDF sparse di paragrafi e query
+    Con questi file il contesto può essere ricalcolato senza rileggere l'HTML.
+    """
+    text_path, matrix_path = _artifact_paths(paper_id, folder)
+    os.makedirs(os.path.dirname(text_path), exist_ok=True)
+
+    objects = []
+    for obj, query, excluded in context_queries:
+        index, doc_id = _object_ref(obj)
+        objects.append({
+            "index": index,
+            "_id": doc_id,
+            "query": query,
+            "exclude": sorted(excluded or ())
+        })
+
+    record = {
+        "paper_id": paper_id,
+        "source": source,
+        "tfidf_mode": "corpus" if isinstance(analyzer.vectorizer, CorpusModel) else "paper",
+        "paragraphs": analyzer.paragraphs,
+        "objects": objects
+    }
+
+    # Scrittura atomica: un artefatto parziale non deve mai essere letto dal re-link
+    tmp_text = text_path + ".tmp"
+    with gzip.open(tmp_text, "wt", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+
+    tmp_matrix = matrix_path + ".tmp.npz"
+    np.savez_compressed(
+        tmp_matrix,
+        **_sparse_arrays("paragraphs", analyzer.tfidf_matrix),
+        **_sparse_arrays("queries", query_vecs)
+    )
+    os.replace(tmp_text, text_path)
+    os.replace(tmp_matrix, matrix_path)
+
+
+def load_artifacts(paper_id, folder=None):
+    """
+    Carica gli artefatti di un paper.
+    Restituisce: (record, matrice_paragrafi, matrice_query); le matrici possono essere None
+    """
+    text_path, matrix_path = _artifact_paths(paper_id, folder)
+    with gzip.open(text_path, "rt", encoding="utf-8") as f:
+        record = json.load(f)
+    with np.load(matrix_path) as arrays:
+        arrays = dict(arrays)
+    return record, _sparse_from(arrays, "paragraphs"), _sparse_from(arrays, "queries")
+
+
+def list_artifacts(folder=None):
+    """ID dei paper con artefatti salvati (ordine alfabetico)."""
+    folder = folder or Config.ARTIFACTS_DIR
+    if not os.path.exists(folder):
+        return []
+    return sorted(f[:-len(".json.gz")] for f in os.listdir(folder) if f.endswith(".json.gz"))
+
+
+def relink_paper(paper_id, refit=False, threshold=None, folder=None):
+    """
+    Ricalcola context_paragraphs di tutte le figure/tabelle di un paper dagli artefatti.
+    refit=False: riusa le matrici salvate (basta per cambiare TFIDF_THRESHOLD)
+    refit=True: rivettorizza paragrafi e query salvati con le impostazioni
+    correnti (stop words, TFIDF_MODE), sempre senza rileggere l'HTML.
+    Restituisce: lista di tuple (indice, _id, context_paragraphs)
+    """
+    record, paragraph_matrix, query_matrix = load_artifacts(paper_id, folder)
+    objects = record["objects"]
+    if not objects:
+        return []
+
+    queries = [o["query"] for o in objects]
+    excluded = [o["exclude"] for o in objects]
+
+    if refit:
+        model = get_corpus_model() if Config.TFIDF_MODE == "corpus" else None
+        analyzer = ContextAnalyzer(record["paragraphs"], model=model)
+        contexts = analyzer.match_queries(analyzer.transform_queries(queries), queries, excluded)
+    else:
+        contexts = match_context(query_matrix, paragraph_matrix, record["paragraphs"], queries, excluded, threshold)
+
+    return [(o["index"], o["_id"], ctx) for o, ctx in zip(objects, contexts)]
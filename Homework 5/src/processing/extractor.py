@@ -1,8 +1,9 @@
-from bs4 import BeautifulSoup
-import re
-from src.processing.analyzer import ContextAnalyzer
+from bs4 import BeautifulSoup, Tag
+from src.processing.analyzer import ContextAnalyzer, get_corpus_model
+from src.processing.artifacts import save_artifacts
 from src.core.utils import clean_text
-import time   # <-- [AGGIUNTO] per misurazione tempi
+from src.core.metrics import SpanTimer
+from src.config import Config
 
 
 def _get_attr_str(tag, attr_name):
@@ -21,146 +22,298 @@ def _get_attr_str(tag, attr_name):
     return str(val).strip()
 
 
-def _find_mentions(p_tags, p_texts, target_id):
+def extract_paragraphs(soup):
     """
-    Trova menzioni esplicite (link href) nei paragrafi.
-    Restituisce: (lista_testi_menzioni, set_indici_menzioni)
+    Paragrafi di testo validi del documento.
+    Scarta i paragrafi troppo corti (es. metadati, link navigazione).
+    Restituisce: (lista_tag_p, lista_testi_puliti)
     """
-    mentions = []
-    indices = set()
-    ref_link = f"#{target_id}"
-    
+    valid_p_tags = [p for p in soup.find_all("p") if len(p.get_text()) > 50]
+    p_texts = [clean_text(p.get_text()) for p in valid_p_tags]
+    return valid_p_tags, p_texts
+
+
+def build_reference_index(p_tags):
+    """
+    Indice dei riferimenti del documento, costruito in un'unica passata.
+    Mappa ogni ancora (#id) ai paragrafi che la citano tramite link href.
+    Restituisce: dict ancora -> lista di indici di paragrafo (in ordine, senza duplicati)
+    """
+    ref_index = {}
     for i, p in enumerate(p_tags):
-        links = p.find_all("a", href=True)
-        for link in links:
-            href_val = str(link['href']) 
-            if href_val.endswith(ref_link):
-                mentions.append(p_texts[i])
-                indices.add(i)
-                break 
-    return mentions, indices
+        for link in p.find_all("a", href=True):
+            href_val = str(link['href'])
+            if "#" not in href_val:
+                continue
+            anchor = href_val.rsplit("#", 1)[1]
+            indices = ref_index.setdefault(anchor, [])
+            if not indices or indices[-1] != i:
+                indices.append(i)
+    return ref_index
+
+
+def _find_mentions(ref_index, target_id):
+    """
+    Trova menzioni esplicite (link href) nei paragrafi tramite l'indice dei riferimenti.
+    Restituisce: set degli indici dei paragrafi che citano target_id
+    (i testi vengono materializzati solo alla fine, vedi _materialize)
+    """
+    return set(ref_index.get(target_id, []))
+
+
+def _link_context(analyzer, context_queries):
+    """
+    Calcola i paragrafi di contesto di tutti gli oggetti di un paper con
+    un'unica ricerca batch (come indici di paragrafo, vedi _materialize).
+    context_queries: lista di tuple (oggetto, testo_query, indici_da_escludere)
+    Restituisce: matrice sparsa delle query (None se non calcolabile)
+    """
+    if not context_queries:
+        return None
+    objects, queries, excluded = zip(*context_queries)
+    query_vecs = analyzer.transform_queries(list(queries))
+    contexts = analyzer.match_queries(query_vecs, list(queries), list(excluded), as_indices=True)
+    for obj, context in zip(objects, contexts):
+        obj["context_paragraphs"] = context
+    return query_vecs
+
+
+def _materialize(objects, p_texts):
+    """Sostituisce gli indici di mentions e context_paragraphs con i testi dei paragrafi."""
+    for obj in objects:
+        obj["mentions"] = [p_texts[i] for i in obj["mentions"]]
+        obj["context_paragraphs"] = [p_texts[i] for i in obj["context_paragraphs"]]
+
+
+def resolve_parser(name=None):
+    """
+    Backend di parsing per BeautifulSoup (Config.HTML_PARSER).
+    'lxml' è molto più veloce di 'html.parser' ma è una dipendenza opzionale:
+    se non installato si ripiega sul parser della libreria standard.
+    """
+    name = name or Config.HTML_PARSER
+    if name == "lxml":
+        try:
+            import lxml  # noqa: F401
+        except ImportError:
+            return "html.parser"
+    return name
 
 
 def extract_multimedia(html_content, paper_id, source_type):
     """
-    Funzione Entry Point.
     Estrae figure e tabelle smistando la logica in base alla source (arxiv/pubmed).
+    Wrapper di process_document mantenuto per compatibilità.
     """
+    result = process_document(html_content, paper_id, source_type)
+    return result["figures"], result["tables"]
 
-    # --------------------------------------------------
-    # [AGGIUNTO] TIMER 1: Parsing HTML
-    # --------------------------------------------------
-    t_parse = time.time()
-    soup = BeautifulSoup(html_content, "html.parser")
-    parsing_time = time.time() - t_parse
 
-    # Preparazione Comune (Estrai i paragrafi validi)
-    all_p_tags = soup.find_all("p")
+def process_document(html_content, paper_id, source_type, store=None):
+    """
+    Funzione Entry Point.
+    Elabora un paper con un unico parsing dell'HTML e produce sia figure e
+    tabelle sia il full text pulito (solo ArXiv: per PubMed il full text
+    arriva dal body XML in fase di ingestion).
+    Con uno store (ParagraphStore) i paragrafi vengono scritti su disco e
+    mentions/context_paragraphs restano indici di paragrafo: i testi sono
+    materializzati solo in indicizzazione (risultati leggeri da serializzare).
+    Restituisce: dict con figures, tables, full_text, parser, paragraph_store,
+    spans (durate perf_counter per fase) e counts (figure, tabelle, paragrafi)
+    """
+    parser = resolve_parser()
+    timer = SpanTimer()
 
-    # Filtro paragrafi troppo corti (es. metadati, link navigazione)
-    valid_p_tags = [p for p in all_p_tags if len(p.get_text()) > 50]
-    p_texts = [clean_text(p.get_text()) for p in valid_p_tags]
-    
-    # --------------------------------------------------
-    # [AGGIUNTO] TIMER 2: Calcolo TF-IDF
-    # --------------------------------------------------
-    t_tfidf = time.time()
-    analyzer = ContextAnalyzer(p_texts)
-    tfidf_time = time.time() - t_tfidf
-
-    # --------------------------------------------------
-    # [AGGIUNTO] TIMER 3: Estrazione Multimedia
-    # --------------------------------------------------
-    t_extract = time.time()
-
-    # Branching Logica
-    if source_type == "arxiv":
-        figures, tables = _extract_arxiv(
-            soup, paper_id, analyzer, valid_p_tags, p_texts
-        )
-    elif source_type == "pubmed":
-        figures, tables = _extract_pubmed(
-            soup, paper_id, analyzer, valid_p_tags, p_texts
-        )
-    else:
-        figures, tables = [], []
-
-    extract_time = time.time() - t_extract
-
-    # --------------------------------------------------
-    # [AGGIUNTO] STAMPA TEMPI (durante pipeline)
-    # --------------------------------------------------
-    print(
-        f"[TIMING] {paper_id} | "
-        f"HTML parsing: {parsing_time:.2f}s | "
-        f"TF-IDF: {tfidf_time:.2f}s | "
-        f"Multimedia extraction: {extract_time:.2f}s"
-    )
+    # Span 1: Parsing HTML
+    with timer.span("parse"):
+        soup = BeautifulSoup(html_content, parser)
 
-    # --------------------------------------------------
-    # [NOTA] NON cambiamo il return per compatibilità
-    # --------------------------------------------------
-    return figures, tables
+    # Preparazione Comune (Estrai i paragrafi validi)
+    with timer.span("paragraphs"):
+        valid_p_tags, p_texts = extract_paragraphs(soup)
+
+        # Indice ancora -> paragrafi (lookup delle menzioni in O(1) per oggetto)
+        ref_index = build_reference_index(valid_p_tags)
+
+    # Span 2: Calcolo TF-IDF
+    with timer.span("tfidf"):
+        # In modalità corpus si usa l'IDF condivisa (se già calcolata),
+        # altrimenti TF-IDF del singolo paper
+        model = get_corpus_model() if Config.TFIDF_MODE == "corpus" else None
+        analyzer = ContextAnalyzer(p_texts, model=model)
+
+    # Span 3: Estrazione Multimedia
+    with timer.span("extract"):
+        # Branching Logica
+        if source_type == "arxiv":
+            figures, tables, context_queries = _extract_arxiv(
+                soup, paper_id, ref_index
+            )
+        elif source_type == "pubmed":
+            figures, tables, context_queries = _extract_pubmed(
+                soup, paper_id, ref_index
+            )
+        else:
+            figures, tables, context_queries = [], [], []
+
+        # Contesto di tutti gli oggetti del paper in un'unica ricerca batch
+        query_vecs = _link_context(analyzer, context_queries)
+
+    # Span 4: Full text dallo stesso albero (dopo l'estrazione,
+    # perché la rimozione di script/style modifica la soup)
+    with timer.span("full_text"):
+        full_text = _clean_full_text(soup) if source_type == "arxiv" else ""
+
+    with timer.span("persist"):
+        # Paragrafi e matrici TF-IDF su disco per il re-link del contesto
+        if Config.SAVE_ARTIFACTS:
+            save_artifacts(paper_id, source_type, analyzer, context_queries, query_vecs)
+
+        if store is not None:
+            store.write(paper_id, p_texts)
+        else:
+            _materialize(figures + tables, p_texts)
+
+    return {
+        "figures": figures,
+        "tables": tables,
+        "full_text": full_text,
+        "parser": parser,
+        "paragraph_store": store is not None,
+        "spans": timer.spans,
+        "counts": {
+            "figures": len(figures),
+            "tables": len(tables),
+            "paragraphs": len(p_texts)
+        }
+    }
+
+
+def _clean_full_text(soup):
+    """Testo completo del paper per il full_text index (senza script/style/head)."""
+    for tag in soup(["script", "style", "head", "meta"]):
+        tag.extract()
+    return clean_text(soup.get_text())
 
 
 # LOGICA SPECIFICA: ARXIV
-def _extract_arxiv(soup, paper_id, analyzer, p_tags, p_texts):
+def walk_arxiv_layout(soup):
+    """
+    Visita in profondità (una sola passata) di un documento LaTeXML.
+    Costruisce l'albero di annidamento delle figure "ltx_figure" e, per ognuna:
+      - subfigures: figure ltx_figure discendenti (ordine del documento)
+      - captions: tutte le figcaption discendenti
+      - direct_captions: figcaption la cui figura più vicina è questa
+      - img: primo <img> discendente
+    Raccoglie inoltre le figure "ltx_table" e il primo tag <base>.
+    Sostituisce find_all/find_parent ripetuti per ogni figura e caption.
+    Restituisce: dict con figures (nodi in ordine), tables, base
+    """
+    figures, tables = [], []
+    base = None
+    open_figures = []   # figure ltx_figure antenate del tag corrente
+    stack = [(iter(soup.contents), None)]
+
+    while stack:
+        children, node = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            if node is not None:
+                open_figures.pop()
+            continue
+        if not isinstance(child, Tag):
+            continue
+
+        name = child.name
+        opened = None
+
+        if name == "figure":
+            classes = child.get("class") or []
+            if "ltx_figure" in classes:
+                opened = {
+                    "tag": child,
+                    "top_level": not open_figures,
+                    "subfigures": [],
+                    "captions": [],
+                    "direct_captions": [],
+                    "img": None
+                }
+                for ancestor in open_figures:
+                    ancestor["subfigures"].append(opened)
+                figures.append(opened)
+            if "ltx_table" in classes:
+                tables.append(child)
+        elif name == "figcaption":
+            for ancestor in open_figures:
+                ancestor["captions"].append(child)
+            if open_figures:
+                open_figures[-1]["direct_captions"].append(child)
+        elif name == "img":
+            for ancestor in open_figures:
+                if ancestor["img"] is None:
+                    ancestor["img"] = child
+        elif name == "base" and base is None:
+            base = child
+
+        if opened is not None:
+            open_figures.append(opened)
+        stack.append((iter(child.contents), opened))
+
+    return {"figures": figures, "tables": tables, "base": base}
+
+
+def _extract_arxiv(soup, paper_id, ref_index):
     figures_data = []
     tables_data = []
+    context_queries = []
+
+    # Un'unica visita dell'albero: figure annidate, caption, immagini, tabelle e <base>
+    layout = walk_arxiv_layout(soup)
 
     # Base URL
     base_url = ""
-    base_tag = soup.find("base")
+    base_tag = layout["base"]
     if base_tag:
         href_val = _get_attr_str(base_tag, "href")
         if href_val:
             base_url = "https://arxiv.org" + href_val if href_val.startswith("/") else f"https://arxiv.org/{href_val}"
 
-    # Estrazione FIGURE
-    all_figures = soup.find_all("figure", class_="ltx_figure")
-    
-    for fig in all_figures:
-        if "ltx_table" in _get_attr_str(fig, "class"):
+    # Estrazione FIGURE (solo quelle di primo livello, con sotto-figure)
+    for node in layout["figures"]:
+        if not node["top_level"]:
             continue
-            
-        if fig.find_parent("figure", class_="ltx_figure"):
+
+        fig = node["tag"]
+        if "ltx_table" in _get_attr_str(fig, "class"):
             continue
 
         parent_id = _get_attr_str(fig, "id") or "unknown"
-        sub_figures = fig.find_all("figure", class_="ltx_figure")
+        sub_figures = node["subfigures"]
         
         if sub_figures:
-            direct_captions = [
-                c for c in fig.find_all("figcaption") 
-                if c.find_parent("figure", class_="ltx_figure") == fig
-            ]
             main_caption_text = " ".join(
-                [clean_text(c.get_text()) for c in direct_captions]
+                [clean_text(c.get_text()) for c in node["direct_captions"]]
             )
             
-            for sub in sub_figures:
+            for sub_node in sub_figures:
+                sub = sub_node["tag"]
                 sub_id = _get_attr_str(sub, "id") or "unknown"
-                sub_caps = sub.find_all("figcaption")
                 sub_caption_text = " ".join(
-                    [clean_text(c.get_text()) for c in sub_caps]
+                    [clean_text(c.get_text()) for c in sub_node["captions"]]
                 )
                 
-                img_tag = sub.find("img")
+                img_tag = sub_node["img"]
                 img_src = _get_attr_str(img_tag, "src") if img_tag else ""
                 img_url = f"{base_url}{img_src}" if (img_src and base_url) else ""
                 
                 full_caption = f"{sub_caption_text} {main_caption_text}".strip()
                 
-                mentions, mention_idxs = _find_mentions(p_tags, p_texts, parent_id)
+                mention_idxs = _find_mentions(ref_index, parent_id)
                 if sub_id != parent_id:
-                    m_sub, m_idxs_sub = _find_mentions(p_tags, p_texts, sub_id)
-                    mentions.extend(m_sub)
+                    m_idxs_sub = _find_mentions(ref_index, sub_id)
                     mention_idxs.update(m_idxs_sub)
                 
-                context = analyzer.find_context(
-                    full_caption, exclude_indices=mention_idxs
-                )
-                
                 figures_data.append({
                     "source": "arxiv",
                     "paper_id": paper_id,
@@ -168,13 +321,15 @@ def _extract_arxiv(soup, paper_id, analyzer, p_tags, p_texts):
                     "img_url": img_url,
                     "local_src": img_src,
                     "caption": full_caption,
-                    "mentions": list(set(mentions)),
-                    "context_paragraphs": context
+                    "mentions": sorted(mention_idxs),
+                    "context_paragraphs": []
                 })
+                context_queries.append(
+                    (figures_data[-1], full_caption, mention_idxs)
+                )
 
     # Estrazione tabelle
-    table_nodes = soup.find_all("figure", class_="ltx_table")
-    for tbl in table_nodes:
+    for tbl in layout["tables"]:
         t_id = _get_attr_str(tbl, "id") or "unknown"
         caption_tag = tbl.find("figcaption")
         caption = clean_text(caption_tag.get_text()) if caption_tag else ""
@@ -184,11 +339,7 @@ def _extract_arxiv(soup, paper_id, analyzer, p_tags, p_texts):
         if real_tbl:
             body_content = clean_text(real_tbl.get_text(separator=" "))
             
-        mentions, mention_idxs = _find_mentions(p_tags, p_texts, t_id)
-        context = analyzer.find_context(
-            caption + " " + body_content,
-            exclude_indices=mention_idxs
-        )
+        mention_idxs = _find_mentions(ref_index, t_id)
 
         if caption or body_content:
             tables_data.append({
@@ -197,17 +348,21 @@ def _extract_arxiv(soup, paper_id, analyzer, p_tags, p_texts):
                 "table_id": t_id,
                 "caption": caption,
                 "body_content": body_content,
-                "mentions": mentions,
-                "context_paragraphs": context
+                "mentions": sorted(mention_idxs),
+                "context_paragraphs": []
             })
+            context_queries.append(
+                (tables_data[-1], caption + " " + body_content, mention_idxs)
+            )
 
-    return figures_data, tables_data
+    return figures_data, tables_data, context_queries
 
 
 # LOGICA SPECIFICA: PUBMED
-def _extract_pubmed(soup, paper_id, analyzer, p_tags, p_texts):
+def _extract_pubmed(soup, paper_id, ref_index):
     figures_data = []
     tables_data = []
+    context_queries = []
 
     real_paper_id = paper_id
     all_figures = soup.find_all("figure")
@@ -242,10 +397,7 @@ def _extract_pubmed(soup, paper_id, analyzer, p_tags, p_texts):
         if not img_url and not caption:
             continue
 
-        mentions, mention_idxs = _find_mentions(p_tags, p_texts, f_id)
-        context = analyzer.find_context(
-            caption, exclude_indices=mention_idxs
-        )
+        mention_idxs = _find_mentions(ref_index, f_id)
 
         figures_data.append({
             "source": "pubmed",
@@ -254,9 +406,10 @@ def _extract_pubmed(soup, paper_id, analyzer, p_tags, p_texts):
             "img_url": img_url,
             "local_src": img_src,
             "caption": caption,
-            "mentions": mentions,
-            "context_paragraphs": context
+            "mentions": sorted(mention_idxs),
+            "context_paragraphs": []
         })
+        context_queries.append((figures_data[-1], caption, mention_idxs))
 
     # Estrazione tabelle
     table_nodes = soup.find_all(
@@ -286,11 +439,7 @@ def _extract_pubmed(soup, paper_id, analyzer, p_tags, p_texts):
         if not body_content and not caption:
             continue
 
-        mentions, mention_idxs = _find_mentions(p_tags, p_texts, t_id)
-        context = analyzer.find_context(
-            caption + " " + body_content,
-            exclude_indices=mention_idxs
-        )
+        mention_idxs = _find_mentions(ref_index, t_id)
 
         tables_data.append({
             "source": "pubmed",
@@ -298,8 +447,11 @@ def _extract_pubmed(soup, paper_id, analyzer, p_tags, p_texts):
             "table_id": t_id,
             "caption": caption,
             "body_content": body_content,
-            "mentions": mentions,
-            "context_paragraphs": context
+            "mentions": sorted(mention_idxs),
+            "context_paragraphs": []
         })
+        context_queries.append(
+            (tables_data[-1], caption + " " + body_content, mention_idxs)
+        )
 
-    return figures_data, tables_data
+    return figures_data, tables_data, context_queries
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from bs4 import BeautifulSoup, SoupStrainer
+from src.config import Config
+from src.core import ParagraphStore
+from src.processing.extractor import process_document, extract_paragraphs, resolve_parser
+from src.processing.analyzer import CorpusModel, paragraph_doc_freq, set_corpus_model
+
+
+def list_html_files(folder, source):
+    """
+    Elenca i file HTML scaricati in una cartella.
+    Restituisce: lista di tuple (path, paper_id, source) in ordine alfabetico,
+    così l'ordine di elaborazione (e quindi degli _id) è deterministico.
+    """
+    if not os.path.exists(folder):
+        return []
+
+    files = sorted(f for f in os.listdir(folder) if f.endswith(".html"))
+    return [
+        (os.path.join(folder, f), f.replace(".html", ""), source)
+        for f in files
+    ]
+
+
+def _result_path(paper_id):
+    return os.path.join(Config.RESULTS_DIR, f"{paper_id}.json")
+
+
+def load_result(task):
+    """
+    Risultato di estrazione salvato da un run interrotto, se ancora valido
+    (HTML con stessa dimensione e data di modifica). Altrimenti None.
+    """
+    path, paper_id, _ = task
+    result_path = _result_path(paper_id)
+    if not os.path.exists(result_path):
+        return None
+    try:
+        with open(result_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        return None
+    stat = os.stat(path)
+    if result.get("html_mtime") != stat.st_mtime or result.get("html_size") != stat.st_size:
+        return None
+    return result
+
+
+def save_result(task, result):
+    """Salva in modo atomico il risultato di estrazione di un paper."""
+    path, paper_id, _ = task
+    stat = os.stat(path)
+    os.makedirs(Config.RESULTS_DIR, exist_ok=True)
+    result_path = _result_path(paper_id)
+    tmp_path = f"{result_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({**result, "html_mtime": stat.st_mtime, "html_size": stat.st_size}, f)
+    os.replace(tmp_path, result_path)
+
+
+def extract_file(task):
+    """
+    Worker: legge un file HTML e lo elabora con un unico parsing
+    (figure, tabelle e full text). Con Config.PARAGRAPH_STORE i paragrafi
+    restano su disco e il risultato contiene solo i loro indici.
+    Definita a livello di modulo per poter essere serializzata (pickle)
+    e inviata ai processi del pool.
+    Il risultato viene salvato in Config.RESULTS_DIR: se la pipeline si
+    interrompe prima dell'indicizzazione, la ripresa non rielabora il paper.
+    Restituisce: dict di process_document più paper_id, source e time
+    (gli span includono anche lettura del file e tempo totale)
+    """
+    path, paper_id, source = task
+
+    # Paper già estratto da un run interrotto (vedi run_pipeline.py --resume)
+    cached = load_result(task)
+    if cached is not None:
+        cached["resumed"] = True
+        return cached
+
+    t_doc_start = time.perf_counter()
+
+    with open(path, "r", encoding="utf-8") as file_in:
+        html = file_in.read()
+    read_time = time.perf_counter() - t_doc_start
+
+    store = ParagraphStore(Config.PARAGRAPH_STORE_DIR) if Config.PARAGRAPH_STORE else None
+    result = process_document(html, paper_id, source, store=store)
+
+    result["paper_id"] = paper_id
+    result["source"] = source
+    result["time"] = time.perf_counter() - t_doc_start
+    result["spans"] = {"read": read_time, **result["spans"], "total": result["time"]}
+    save_result(task, result)
+    return result
+
+
+def paragraph_stats(task):
+    """
+    Worker: document frequency dei paragrafi di un file HTML.
+    Analizza solo i tag <p> (SoupStrainer), senza costruire l'albero completo.
+    Restituisce: (indici_feature, conteggi, numero_paragrafi)
+    """
+    path, paper_id, source = task
+
+    with open(path, "r", encoding="utf-8") as file_in:
+        html = file_in.read()
+
+    soup = BeautifulSoup(html, resolve_parser(), parse_only=SoupStrainer("p"))
+    _, p_texts = extract_paragraphs(soup)
+    return paragraph_doc_freq(p_texts)
+
+
+def fit_corpus_model(tasks, workers=1, pool=None, path=None):
+    """
+    Calcola le statistiche IDF di corpus su tutti i file indicati,
+    le salva su disco e le rende disponibili al processo corrente.
+    Restituisce: CorpusModel
+    """
+    path = path or Config.TFIDF_MODEL_PATH
+    model = CorpusModel()
+    for cols, counts, n in map_tasks(paragraph_stats, tasks, workers, pool):
+        model.add_counts(cols, counts, n)
+    model.save(path)
+    set_corpus_model(model)
+    print(f"[TFIDF] Modello di corpus: {len(tasks)} paper, {model.n_docs} paragrafi -> {path}")
+    return model
+
+
+def update_corpus_model(tasks, workers=1, pool=None, path=None):
+    """
+    Aggiunge al modello di corpus salvato le document frequency dei file
+    indicati (paper scaricati dopo il fit), senza ricalcolarlo da zero.
+    Senza un modello su disco ne crea uno con i soli file indicati.
+    Le versioni precedenti di un HTML modificato restano nelle statistiche
+    fino al prossimo fit completo (--fit-tfidf).
+    Restituisce: CorpusModel
+    """
+    path = path or Config.TFIDF_MODEL_PATH
+    model = CorpusModel.load(path) if os.path.exists(path) else CorpusModel()
+    n_before = model.n_docs
+    for cols, counts, n in map_tasks(paragraph_stats, tasks, workers, pool):
+        model.add_counts(cols, counts, n)
+    model.save(path)
+    set_corpus_model(model)
+    print(f"[TFIDF] Modello di corpus aggiornato: +{len(tasks)} paper, +{model.n_docs - n_before} paragrafi -> {path}")
+    return model
+
+
+def extract_corpus(tasks, workers=1, pool=None):
+    """
+    Esegue process_document su tutti i file indicati.
+    Con workers > 1 usa un pool di processi (parsing e TF-IDF sono CPU-bound).
+    I risultati vengono restituiti (generatore) nello stesso ordine dei task,
+    indipendentemente da quale processo termina prima.
+    tasks può essere anche un iterabile non limitato (es. una BoundedQueue).
+    """
+    return map_tasks(extract_file, tasks, workers, pool)
+
+
+def start_pool(workers):
+    """
+    Crea un pool di processi e ne avvia subito tutti i worker.
+    Serve quando nel processo verranno avviati dei thread: il fork
+    avviene prima, quando è ancora sicuro.
+    """
+    pool = ProcessPoolExecutor(max_workers=workers)
+    for future in [pool.submit(os.getpid) for _ in range(workers)]:
+        future.result()
+    return pool
+
+
+def map_tasks(func, tasks, workers=1, pool=None):
+    """
+    Applica func a ogni task, in sequenza o con un pool di processi.
+    Con pool indicato usa (senza chiuderlo) un pool già avviato.
+    Generatore: i risultati arrivano nello stesso ordine dei task.
+    """
+    if pool is None and (workers <= 1 or (hasattr(tasks, "__len__") and len(tasks) <= 1)):
+        for task in tasks:
+            yield func(task)
+        return
+
+    # Finestra scorrevole di task in volo: evita che i risultati si accumulino
+    # in memoria se il consumatore (es. indicizzazione bulk) è più lento
+    window = max(workers, 1) * 2
+    pending = deque()
+
+    own_pool = pool is None
+    if own_pool:
+        pool = ProcessPoolExecutor(max_workers=workers)
+
+    try:
+        for task in tasks:
+            pending.append(pool.submit(func, task))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+            # Risultati già pronti in testa: consegnati subito (utile se i
+            # task arrivano lentamente, es. da un download in corso)
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if own_pool:
+            pool.shutdown()
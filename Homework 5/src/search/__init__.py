@@ -0,0 +1,5 @@
+from .router import resolve_indices, logic_type, INDEX_TYPES, MODES
+from .query import build_query, shape_request, PROFILES
+from .paging import PagedSearch, PagingSessions
+from .service import SearchService, SearchResult
+from .results import build_result, collect_results, get_highlighted_snippet
\ No newline at end of file
@@ -0,0 +1,260 @@
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.config import Config
+from src.core.es import multi_search
+
+# Ordinamento per la paginazione: score, poi ordine interno del PIT (tie-breaker stabile)
+PIT_SORT = [{"_score": "desc"}, {"_shard_doc": "asc"}]
+
+# Tie-breaker del cursore ricavato da una prima pagina senza PIT: precede ogni
+# _shard_doc, quindi la pagina successiva riparte dai pari merito dell'ultimo score
+FIRST_SHARD_DOC = -1
+
+# Thread condivisi per il prefetch della pagina successiva e l'apertura dei PIT
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="paging")
+        return _pool
+
+
+class PagedSearch:
+    """
+    Paginazione profonda con search_after su un point in time (PIT), su uno o più indici.
+      - ogni indice ha il proprio PIT: le pagine vedono lo stesso snapshot
+        anche se nel frattempo gli indici vengono aggiornati (refresh)
+      - ogni pagina è un solo _msearch con il cursore (search_after) di ogni indice,
+        quindi costa uguale a qualunque profondità (niente from + size)
+      - con prefetch=True la pagina successiva viene richiesta in background
+        mentre quella corrente viene mostrata
+      - le richieste sulla stessa ricerca (es. thread diversi dell'app web)
+        sono serializzate da un lock: ogni pagina viene restituita una volta sola
+    searches: lista di (indice, body); size/from del body vengono ignorati.
+    first_page: risposte (indice, risposta) di una prima pagina già eseguita
+    senza PIT (es. SearchService.search, anche dalla cache), nello stesso
+    ordine di searches. La ricerca parte dalla pagina 2 e i PIT vengono aperti
+    solo quando viene richiesta: il cursore è l'ultimo score di ogni indice e
+    i pari merito già mostrati vengono scartati dalla pagina successiva.
+    """
+
+    def __init__(self, es, searches, page_size, keep_alive=None, prefetch=None, first_page=None):
+        self.es = es
+        self.page_size = page_size
+        self.keep_alive = f"{keep_alive or Config.PIT_KEEP_ALIVE}s"
+        self.prefetch = Config.SEARCH_PREFETCH if prefetch is None else prefetch
+        self.page = 0
+        self.totals = {}
+        self.closed = False
+        self._states = [
+            {"index": index, "body": body, "pit": None, "after": None, "seen": (), "done": False}
+            for index, body in searches
+        ]
+        self._next = None
+        self._last = None
+        self._lock = threading.RLock()
+        if first_page is not None:
+            self._resume(first_page)
+
+    def _resume(self, first_page):
+        """Cursori di ogni indice a partire dalle risposte della prima pagina."""
+        for st, (index, resp) in zip(self._states, first_page):
+            if "error" in resp:
+                st["done"] = True
+                continue
+            hits = resp["hits"]["hits"]
+            self.totals[index] = resp["hits"]["total"]["value"]
+            if not hits or len(hits) >= self.totals[index]:
+                st["done"] = True
+                continue
+            last_score = hits[-1]["_score"]
+            st["after"] = [last_score, FIRST_SHARD_DOC]
+            st["seen"] = {hit["_id"] for hit in hits if hit["_score"] == last_score}
+        self.page = 1
+        self._last = list(first_page)
+
+    @property
+    def has_more(self):
+        """True se almeno un indice può avere altri risultati."""
+        # Con il prefetch lo stato degli indici è già quello della pagina successiva
+        # (non ancora restituita): finché è in sospeso c'è un'altra pagina
+        return self._next is not None or any(not st["done"] for st in self._states)
+
+    def _open(self):
+        """Apre in parallelo i PIT degli indici non ancora esauriti che ne sono privi."""
+        pending = [st for st in self._states if st["pit"] is None and not st["done"]]
+        if len(pending) == 1:
+            st = pending[0]
+            st["pit"] = self.es.open_point_in_time(index=st["index"], keep_alive=self.keep_alive)["id"]
+            return
+
+        futures = [
+            (st, _get_pool().submit(self.es.open_point_in_time, index=st["index"], keep_alive=self.keep_alive))
+            for st in pending
+        ]
+        errors = []
+        for st, future in futures:
+            try:
+                st["pit"] = future.result()["id"]
+            except Exception as e:
+                errors.append(e)
+        # I PIT aperti restano nello stato e vengono chiusi da close()
+        if errors:
+            raise errors[0]
+
+    def _fetch(self):
+        """Richiede la pagina successiva di ogni indice non ancora esaurito."""
+        self._open()
+        active = [st for st in self._states if not st["done"]]
+        if not active:
+            return []
+
+        searches = []
+        for st in active:
+            body = {k: v for k, v in st["body"].items() if k not in ("size", "from")}
+            # Pari merito della prima pagina: richiesti di nuovo e scartati sotto
+            body["size"] = self.page_size + len(st["seen"])
+            body["pit"] = {"id": st["pit"], "keep_alive": self.keep_alive}
+            body["sort"] = PIT_SORT
+            # Il totale serve solo alla prima pagina
+            body["track_total_hits"] = st["after"] is None
+            if st["after"] is not None:
+                body["search_after"] = st["after"]
+            # Con il PIT l'indice non va indicato nella richiesta
+            searches.append((None, body))
+
+        responses = multi_search(self.es, searches)
+
+        page = []
+        for st, resp in zip(active, responses):
+            if "error" in resp:
+                page.append((st["index"], resp))
+                st["done"] = True
+                continue
+            # ES può restituire un id del PIT aggiornato
+            st["pit"] = resp.get("pit_id", st["pit"])
+            hits = resp["hits"]["hits"]
+            if len(hits) < self.page_size + len(st["seen"]):
+                st["done"] = True
+            if st["seen"]:
+                hits = [hit for hit in hits if hit["_id"] not in st["seen"]][:self.page_size]
+                resp = {**resp, "hits": {**resp["hits"], "hits": hits}}
+                st["seen"] = ()
+            if "total" in resp["hits"]:
+                self.totals[st["index"]] = resp["hits"]["total"]["value"]
+            if hits:
+                st["after"] = hits[-1]["sort"]
+            page.append((st["index"], resp))
+        return page
+
+    def next_page(self):
+        """
+        Pagina successiva: lista di (indice, risposta) degli indici non esauriti
+        (stesso formato delle risposte di multi_search).
+        """
+        with self._lock:
+            if self.closed:
+                raise RuntimeError("Ricerca paginata già chiusa")
+            if self._next is not None:
+                future, self._next = self._next, None
+                page = future.result()
+            else:
+                page = self._fetch()
+            self.page += 1
+            self._last = page
+
+            if self.prefetch and self.has_more:
+                self._next = _get_pool().submit(self._fetch)
+            return page
+
+    def page_at(self, number):
+        """
+        Pagina number (da 1) per l'app web: la successiva all'ultima restituita
+        oppure di nuovo l'ultima (es. form inviato due volte o pagina ricaricata).
+        Le pagine precedenti non vengono rieseguite: per qualunque altro numero,
+        o a ricerca chiusa, restituisce None.
+        """
+        with self._lock:
+            if self.closed:
+                return None
+            if number == self.page + 1:
+                return self.next_page()
+            if number == self.page and self._last is not None:
+                return self._last
+            return None
+
+    def close(self):
+        """Attende l'eventuale prefetch in corso e chiude i PIT."""
+        with self._lock:
+            self.closed = True
+            if self._next is not None:
+                try:
+                    self._next.result()
+                except Exception:
+                    pass
+                self._next = None
+            for st in self._states:
+                if st["pit"] is not None:
+                    try:
+                        self.es.close_point_in_time(id=st["pit"])
+                    except Exception:
+                        # Il PIT scade comunque dopo keep_alive
+                        pass
+                    st["pit"] = None
+
+
+class PagingSessions:
+    """
+    Ricerche paginate aperte dall'app web, identificate da un token
+    (passato nel form della pagina successiva). Le sessioni inutilizzate
+    oltre la durata del PIT o in eccesso (LRU) vengono chiuse.
+    """
+
+    def __init__(self, max_sessions, ttl=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl or Config.PIT_KEEP_ALIVE
+        self._sessions = OrderedDict()   # token -> (PagedSearch, ultimo utilizzo)
+        self._lock = threading.Lock()
+
+    def add(self, paged):
+        token = secrets.token_urlsafe(12)
+        with self._lock:
+            self._sessions[token] = (paged, time.monotonic())
+            expired = self._expire()
+        for old in expired:
+            old.close()
+        return token
+
+    def get(self, token):
+        with self._lock:
+            expired = self._expire()
+            entry = self._sessions.get(token)
+            if entry is not None:
+                self._sessions[token] = (entry[0], time.monotonic())
+                self._sessions.move_to_end(token)
+        for old in expired:
+            old.close()
+        return entry[0] if entry else None
+
+    def drop(self, token):
+        with self._lock:
+            entry = self._sessions.pop(token, None)
+        if entry is not None:
+            entry[0].close()
+
+    def _expire(self):
+        expired = []
+        now = time.monotonic()
+        for token in list(self._sessions):
+            paged, last_used = self._sessions[token]
+            if now - last_used > self.ttl or len(self._sessions) > self.max_sessions:
+                del self._sessions[token]
+                expired.append(paged)
+        return expired
@@ -0,0 +1,116 @@
+# Costruzione delle query di ricerca, unica per shell, app web e benchmark.
+# Ogni front end sceglie solo un profilo di presentazione (risultati per
+# pagina, tag di evidenziazione, frammenti); campi, boost e forma della
+# risposta sono gli stessi ovunque.
+
+# --- CONFIGURAZIONE CAMPI DI RICERCA (Boosting) ---
+# Documenti: Titolo molto importante (^3), Abstract importante (^2)
+CONTENT_FIELDS = ["title^3", "abstract^2", "full_text", "authors", "document_id"]
+
+# Tabelle: Caption fondamentale, Contenuto tabella, Contesto
+TABLE_FIELDS = ["caption^3", "body_content^2", "mentions", "context_paragraphs", "table_id", "paper_id"]
+
+# Figure: Caption fondamentale, Contesto
+FIGURE_FIELDS = ["caption^3", "mentions", "context_paragraphs", "figure_id", "paper_id"]
+
+SEARCH_FIELDS = {"docs": CONTENT_FIELDS, "tables": TABLE_FIELDS, "figures": FIGURE_FIELDS}
+
+# --- FORMA DELLA RISPOSTA ---
+# Solo i campi di _source effettivamente mostrati e highlight su campi espliciti.
+# I campi lunghi (full_text, context_paragraphs, mentions, ...) non viaggiano
+# mai interi: arrivano solo i frammenti evidenziati, oppure, per i campi di
+# "fallback", l'inizio del testo tagliato lato server (no_match_size).
+
+# Campi di _source restituiti per ogni tipo
+SOURCE_FIELDS = {
+    "docs": ["source", "document_id", "title", "authors", "date", "pdf_url", "paper_title_slug"],
+    "tables": ["source", "paper_id", "table_id", "caption"],
+    "figures": ["source", "paper_id", "figure_id", "img_url", "caption"]
+}
+
+# Campi evidenziati per ogni tipo (opzioni specifiche del campo)
+HIGHLIGHT_FIELDS = {
+    "docs": {
+        "title": {"number_of_fragments": 0},
+        "abstract": {},
+        "full_text": {}
+    },
+    "tables": {
+        "caption": {"number_of_fragments": 0},
+        "body_content": {},
+        "mentions": {},
+        "context_paragraphs": {}
+    },
+    "figures": {
+        "caption": {"number_of_fragments": 0},
+        "mentions": {},
+        "context_paragraphs": {}
+    }
+}
+
+# Caratteri restituiti dall'inizio del campo quando non c'è match
+# (sostituisce il troncamento lato client del testo completo)
+FALLBACK_SIZES = {
+    "abstract": 300,
+    "body_content": 200,
+    "mentions": 300,
+    "context_paragraphs": 300
+}
+
+# --- PROFILI DEI FRONT END ---
+PROFILES = {
+    # Terminale: colore giallo ANSI, 5 risultati per pagina per leggibilità;
+    # abstract e contenuto delle tabelle arrivano sempre, il contesto solo se contiene la query
+    "shell": {
+        "size": 5,
+        "highlight": {"pre_tags": ["\033[93m"], "post_tags": ["\033[0m"]},
+        "fallback": {"abstract", "body_content"}
+    },
+    # Pagina HTML: un frammento da 200 caratteri per campo, 10 risultati per indice;
+    # encoder html: il testo dei frammenti arriva già escapato (solo <mark> resta markup)
+    "web": {
+        "size": 10,
+        "highlight": {"pre_tags": ["<mark>"], "post_tags": ["</mark>"], "encoder": "html", "fragment_size": 200, "number_of_fragments": 1},
+        "fallback": None
+    }
+}
+
+
+def shape_request(body, logic_type, fallback=None):
+    """
+    Aggiunge al body della ricerca _source (includes) e highlight espliciti
+    per il tipo di risultato, mantenendo tag e opzioni globali già presenti.
+    fallback: campi per cui restituire comunque un frammento (default: tutti
+    quelli di FALLBACK_SIZES previsti per il tipo).
+    """
+    body["_source"] = {"includes": SOURCE_FIELDS[logic_type]}
+
+    fields = {}
+    for field, options in HIGHLIGHT_FIELDS[logic_type].items():
+        options = dict(options)
+        if field in FALLBACK_SIZES and (fallback is None or field in fallback):
+            options["no_match_size"] = FALLBACK_SIZES[field]
+        fields[field] = options
+
+    body.setdefault("highlight", {})["fields"] = fields
+    return body
+
+
+def build_query(query_string, logic_type, profile="web", size=None):
+    """Query string con boost per tipo, highlighting e _source del profilo."""
+    if logic_type not in SEARCH_FIELDS:
+        logic_type = "docs"
+    settings = PROFILES[profile]
+
+    body = {
+        "query": {
+            "query_string": {
+                "query": query_string,
+                "fields": SEARCH_FIELDS[logic_type],
+                "default_operator": "AND"
+            }
+        },
+        "highlight": dict(settings["highlight"]),
+        "size": size or settings["size"]
+    }
+    return shape_request(body, logic_type, fallback=settings["fallback"])
@@ -0,0 +1,100 @@
+from html import escape
+from src.search.router import logic_type
+
+# Conversione degli hit di Elasticsearch nel formato dei template, condivisa
+# dall'app Flask e dalla variante asincrona (nessuna dipendenza dal server web).
+
+
+def get_highlighted_snippet(hit, field_name, fallback_text="", length=300):
+    """
+    Estrae il testo evidenziato da ES. Se non c'è match, usa il testo originale troncato.
+    Il risultato va nel template come HTML: i frammenti sono già escapati da ES
+    (encoder html del profilo web), il testo originale viene escapato qui.
+    """
+    highlight = hit.get("highlight", {})
+    if field_name in highlight:
+        return "... " + " ... ".join(highlight[field_name]) + " ..."
+    
+    if not fallback_text:
+        return ""
+    
+    text_str = str(fallback_text)
+    if len(text_str) > length:
+        return escape(text_str[:length]) + "..."
+    return escape(text_str)
+
+
+def build_result(hit, visual_type):
+    """Converte un hit di Elasticsearch nel formato usato dal template."""
+    src = hit['_source']
+    
+    # Logica Titolo
+    title_val = "Senza Titolo"
+    
+    if visual_type == "docs":
+        # Documenti: Titolo Paper > Nome File > Fallback
+        title_val = src.get("title") or src.get("paper_title_slug") or "Documento sconosciuto"
+    else:
+        # Media: Caption troncata > ID Figura > Fallback
+        caption_raw = src.get("caption", "")
+        if caption_raw:
+            # Usa i primi 100 caratteri della caption come titolo "pulito"
+            clean_cap = str(caption_raw).strip()
+            title_val = clean_cap[:100] + ("..." if len(clean_cap) > 100 else "")
+        else:
+            # Fallback su ID (es. "Figure 1", "Table S2")
+            obj_id = src.get("figure_id") or src.get("table_id")
+            title_val = f"Oggetto: {obj_id}" if obj_id else "Immagine senza descrizione"
+
+    # Snippet Primario (Abstract o Caption evidenziata)
+    if visual_type == "docs":
+        prim_text = get_highlighted_snippet(hit, "abstract", src.get("abstract"))
+    else:
+        prim_text = get_highlighted_snippet(hit, "caption", src.get("caption"))
+    
+    # Snippet Secondario (Contesto o Full Text)
+    sec_text = ""
+    if visual_type == "docs":
+        if "full_text" in hit.get("highlight", {}):
+            sec_text = get_highlighted_snippet(hit, "full_text")
+    else:
+        sec_text = get_highlighted_snippet(hit, "context_paragraphs", src.get("context_paragraphs"))
+        if not sec_text:
+            sec_text = get_highlighted_snippet(hit, "mentions", src.get("mentions"))
+
+    return {
+        "type": visual_type,
+        "score": hit['_score'],
+        "paper_id": src.get("document_id") or src.get("paper_id"),
+        "title_or_slug": title_val, # Qui ora c'è la caption troncata!
+        "url": src.get("pdf_url") or src.get("img_url"),
+        "primary_text": prim_text,
+        "secondary_text": sec_text,
+        "table_text": get_highlighted_snippet(hit, "body_content") if visual_type == "tables" else "",
+        "source_data": src
+    }
+
+
+def collect_results(indices, responses):
+    """
+    Unisce le risposte dei singoli indici ordinando per score.
+    Restituisce: (risultati, tempi per indice, completa)
+    """
+    results = []
+    timings = []
+    errors = 0
+
+    for idx, resp in zip(indices, responses):
+        if "error" in resp:
+            # Errore su un singolo indice: gli altri risultati restano validi
+            print(f"Errore Search Web su {idx}: {resp['error']}")
+            errors += 1
+            continue
+
+        timings.append({"index": idx, "took": resp.get("took", 0)})
+        visual_type = logic_type(idx)
+        for hit in resp['hits']['hits']:
+            results.append(build_result(hit, visual_type))
+
+    results.sort(key=lambda x: x['score'], reverse=True)
+    return results, timings, errors == 0
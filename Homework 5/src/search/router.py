@@ -0,0 +1,26 @@
+from src.config import Config
+
+# Tipo logico (formato dei risultati) di ogni indice
+INDEX_TYPES = {
+    Config.INDEX_DOCS: "docs",
+    Config.INDEX_TABLES: "tables",
+    Config.INDEX_FIGURES: "figures"
+}
+
+# Modalità di ricerca di shell e app web -> indici interrogati
+MODES = {
+    "docs": [Config.INDEX_DOCS],
+    "tables": [Config.INDEX_TABLES],
+    "figures": [Config.INDEX_FIGURES],
+    "all": [Config.INDEX_DOCS, Config.INDEX_TABLES, Config.INDEX_FIGURES]
+}
+
+
+def resolve_indices(mode):
+    """Indici da interrogare per la modalità (modalità sconosciuta = tutti gli indici)."""
+    return list(MODES.get(mode, MODES["all"]))
+
+
+def logic_type(index):
+    """Tipo logico dei risultati di un indice ("docs", "tables" o "figures")."""
+    return INDEX_TYPES.get(index, "docs")
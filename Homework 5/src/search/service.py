@@ -0,0 +1,263 @@
+import time
+import asyncio
+import threading
+from collections import deque
+from src.config import Config
+from src.core.es import get_es_client, multi_search
+from src.core.metrics import percentiles
+from src.core.result_cache import normalize_query
+from src.search.router import resolve_indices, logic_type
+from src.search.query import build_query, PROFILES
+from src.search.paging import PagedSearch
+
+# Latenze recenti conservate per le statistiche del servizio
+LATENCY_WINDOW = 1000
+
+
+class SearchResult:
+    """
+    Esito di una ricerca: una risposta di Elasticsearch per indice (con "took"
+    oppure "error"), nello stesso ordine degli indici, e latenza lato client.
+    """
+
+    def __init__(self, query, mode, indices, responses, client_ms=None, cached=False):
+        self.query = query
+        self.mode = mode
+        self.indices = indices
+        self.responses = responses
+        self.client_ms = client_ms
+        self.cached = cached
+
+    def pairs(self):
+        return list(zip(self.indices, self.responses))
+
+    @property
+    def complete(self):
+        """False se almeno un indice ha restituito errore (risultato da non mettere in cache)."""
+        return not any("error" in resp for resp in self.responses)
+
+    @property
+    def timings(self):
+        """Tempo lato server ("took", ms) di ogni indice senza errori."""
+        return [
+            {"index": idx, "took": resp.get("took", 0)}
+            for idx, resp in self.pairs() if "error" not in resp
+        ]
+
+    @property
+    def has_more(self):
+        """True se almeno un indice ha più risultati di quelli restituiti."""
+        return any(
+            "error" not in resp and resp["hits"]["total"]["value"] > len(resp["hits"]["hits"])
+            for resp in self.responses
+        )
+
+    def cached_copy(self):
+        return SearchResult(self.query, self.mode, self.indices, self.responses, cached=True)
+
+
+class SearchService:
+    """
+    Servizio di ricerca condiviso da shell, app web (sincrona e asincrona),
+    benchmark e script di verifica:
+      - un solo costruttore di query e un solo instradamento modalità -> indici
+      - esecuzione a lotti: un _msearch per tutti gli indici della modalità
+        (o ricerche concorrenti con il client asincrono)
+      - cache opzionale dei risultati (ResultCache), invalidata dalla
+        generazione degli indici (IndexGeneration), controllata a ogni lookup
+      - latenze lato client e server registrate per ogni ricerca
+    profile: "shell" o "web" (risultati per pagina, tag, frammenti).
+    """
+
+    def __init__(self, es=None, profile="web", cache=None, generation=None):
+        self._es = es
+        self.profile = profile
+        self.page_size = PROFILES[profile]["size"]
+        self.cache = cache
+        self.generation = generation
+        self.searches = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+        self._took = {}
+        self._lock = threading.Lock()
+
+    @property
+    def es(self):
+        # Client condiviso dal processo, senza ping sul percorso della richiesta
+        if self._es is None:
+            self._es = get_es_client(check=False)
+        return self._es
+
+    def build_searches(self, query, mode):
+        """Lista di (indice, body) della modalità, con le query del profilo."""
+        return [(idx, build_query(query, logic_type(idx), self.profile)) for idx in resolve_indices(mode)]
+
+    def _cache_key(self, query, mode):
+        return (normalize_query(query), mode)
+
+    def _lookup(self, query, mode, generation):
+        """
+        Chiave e risultato in cache (o None) per la generazione indicata.
+        La generazione è letta prima della ricerca e usata anche per salvarne
+        il risultato (_finish): un bump arrivato nel frattempo non lo fa
+        passare per aggiornato.
+        """
+        if self.cache is None:
+            return None, None
+        key = self._cache_key(query, mode)
+        entry = self.cache.get(key, generation)
+        return key, entry.cached_copy() if entry is not None else None
+
+    def _finish(self, key, generation, result):
+        self._record(result)
+        if self.cache is not None and result.complete:
+            self.cache.put(key, result, generation)
+        return result
+
+    def search(self, query, mode="all"):
+        """Ricerca su tutti gli indici della modalità con un solo _msearch."""
+        generation = self.generation.get(self.es) if self.cache is not None and self.generation is not None else None
+        key, cached = self._lookup(query, mode, generation)
+        if cached is not None:
+            return cached
+
+        searches = self.build_searches(query, mode)
+        t_start = time.perf_counter()
+        responses = multi_search(self.es, searches)
+        client_ms = (time.perf_counter() - t_start) * 1000
+
+        indices = [idx for idx, _ in searches]
+        return self._finish(key, generation, SearchResult(query, mode, indices, responses, client_ms))
+
+    async def search_async(self, es, query, mode="all"):
+        """
+        Variante asincrona (AsyncElasticsearch): una ricerca per indice,
+        eseguite in concorrenza. Stessa cache e stesse statistiche di search().
+        """
+        generation = await self.generation.get_async(es) if self.cache is not None and self.generation is not None else None
+        key, cached = self._lookup(query, mode, generation)
+        if cached is not None:
+            return cached
+
+        searches = self.build_searches(query, mode)
+        t_start = time.perf_counter()
+        responses = await asyncio.gather(
+            *(es.search(index=idx, **body) for idx, body in searches),
+            return_exceptions=True
+        )
+        client_ms = (time.perf_counter() - t_start) * 1000
+
+        # Un'eccezione su un indice diventa una risposta di errore (come in _msearch)
+        responses = [{"error": str(r)} if isinstance(r, Exception) else r.body for r in responses]
+        indices = [idx for idx, _ in searches]
+        return self._finish(key, generation, SearchResult(query, mode, indices, responses, client_ms))
+
+    def paginate(self, query, mode="all", prefetch=None, first_page=None):
+        """
+        Ricerca paginata (search_after su point in time) con le query del profilo.
+        first_page: coppie (indice, risposta) di una prima pagina già eseguita
+        (vedi PagedSearch): la ricerca continua dalla pagina 2.
+        """
+        return PagedSearch(self.es, self.build_searches(query, mode), self.page_size, prefetch=prefetch, first_page=first_page)
+
+    def first_page(self, query, mode="all", prefetch=None):
+        """
+        Prima pagina di una ricerca paginata: la stessa ricerca di search()
+        (un solo _msearch, senza PIT), in cache qualunque sia il numero di
+        risultati. Se ci sono altre pagine restituisce anche una PagedSearch
+        che riparte dai cursori della prima pagina (ultimo score per indice):
+        i PIT vengono aperti, in parallelo, solo quando serve la seconda pagina.
+        Restituisce: (SearchResult, PagedSearch oppure None se non ci sono altre pagine)
+        """
+        result = self.search(query, mode)
+        if not result.has_more:
+            return result, None
+        return result, self.paginate(query, mode, prefetch, first_page=result.pairs())
+
+    def _record(self, result):
+        with self._lock:
+            self.searches += 1
+            self._latencies.append(result.client_ms)
+            for timing in result.timings:
+                self._took.setdefault(timing["index"], deque(maxlen=LATENCY_WINDOW)).append(timing["took"])
+
+    def stats(self):
+        """Ricerche eseguite, percentili delle latenze recenti e contatori della cache."""
+        with self._lock:
+            latencies = list(self._latencies)
+            took = {idx: list(values) for idx, values in self._took.items()}
+            searches = self.searches
+        return {
+            "searches": searches,
+            "client_ms": {f"p{int(q * 100)}": round(v, 2) for q, v in percentiles(latencies).items()},
+            "server_took_ms": {
+                idx: {f"p{int(q * 100)}": round(v, 2) for q, v in percentiles(values).items()}
+                for idx, values in took.items()
+            },
+            "cache": self.cache.stats() if self.cache is not None else None
+        }
+
+    # ------------------------------------------------------------------
+    # Verifiche sugli indici (test/verify_*): richieste aggregate invece
+    # di una richiesta per sorgente o per documento
+    # ------------------------------------------------------------------
+
+    def source_counts(self, index):
+        """Totale e numero di documenti per sorgente con una sola richiesta (aggregazione terms)."""
+        resp = self.es.search(
+            index=index, size=0, track_total_hits=True,
+            aggs={"by_source": {"terms": {"field": "source"}}}
+        )
+        counts = {b["key"]: b["doc_count"] for b in resp["aggregations"]["by_source"]["buckets"]}
+        counts["total"] = resp["hits"]["total"]["value"]
+        return counts
+
+    def random_sample(self, index, source, size):
+        """Documenti casuali di una sorgente."""
+        resp = self.es.search(
+            index=index, size=size,
+            query={
+                "function_score": {
+                    "query": {"term": {"source": source}},
+                    "random_score": {},
+                    "boost_mode": "replace"
+                }
+            }
+        )
+        return resp["hits"]["hits"]
+
+    def find_documents(self, paper_ids, fields=("title",)):
+        """Documenti padre (per document_id) di più oggetti in una sola richiesta."""
+        paper_ids = sorted({p for p in paper_ids if p})
+        if not paper_ids:
+            return {}
+        resp = self.es.search(
+            index=Config.INDEX_DOCS,
+            size=len(paper_ids),
+            query={"terms": {"document_id": paper_ids}},
+            source={"includes": ["document_id", *fields]}
+        )
+        return {hit["_source"]["document_id"]: hit["_source"] for hit in resp["hits"]["hits"]}
+
+    def related_counts(self, paper_ids):
+        """
+        Figure e tabelle di ogni paper: un solo _msearch con un'aggregazione
+        per indice. Restituisce: {paper_id: {"figures": n, "tables": m}}
+        """
+        paper_ids = sorted({p for p in paper_ids if p})
+        counts = {p: {"figures": 0, "tables": 0} for p in paper_ids}
+        if not paper_ids:
+            return counts
+
+        kinds = [(Config.INDEX_FIGURES, "figures"), (Config.INDEX_TABLES, "tables")]
+        body = {
+            "size": 0,
+            "query": {"terms": {"paper_id": paper_ids}},
+            "aggs": {"by_paper": {"terms": {"field": "paper_id", "size": len(paper_ids)}}}
+        }
+        responses = multi_search(self.es, [(idx, body) for idx, _ in kinds])
+        for (_, kind), resp in zip(kinds, responses):
+            if "error" in resp:
+                continue
+            for bucket in resp["aggregations"]["by_paper"]["buckets"]:
+                counts[bucket["key"]][kind] = bucket["doc_count"]
+        return counts
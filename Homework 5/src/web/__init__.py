@@ -1 +1,8 @@
-from .app import app
\ No newline at end of file
+def __getattr__(name):
+    # L'app Flask (con servizio di ricerca e client ES) viene creata solo se
+    # richiesta: la variante asincrona (src.web.async_app) non la importa
+    if name == "app":
+        from .app import app
+        globals()["app"] = app
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
\ No newline at end of file
@@ -1,31 +1,81 @@
-from flask import Flask, render_template, request
-from src.core import get_es_client
+import time
+from flask import Flask, render_template, request, jsonify
+from src.core import es_health, start_health_monitor, ResultCache, IndexGeneration
+from src.search import SearchService, PagingSessions, collect_results
 from src.config import Config
 
 app = Flask(__name__)
 
-# Mappatura tra Indici Elasticsearch e "Tipi" visuali del Template HTML
-INDEX_TYPE_MAP = {
-    Config.INDEX_DOCS: "docs",
-    Config.INDEX_TABLES: "tables",
-    Config.INDEX_FIGURES: "figures"
-}
+# Servizio di ricerca (query, instradamento, _msearch, timing) condiviso con la shell.
+# Cache dei risultati delle query più frequenti (TTL + LRU), invalidata quando
+# la generazione degli indici cambia (re-indicizzazione completata): la
+# generazione è controllata a ogni lookup, riletta al più ogni WEB_CACHE_GENERATION_MAX_AGE s
+search_service = SearchService(
+    profile="web",
+    cache=ResultCache(Config.WEB_CACHE_SIZE, Config.WEB_CACHE_TTL),
+    generation=IndexGeneration()
+)
 
-def get_highlighted_snippet(hit, field_name, fallback_text="", length=300):
+# Ricerche paginate (cursori della prima pagina, poi search_after + point in time), indicate dal token del form
+paging_sessions = PagingSessions(Config.WEB_PAGING_SESSIONS)
+
+def execute_search(query, selected_mode):
+    """
+    Prima pagina della ricerca (un solo _msearch sugli indici della modalità,
+    senza PIT) oppure risultato in cache, anche se ci sono altre pagine.
+    Se ci sono altre pagine la ricerca resta in paging_sessions con i cursori
+    della prima pagina: i PIT vengono aperti solo se si chiede la seconda.
+    Restituisce: (risultati ordinati per score, tempi per indice, ms lato client, dalla cache, token della pagina successiva)
+    """
+    try:
+        if es_health()["ok"] is False:
+            raise ConnectionError(f"Elasticsearch non raggiungibile su {Config.ES_HOST} ({es_health()['error']})")
+
+        result, paged = search_service.first_page(query, selected_mode)
+        results, timings, _ = collect_results(result.indices, result.responses)
+        token = paging_sessions.add(paged) if paged is not None else None
+        return results, timings, result.client_ms, result.cached, token
+
+    except Exception as e:
+        print(f"Errore Search Web: {e}")
+        return [], [], None, False, None
+
+def execute_page(page, token):
     """
-    Estrae il testo evidenziato da ES. Se non c'è match, usa il testo originale troncato.
+    Pagina successiva di una ricerca aperta dalla prima pagina (search_after sullo
+    stesso point in time): un solo _msearch a qualunque profondità, coerente con
+    le pagine precedenti anche durante un refresh degli indici.
+    Le pagine già mostrate non vengono rieseguite: se la ricerca non è più aperta
+    (PIT scaduto, sessione rimossa) o la pagina non è la successiva restituisce None.
+    Restituisce: (risultati, tempi per indice, ms lato client, token per la pagina successiva) oppure None
     """
-    highlight = hit.get("highlight", {})
-    if field_name in highlight:
-        return "... " + " ... ".join(highlight[field_name]) + " ..."
-    
-    if not fallback_text:
-        return ""
-    
-    text_str = str(fallback_text)
-    if len(text_str) > length:
-        return text_str[:length] + "..."
-    return text_str
+    paged = paging_sessions.get(token) if token else None
+    if paged is None:
+        return None
+
+    try:
+        t_start = time.perf_counter()
+        page_data = paged.page_at(page)
+        client_ms = (time.perf_counter() - t_start) * 1000
+    except Exception as e:
+        print(f"Errore Search Web: {e}")
+        paging_sessions.drop(token)
+        return [], [], None, None
+
+    if page_data is None:
+        return None
+
+    results = []
+    timings = []
+    if page_data:
+        indices, responses = zip(*page_data)
+        results, timings, _ = collect_results(indices, responses)
+
+    if not paged.has_more:
+        paging_sessions.drop(token)
+        token = None
+
+    return results, timings, client_ms, token
 
 @app.route("/", methods=["GET", "POST"])
 def search():
@@ -33,113 +83,51 @@ def search():
     query = ""
     selected_mode = "all"
     total_hits = 0
+    timings = []
+    client_ms = None
+    cached = False
+    page = 1
+    next_token = None
+    notice = None
 
     if request.method == "POST":
         query = request.form.get("query", "").strip()
         selected_mode = request.form.get("mode", "all")
+        page = request.form.get("page", "1")
+        page = max(1, int(page)) if page.isdigit() else 1
         
         if query:
-            try:
-                es = get_es_client()
-                
-                indices_to_search = []
-                if selected_mode == "docs": indices_to_search = [Config.INDEX_DOCS]
-                elif selected_mode == "tables": indices_to_search = [Config.INDEX_TABLES]
-                elif selected_mode == "figures": indices_to_search = [Config.INDEX_FIGURES]
-                else: indices_to_search = [Config.INDEX_DOCS, Config.INDEX_TABLES, Config.INDEX_FIGURES]
-
-                for idx in indices_to_search:
-                    visual_type = INDEX_TYPE_MAP.get(idx, "docs")
-
-                    # Campi di ricerca specifici
-                    search_fields = ["*"]
-                    if visual_type == "docs":
-                        search_fields = ["title^3", "abstract^2", "full_text", "authors", "document_id"]
-                    elif visual_type == "tables":
-                        search_fields = ["caption^3", "body_content^2", "mentions", "context_paragraphs", "table_id"]
-                    elif visual_type == "figures":
-                        search_fields = ["caption^3", "mentions", "context_paragraphs", "figure_id"]
-
-                    body = {
-                        "query": {
-                            "query_string": {
-                                "query": query,
-                                "fields": search_fields,
-                                "default_operator": "AND"
-                            }
-                        },
-                        "highlight": {
-                            "fields": { "*": {} },
-                            "pre_tags": ["<mark>"],
-                            "post_tags": ["</mark>"],
-                            "fragment_size": 200,
-                            "number_of_fragments": 1
-                        },
-                        "size": 10
-                    }
-                    
-                    resp = es.search(index=idx, body=body)
-                    hits = resp['hits']['hits']
-                    
-                    for hit in hits:
-                        src = hit['_source']
-                        
-                        # Logica Titolo
-                        title_val = "Senza Titolo"
-                        
-                        if visual_type == "docs":
-                            # Documenti: Titolo Paper > Nome File > Fallback
-                            title_val = src.get("title") or src.get("paper_title_slug") or "Documento sconosciuto"
-                        else:
-                            # Media: Caption troncata > ID Figura > Fallback
-                            caption_raw = src.get("caption", "")
-                            if caption_raw:
-                                # Usa i primi 100 caratteri della caption come titolo "pulito"
-                                clean_cap = str(caption_raw).strip()
-                                title_val = clean_cap[:100] + ("..." if len(clean_cap) > 100 else "")
-                            else:
-                                # Fallback su ID (es. "Figure 1", "Table S2")
-                                obj_id = src.get("figure_id") or src.get("table_id")
-                                title_val = f"Oggetto: {obj_id}" if obj_id else "Immagine senza descrizione"
-
-                        # Snippet Primario (Abstract o Caption evidenziata)
-                        if visual_type == "docs":
-                            prim_text = get_highlighted_snippet(hit, "abstract", src.get("abstract"))
-                        else:
-                            prim_text = get_highlighted_snippet(hit, "caption", src.get("caption"))
-                        
-                        # Snippet Secondario (Contesto o Full Text)
-                        sec_text = ""
-                        if visual_type == "docs":
-                            if "full_text" in hit.get("highlight", {}):
-                                sec_text = get_highlighted_snippet(hit, "full_text")
-                        else:
-                            sec_text = get_highlighted_snippet(hit, "context_paragraphs", src.get("context_paragraphs"))
-                            if not sec_text:
-                                sec_text = get_highlighted_snippet(hit, "mentions", src.get("mentions"))
-
-                        res_item = {
-                            "type": visual_type,
-                            "score": hit['_score'],
-                            "paper_id": src.get("document_id") or src.get("paper_id"),
-                            "title_or_slug": title_val, # Qui ora c'è la caption troncata!
-                            "url": src.get("pdf_url") or src.get("img_url"),
-                            "primary_text": prim_text,
-                            "secondary_text": sec_text,
-                            "source_data": src
-                        }
-                        results.append(res_item)
-
-                results.sort(key=lambda x: x['score'], reverse=True)
-                total_hits = len(results)
-
-            except Exception as e:
-                print(f"Errore Search Web: {e}")
+            # Connettività verificata in background (thread avviato alla prima
+            # ricerca): nessun ping sul percorso della richiesta
+            start_health_monitor()
+
+            paged_result = execute_page(page, request.form.get("token")) if page > 1 else None
+            if paged_result is not None:
+                results, timings, client_ms, next_token = paged_result
+            else:
+                if page > 1:
+                    notice = "La ricerca paginata non è più disponibile: risultati dalla prima pagina."
+                    page = 1
+                results, timings, client_ms, cached, next_token = execute_search(query, selected_mode)
+
+            total_hits = len(results)
 
     return render_template(
         "search.html", 
         results=results, 
         query=query, 
         selected_mode=selected_mode,
-        total_hits=total_hits
-    )
\ No newline at end of file
+        total_hits=total_hits,
+        timings=timings,
+        client_ms=client_ms,
+        cached=cached,
+        page=page,
+        has_next=next_token is not None,
+        next_token=next_token,
+        notice=notice
+    )
+
+@app.route("/stats")
+def stats():
+    """Statistiche del servizio di ricerca (latenze, cache) e stato di Elasticsearch."""
+    return jsonify({"search": search_service.stats(), "es": es_health()})
\ No newline at end of file
@@ -0,0 +1,95 @@
+import os
+import asyncio
+from aiohttp import web
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from src.core import build_async_es_client, ResultCache, IndexGeneration, new_health_state, health_monitor_async
+from src.search import SearchService, collect_results
+from src.config import Config
+
+# Variante asincrona dell'app web (aiohttp + AsyncElasticsearch): le richieste
+# non occupano un thread durante l'attesa di Elasticsearch e le query sui
+# singoli indici partono in concorrenza (asyncio.gather).
+
+WEB_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Stesso template dell'app Flask (url_for limitato ai file statici)
+templates = Environment(
+    loader=FileSystemLoader(os.path.join(WEB_DIR, "templates")),
+    autoescape=select_autoescape(["html"])
+)
+templates.globals["url_for"] = lambda endpoint, filename="": f"/static/{filename}"
+
+ES_KEY = web.AppKey("es", object)
+SERVICE_KEY = web.AppKey("service", SearchService)
+HEALTH_KEY = web.AppKey("health", dict)
+
+
+async def search(request):
+    results = []
+    query = ""
+    selected_mode = "all"
+    timings = []
+    client_ms = None
+    cached = False
+
+    if request.method == "POST":
+        form = await request.post()
+        query = form.get("query", "").strip()
+        selected_mode = form.get("mode", "all")
+
+        if query:
+            health = request.app[HEALTH_KEY]
+            if health["ok"] is False:
+                print(f"Errore Search Web: Elasticsearch non raggiungibile su {Config.ES_HOST} ({health['error']})")
+            else:
+                try:
+                    # Una ricerca per indice, eseguite in concorrenza (o risultato in cache)
+                    result = await request.app[SERVICE_KEY].search_async(request.app[ES_KEY], query, selected_mode)
+                    results, timings, _ = collect_results(result.indices, result.responses)
+                    client_ms = result.client_ms
+                    cached = result.cached
+                except Exception as e:
+                    print(f"Errore Search Web: {e}")
+
+    html = templates.get_template("search.html").render(
+        results=results,
+        query=query,
+        selected_mode=selected_mode,
+        total_hits=len(results),
+        timings=timings,
+        client_ms=client_ms,
+        cached=cached
+    )
+    return web.Response(text=html, content_type="text/html")
+
+
+async def stats(request):
+    """Statistiche del servizio di ricerca (latenze, cache) e stato di Elasticsearch."""
+    return web.json_response({"search": request.app[SERVICE_KEY].stats(), "es": request.app[HEALTH_KEY]})
+
+
+async def es_context(app):
+    # Client e pool di connessioni condivisi da tutte le richieste dell'event loop
+    app[ES_KEY] = build_async_es_client()
+    # Health check in background (fuori dal percorso delle richieste), come nell'app Flask
+    monitor = asyncio.create_task(health_monitor_async(app[ES_KEY], app[HEALTH_KEY]))
+    yield
+    monitor.cancel()
+    await app[ES_KEY].close()
+
+
+def create_app():
+    app = web.Application()
+    app[HEALTH_KEY] = new_health_state()
+    # Cache invalidata dalla generazione degli indici, controllata a ogni lookup
+    app[SERVICE_KEY] = SearchService(
+        profile="web",
+        cache=ResultCache(Config.WEB_CACHE_SIZE, Config.WEB_CACHE_TTL),
+        generation=IndexGeneration()
+    )
+    app.cleanup_ctx.append(es_context)
+    app.router.add_route("GET", "/", search)
+    app.router.add_route("POST", "/", search)
+    app.router.add_get("/stats", stats)
+    app.router.add_static("/static", os.path.join(WEB_DIR, "static"))
+    return app
@@ -0,0 +1,74 @@
+# per eseguire: python -m test.benchmark_arxiv_layout
+# Micro-benchmark della visita delle figure ArXiv (LaTeXML) su un paper
+# sintetico di grandi dimensioni. Non richiede Elasticsearch.
+
+import time
+from bs4 import BeautifulSoup
+from src.core.utils import clean_text
+from src.processing.extractor import walk_arxiv_layout, resolve_parser, _get_attr_str
+from test.benchmark_mentions import build_latexml_paper
+
+
+def _legacy_layout(soup):
+    """Implementazione precedente: find_all/find_parent per ogni figura e caption."""
+    out = []
+    for fig in soup.find_all("figure", class_="ltx_figure"):
+        if "ltx_table" in _get_attr_str(fig, "class"):
+            continue
+        if fig.find_parent("figure", class_="ltx_figure"):
+            continue
+        sub_figures = fig.find_all("figure", class_="ltx_figure")
+        if not sub_figures:
+            continue
+        direct_captions = [
+            c for c in fig.find_all("figcaption")
+            if c.find_parent("figure", class_="ltx_figure") == fig
+        ]
+        main_caption = " ".join(clean_text(c.get_text()) for c in direct_captions)
+        for sub in sub_figures:
+            sub_caption = " ".join(clean_text(c.get_text()) for c in sub.find_all("figcaption"))
+            img = sub.find("img")
+            out.append((_get_attr_str(sub, "id"), f"{sub_caption} {main_caption}".strip(), _get_attr_str(img, "src")))
+    tables = [_get_attr_str(t, "id") for t in soup.find_all("figure", class_="ltx_table")]
+    return out, tables
+
+
+def _walker_layout(soup):
+    """Stesso risultato tramite walk_arxiv_layout (una sola visita dell'albero)."""
+    layout = walk_arxiv_layout(soup)
+    out = []
+    for node in layout["figures"]:
+        if not node["top_level"] or "ltx_table" in _get_attr_str(node["tag"], "class"):
+            continue
+        main_caption = " ".join(clean_text(c.get_text()) for c in node["direct_captions"])
+        for sub in node["subfigures"]:
+            sub_caption = " ".join(clean_text(c.get_text()) for c in sub["captions"])
+            out.append((_get_attr_str(sub["tag"], "id"), f"{sub_caption} {main_caption}".strip(), _get_attr_str(sub["img"], "src")))
+    tables = [_get_attr_str(t, "id") for t in layout["tables"]]
+    return out, tables
+
+
+def benchmark_layout():
+    html = build_latexml_paper()
+    soup = BeautifulSoup(html, resolve_parser())
+
+    print("\nBenchmark visita figure ArXiv")
+    print(f"HTML: {len(html) / 1024:.0f} KB")
+
+    t_start = time.perf_counter()
+    legacy = _legacy_layout(soup)
+    legacy_time = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    walked = _walker_layout(soup)
+    walker_time = time.perf_counter() - t_start
+
+    print(f"find_all / find_parent:   {legacy_time * 1000:.1f} ms")
+    print(f"Visita singola (DFS):     {walker_time * 1000:.1f} ms")
+    print(f"Speedup:                  {legacy_time / walker_time:.1f}x")
+    print(f"Figure: {len(walked[0])} | Tabelle: {len(walked[1])}")
+    print(f"Risultati identici:       {legacy == walked}")
+
+
+if __name__ == "__main__":
+    benchmark_layout()
@@ -0,0 +1,120 @@
+# per eseguire: python -m test.benchmark_mentions
+# Micro-benchmark della ricerca delle menzioni su un paper LaTeXML sintetico
+# di grandi dimensioni (centinaia di figure). Non richiede Elasticsearch.
+
+import random
+import time
+from bs4 import BeautifulSoup
+from src.core.utils import clean_text
+from src.processing.extractor import build_reference_index, _find_mentions, resolve_parser
+
+N_FIGURES = 200         # Figure principali (ognuna con 2 sotto-figure)
+N_TABLES = 40           # Tabelle
+N_PARAGRAPHS = 1000     # Paragrafi di testo
+LINKS_PER_PARAGRAPH = 3 # Riferimenti (link #id) per paragrafo
+
+WORDS = (
+    "speech synthesis neural vocoder attention transformer latency prosody "
+    "spectrogram dataset evaluation baseline model training acoustic speaker"
+).split()
+
+
+def _sentence(n):
+    return " ".join(random.choice(WORDS) for _ in range(n))
+
+
+def build_latexml_paper():
+    """Genera un HTML in stile LaTeXML con figure annidate, tabelle e riferimenti."""
+    random.seed(42)
+    parts = ['<html><head><base href="/html/0000.00000v1/"></head><body>']
+
+    for i in range(1, N_FIGURES + 1):
+        parts.append(
+            f'<figure class="ltx_figure" id="S1.F{i}">'
+            f'<figure class="ltx_figure" id="S1.F{i}.sf1"><img src="x{i}a.png"><figcaption>(a) {_sentence(5)}</figcaption></figure>'
+            f'<figure class="ltx_figure" id="S1.F{i}.sf2"><img src="x{i}b.png"><figcaption>(b) {_sentence(5)}</figcaption></figure>'
+            f'<figcaption>Figure {i}: {_sentence(10)}</figcaption></figure>'
+        )
+
+    for i in range(1, N_TABLES + 1):
+        parts.append(
+            f'<figure class="ltx_table" id="S1.T{i}"><figcaption>Table {i}: {_sentence(8)}</figcaption>'
+            f'<table><tr><td>{_sentence(6)}</td></tr></table></figure>'
+        )
+
+    for _ in range(N_PARAGRAPHS):
+        links = []
+        for _ in range(LINKS_PER_PARAGRAPH):
+            if random.random() < 0.8:
+                target = f"S1.F{random.randint(1, N_FIGURES)}"
+                if random.random() < 0.3:
+                    target += f".sf{random.randint(1, 2)}"
+            else:
+                target = f"S1.T{random.randint(1, N_TABLES)}"
+            links.append(f'see <a href="#{target}">ref</a>')
+        parts.append(f"<p>{_sentence(40)} {' '.join(links)}</p>")
+
+    parts.append("</body></html>")
+    return "".join(parts)
+
+
+def _legacy_find_mentions(p_tags, p_texts, target_id):
+    """Implementazione precedente: scansione di tutti i paragrafi e link per ogni oggetto."""
+    mentions = []
+    indices = set()
+    ref_link = f"#{target_id}"
+    for i, p in enumerate(p_tags):
+        for link in p.find_all("a", href=True):
+            if str(link['href']).endswith(ref_link):
+                mentions.append(p_texts[i])
+                indices.add(i)
+                break
+    return mentions, indices
+
+
+def benchmark_mentions():
+    html = build_latexml_paper()
+    soup = BeautifulSoup(html, resolve_parser())
+
+    p_tags = [p for p in soup.find_all("p") if len(p.get_text()) > 50]
+    p_texts = [clean_text(p.get_text()) for p in p_tags]
+
+    # Stesso schema di lookup dell'estrattore ArXiv: per ogni sotto-figura
+    # si cercano sia l'id della figura padre sia quello della sotto-figura
+    targets = []
+    for i in range(1, N_FIGURES + 1):
+        for sub in (1, 2):
+            targets.append(f"S1.F{i}")
+            targets.append(f"S1.F{i}.sf{sub}")
+    targets += [f"S1.T{i}" for i in range(1, N_TABLES + 1)]
+
+    print("\nBenchmark ricerca menzioni")
+    print(f"Paragrafi: {len(p_tags)} | Lookup: {len(targets)} | HTML: {len(html) / 1024:.0f} KB")
+
+    t_start = time.perf_counter()
+    legacy = [_legacy_find_mentions(p_tags, p_texts, t) for t in targets]
+    legacy_time = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    ref_index = build_reference_index(p_tags)
+    build_time = time.perf_counter() - t_start
+
+    t_start = time.perf_counter()
+    indexed = [_find_mentions(ref_index, t) for t in targets]
+    lookup_time = time.perf_counter() - t_start
+
+    # L'estrattore usa solo gli indici: i testi si ricavano da p_texts
+    identical = all(
+        indices == found and sorted(mentions) == sorted(p_texts[i] for i in found)
+        for (mentions, indices), found in zip(legacy, indexed)
+    )
+
+    print(f"Scansione lineare:        {legacy_time * 1000:.1f} ms")
+    print(f"Indice (costruzione):     {build_time * 1000:.1f} ms")
+    print(f"Indice (lookup totali):   {lookup_time * 1000:.1f} ms")
+    print(f"Speedup:                  {legacy_time / (build_time + lookup_time):.0f}x")
+    print(f"Risultati identici:       {identical}")
+
+
+if __name__ == "__main__":
+    benchmark_mentions()
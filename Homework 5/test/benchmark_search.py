@@ -0,0 +1,173 @@
+# per eseguire: python -m test.benchmark_search --workload test/search_workload.jsonl
+# Benchmark riproducibile delle ricerche (sostituisce i timer manuali
+# dell'Esperimento 5 in run_shell.py). Ogni riga del workload è una
+# ricerca {"mode": "all|docs|tables|figures", "query": "..."}, eseguita come
+# fanno shell e app web: un _msearch sugli indici della modalità.
+# Riporta latenze lato client e "took" lato server (percentili), throughput
+# e salva un file JSON confrontabile tra run (--compare risultato.json).
+
+import os
+import json
+import time
+import hashlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from src.config import Config
+from src.core import get_es_client
+from src.core.metrics import percentiles
+from src.search import SearchService, MODES
+
+BENCH_QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+def load_workload(path):
+    """Legge il workload (JSON lines); le righe vuote vengono ignorate."""
+    items = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                items.append({"mode": item.get("mode", "all"), "query": item["query"]})
+    return items
+
+
+def run_one(service, item):
+    # Stesso percorso di shell e app web (SearchService, un solo _msearch), senza cache
+    t_start = time.perf_counter()
+    try:
+        result = service.search(item["query"], item["mode"])
+    except Exception as e:
+        return {"item": item, "client_ms": (time.perf_counter() - t_start) * 1000, "error": str(e), "took": {}}
+
+    took = {t["index"]: t["took"] for t in result.timings}
+    errors = [f"{idx}: {resp['error']}" for idx, resp in result.pairs() if "error" in resp]
+    return {"item": item, "client_ms": result.client_ms, "error": "; ".join(errors) or None, "took": took}
+
+
+def _stats(values):
+    if not values:
+        return {}
+    row = {f"p{int(q * 100)}": round(v, 3) for q, v in percentiles(values, BENCH_QUANTILES).items()}
+    row["mean"] = round(sum(values) / len(values), 3)
+    row["max"] = round(max(values), 3)
+    row["n"] = len(values)
+    return row
+
+
+def environment(es):
+    """Versione di ES, documenti e impronta del mapping di ogni indice (per confrontare i run)."""
+    env = {"es_version": es.info()["version"]["number"], "indices": {}}
+    for idx in MODES["all"]:
+        try:
+            mapping = es.indices.get_mapping(index=idx).body
+            digest = hashlib.sha256(json.dumps(mapping, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+            env["indices"][idx] = {"docs": es.count(index=idx)["count"], "mapping_sha": digest}
+        except Exception as e:
+            env["indices"][idx] = {"error": str(e)}
+    return env
+
+
+def run_benchmark(workload, profile="shell", concurrency=1, warmup=1, iterations=3):
+    es = get_es_client()
+    service = SearchService(es, profile=profile)
+
+    if concurrency > Config.ES_POOL_MAXSIZE:
+        print(f"[BENCH] Concorrenza {concurrency} > ES_POOL_MAXSIZE={Config.ES_POOL_MAXSIZE}: le connessioni oltre il pool non vengono riusate")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # Warm-up: cache del filesystem, dei segmenti e connessioni (non misurato)
+        for _ in range(warmup):
+            list(pool.map(lambda item: run_one(service, item), workload))
+
+        t_start = time.perf_counter()
+        samples = list(pool.map(lambda item: run_one(service, item), workload * iterations))
+        duration = time.perf_counter() - t_start
+
+    ok = [s for s in samples if not s["error"]]
+    took_by_index = {}
+    for s in ok:
+        for idx, took in s["took"].items():
+            took_by_index.setdefault(idx, []).append(took)
+
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "profile": profile,
+            "concurrency": concurrency,
+            "warmup": warmup,
+            "iterations": iterations,
+            "workload_size": len(workload),
+            "workload_sha": hashlib.sha256(json.dumps(workload, sort_keys=True).encode("utf-8")).hexdigest()[:12],
+            "es_host": Config.ES_HOST,
+            "es_pool_maxsize": Config.ES_POOL_MAXSIZE
+        },
+        "environment": environment(es),
+        "results": {
+            "requests": len(samples),
+            "errors": len(samples) - len(ok),
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(samples) / duration, 2) if duration else 0.0,
+            "client_ms": _stats([s["client_ms"] for s in ok]),
+            "server_took_ms": {idx: _stats(values) for idx, values in took_by_index.items()},
+            "client_ms_by_mode": {
+                mode: _stats([s["client_ms"] for s in ok if s["item"]["mode"] == mode])
+                for mode in MODES if any(s["item"]["mode"] == mode for s in ok)
+            }
+        },
+        "error_samples": [s["error"] for s in samples if s["error"]][:5]
+    }
+
+
+def print_report(report, baseline=None):
+    res = report["results"]
+    cfg = report["config"]
+    print(f"\n=== SEARCH BENCHMARK ({cfg['profile']}, concorrenza {cfg['concurrency']}) ===")
+    print(f"Richieste: {res['requests']} | Errori: {res['errors']} | Durata: {res['duration_s']:.2f}s | Throughput: {res['throughput_rps']:.1f} req/s")
+
+    def line(label, row, base=None):
+        if not row:
+            return
+        text = f"   {label:<16} p50={row['p50']:.1f} p95={row['p95']:.1f} p99={row['p99']:.1f} max={row['max']:.1f} ms"
+        if base:
+            text += f"  (p50 {row['p50'] - base['p50']:+.1f}, p99 {row['p99'] - base['p99']:+.1f})"
+        print(text)
+
+    base = baseline["results"] if baseline else {}
+    print("Client:")
+    line("totale", res["client_ms"], base.get("client_ms"))
+    for mode, row in res["client_ms_by_mode"].items():
+        line(mode, row, base.get("client_ms_by_mode", {}).get(mode))
+    print("Server (took):")
+    for idx, row in res["server_took_ms"].items():
+        line(idx, row, base.get("server_took_ms", {}).get(idx))
+    if baseline:
+        print(f"Throughput rispetto al baseline: {res['throughput_rps'] - base['throughput_rps']:+.1f} req/s")
+    for err in report["error_samples"]:
+        print(f"   Errore: {err}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark delle ricerche su Elasticsearch")
+    parser.add_argument("--workload", default=os.path.join("test", "search_workload.jsonl"), help="File JSON lines con mode e query")
+    parser.add_argument("--profile", choices=["shell", "web"], default="shell", help="Query costruite come nella shell o nell'app web")
+    parser.add_argument("-c", "--concurrency", type=int, default=1, help="Ricerche concorrenti")
+    parser.add_argument("--warmup", type=int, default=1, help="Passate di riscaldamento sul workload (non misurate)")
+    parser.add_argument("--iterations", type=int, default=3, help="Passate misurate sul workload")
+    parser.add_argument("--output", default=None, help="File JSON dei risultati (default: data/metrics/search_benchmark_<data>.json)")
+    parser.add_argument("--compare", default=None, help="Risultato JSON di un run precedente da confrontare")
+    args = parser.parse_args()
+
+    report = run_benchmark(load_workload(args.workload), args.profile, args.concurrency, args.warmup, args.iterations)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    output = args.output or os.path.join(Config.METRICS_DIR, f"search_benchmark_{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=1)
+    print(f"Risultati salvati in {output}")
@@ -0,0 +1,280 @@
+# per eseguire: python -m test.load_test_web --stub-es 20 --compare
+# Load test dell'app web: richieste concorrenti di ricerca (POST /), con
+# misura di req/s e latenze p50/p95/p99 lato client.
+#   --url URL          server già avviato (per misurare Elasticsearch e non la
+#                      cache, avviarlo con WEB_CACHE_SIZE=0)
+#   --stub-es MS       (con --compare) stub di Elasticsearch con MS ms di latenza per ricerca
+#   --compare          avvia l'app Flask (sincrona) e quella aiohttp (asincrona)
+#                      sullo stesso Elasticsearch e le confronta; prima del carico
+#                      verifica che la prima pagina di una ricerca su più pagine
+#                      arrivi dalla cache e che la seconda continui dai suoi cursori
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+import aiohttp
+from aiohttp import web
+from src.core.metrics import percentiles
+
+DEFAULT_QUERIES = ["speech", "neural AND vocoder", "cardiovascular risk", "ultra-processed foods", "transformer"]
+
+# Risultati per indice dello stub: due pagine da 10 nell'app web
+STUB_HITS = 20
+
+
+# ----------------------------------------------------------------------
+# Stub di Elasticsearch (solo le API usate dall'app web)
+# ----------------------------------------------------------------------
+
+def _stub_response(index, latency_ms, body=None):
+    # STUB_HITS risultati per indice con score decrescente; sul point in time
+    # ordinamento (score, _shard_doc) e search_after come in Elasticsearch
+    body = body or {}
+    pit = "pit" in body
+    after = body.get("search_after")
+    hits = []
+    for i in range(STUB_HITS):
+        score = 1.0 / (i + 1)
+        if after is not None and not (-score, i) > (-after[0], after[1]):
+            continue
+        hit = {
+            "_index": index, "_id": f"{index}-{i}", "_score": score,
+            "_source": {"paper_id": f"p{i}", "document_id": f"p{i}", "title": f"Paper {i}",
+                        "caption": f"Caption {i}", "abstract": "abstract " * 20,
+                        "body_content": "cell " * 20, "context_paragraphs": [], "mentions": []},
+            "highlight": {"caption": ["<mark>Caption</mark>"]}
+        }
+        if pit:
+            hit["sort"] = [score, i]
+        hits.append(hit)
+    resp = {"took": int(latency_ms), "timed_out": False, "hits": {"hits": hits[:body.get("size", 10)]}}
+    if body.get("track_total_hits", True):
+        resp["hits"]["total"] = {"value": STUB_HITS, "relation": "eq"}
+    return resp
+
+
+def build_stub_es(latency_ms):
+    headers = {"X-Elastic-Product": "Elasticsearch"}
+
+    async def info(request):
+        return web.json_response({"version": {"number": "9.2.0"}, "tagline": "You Know, for Search"}, headers=headers)
+
+    async def search(request):
+        await asyncio.sleep(latency_ms / 1000)
+        body = await request.json() if request.can_read_body else None
+        return web.json_response(_stub_response(request.match_info["index"], latency_ms, body), headers=headers)
+
+    async def msearch(request):
+        lines = [json.loads(l) for l in (await request.text()).splitlines() if l.strip()]
+        # Il server esegue le ricerche di un _msearch in parallelo
+        await asyncio.sleep(latency_ms / 1000)
+        responses = []
+        for header, body in zip(lines[0::2], lines[1::2]):
+            # Ricerche su point in time: l'indice è nell'id del PIT
+            index = header.get("index") or body["pit"]["id"].split(":", 1)[1]
+            responses.append(_stub_response(index, latency_ms, body))
+        return web.json_response({"took": int(latency_ms), "responses": responses}, headers=headers)
+
+    async def open_pit(request):
+        return web.json_response({"id": f"pit:{request.match_info['index']}"}, headers=headers)
+
+    async def close_pit(request):
+        return web.json_response({"succeeded": True, "num_freed": 1}, headers=headers)
+
+    async def get_doc(request):
+        return web.json_response({"found": False}, status=404, headers=headers)
+
+    app = web.Application()
+    app.router.add_get("/", info)    # registra anche HEAD (ping)
+    app.router.add_post("/_msearch", msearch)
+    app.router.add_post("/{index}/_search", search)
+    app.router.add_post("/{index}/_pit", open_pit)
+    app.router.add_delete("/_pit", close_pit)
+    app.router.add_get("/{index}/_doc/{id}", get_doc)
+    return app
+
+
+def start_stub_es(latency_ms):
+    """Avvia lo stub in un thread con un proprio event loop; restituisce l'URL."""
+    port = _free_port()
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(build_stub_es(latency_ms))
+    loop.run_until_complete(runner.setup())
+    loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", port).start())
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f"http://127.0.0.1:{port}"
+
+
+# ----------------------------------------------------------------------
+# Server web da confrontare
+# ----------------------------------------------------------------------
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(kind, es_host, cache=False):
+    """Avvia l'app "sync" (Flask) o "async" (aiohttp) in un sottoprocesso (senza cache se non richiesta)."""
+    port = _free_port()
+    env = {**os.environ, "ES_HOST": es_host}
+    if not cache:
+        env["WEB_CACHE_SIZE"] = "0"
+    if kind == "sync":
+        cmd = [sys.executable, "-c", f"from src.web.app import app; app.run(port={port}, threaded=True)"]
+    else:
+        cmd = [sys.executable, "run_web_async.py", "--port", str(port)]
+    proc = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f"http://127.0.0.1:{port}/"
+    for _ in range(100):
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.1):
+                return proc, url
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f"Server {kind} non avviato")
+
+
+# ----------------------------------------------------------------------
+# Verifica della cache su una ricerca con più pagine (app sincrona)
+# ----------------------------------------------------------------------
+
+def check_paged_cache(es_host, query, mode):
+    """
+    La prima pagina di una ricerca su più pagine va in cache con i suoi cursori:
+    la seconda richiesta della stessa query è un hit e la pagina 2 (PIT aperto
+    solo ora) continua dall'ultimo risultato della prima.
+    Restituisce True se la verifica è riuscita.
+    """
+    proc, url = start_server("sync", es_host, cache=True)
+    try:
+        async def run():
+            async with aiohttp.ClientSession() as session:
+                pages = []
+                for data in ({}, {}, "page2"):
+                    if data == "page2":
+                        data = {"page": "2", "token": _token(pages[-1])}
+                    async with session.post(url, data={"query": query, "mode": mode, **data}) as resp:
+                        pages.append(await resp.text())
+                return pages
+
+        first, second, page2 = asyncio.run(run())
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    checks = {
+        "prima richiesta non in cache": "(dalla cache)" not in first,
+        "seconda richiesta dalla cache": "(dalla cache)" in second,
+        "pagina successiva disponibile dalla cache": _token(second) is not None,
+        "pagina 2 servita": "(pagina 2)" in page2 and "non è più disponibile" not in page2,
+        # Lo stub restituisce i risultati 0-9 in prima pagina e 10-19 nella seconda
+        "pagina 2 continua dalla prima": "Caption 10" in page2 and "Caption 10" not in second
+    }
+    for label, ok in checks.items():
+        print(f"   [{'OK' if ok else 'ERRORE'}] {label}")
+    return all(checks.values())
+
+
+def _token(html):
+    marker = 'name="token" value="'
+    start = html.find(marker)
+    if start < 0:
+        return None
+    start += len(marker)
+    return html[start:html.index('"', start)] or None
+
+
+# ----------------------------------------------------------------------
+# Generatore di carico
+# ----------------------------------------------------------------------
+
+async def _load(url, queries, mode, concurrency, n_requests):
+    latencies = []
+    errors = 0
+    counter = iter(range(n_requests))
+
+    async def worker(session):
+        nonlocal errors
+        for i in counter:
+            data = {"query": queries[i % len(queries)], "mode": mode}
+            t_start = time.perf_counter()
+            try:
+                async with session.post(url, data=data) as resp:
+                    await resp.read()
+                    if resp.status != 200:
+                        errors += 1
+            except aiohttp.ClientError:
+                errors += 1
+            latencies.append((time.perf_counter() - t_start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        # Warm-up (connessioni e client Elasticsearch del server)
+        async with session.post(url, data={"query": queries[0], "mode": mode}) as resp:
+            await resp.read()
+        t_start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - t_start
+
+    return latencies, errors, elapsed
+
+
+def run_load(label, url, queries, mode, concurrency, n_requests):
+    latencies, errors, elapsed = asyncio.run(_load(url, queries, mode, concurrency, n_requests))
+    pct = percentiles(latencies, (0.5, 0.95, 0.99))
+    print(
+        f"{label:<8} {len(latencies) / elapsed:8.1f} req/s | "
+        f"p50 {pct[0.5]:7.1f} ms | p95 {pct[0.95]:7.1f} ms | p99 {pct[0.99]:7.1f} ms | errori {errors}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test della ricerca web")
+    parser.add_argument("--url", default="http://localhost:5000/", help="URL del server da misurare")
+    parser.add_argument("--stub-es", type=float, default=None, metavar="MS", help="Usa uno stub di Elasticsearch con MS ms di latenza")
+    parser.add_argument("--compare", action="store_true", help="Avvia e confronta app sincrona e asincrona")
+    parser.add_argument("-c", "--concurrency", type=int, default=32, help="Richieste concorrenti")
+    parser.add_argument("-n", "--requests", type=int, default=1000, help="Numero di richieste")
+    parser.add_argument("--mode", default="all", choices=["all", "docs", "tables", "figures"])
+    parser.add_argument("--queries", default=None, help="File con una query per riga")
+    args = parser.parse_args()
+    if args.stub_es is not None and not args.compare:
+        parser.error("--stub-es richiede --compare (i server vengono avviati dallo script)")
+
+    queries = DEFAULT_QUERIES
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            queries = [l.strip() for l in f if l.strip()]
+
+    print(f"\nLoad test: {args.requests} richieste, concorrenza {args.concurrency}, modalità '{args.mode}'")
+
+    if not args.compare:
+        run_load("server", args.url, queries, args.mode, args.concurrency, args.requests)
+        sys.exit(0)
+
+    es_host = os.getenv("ES_HOST", "http://localhost:9200")
+    if args.stub_es is not None:
+        es_host = start_stub_es(args.stub_es)
+        print(f"Stub Elasticsearch su {es_host} ({args.stub_es:.0f} ms per ricerca)")
+
+    print(f"Cache di una ricerca su più pagine ('{queries[0]}'):")
+    if not check_paged_cache(es_host, queries[0], args.mode):
+        sys.exit(1)
+
+    for kind in ("sync", "async"):
+        proc, url = start_server(kind, es_host)
+        try:
+            run_load(kind, url, queries, args.mode, args.concurrency, args.requests)
+        finally:
+            proc.terminate()
+            proc.wait()
@@ -1,17 +1,17 @@
 # per eseguire: python -m test.verify_content
 
 from src.core.es import get_es_client
+from src.search import SearchService
 from src.config import Config
 
 def verify_content():
 
     # Connessione ES
     es = get_es_client()
+    service = SearchService(es)
     
     # Indici
     INDEX_DOCS = Config.INDEX_DOCS
-    INDEX_TABLES = Config.INDEX_TABLES
-    INDEX_FIGURES = Config.INDEX_FIGURES
 
     source_to_check = 'arxiv'  # 'arxiv' o 'pubmed'
     NUM_DOCS_TO_SHOW = 2 
@@ -24,56 +24,34 @@ def verify_content():
         print(f"L'indice '{INDEX_DOCS}' non esiste.")
         return
 
-    # Conteggi totali
-    count = es.count(index=INDEX_DOCS)['count']
-    print(f"Totale documenti in '{INDEX_DOCS}': {count}")
-
-    query_arxiv = {"query": {"term": {"source": "arxiv"}}}
-    count_arxiv = es.count(index=INDEX_DOCS, body=query_arxiv)['count']
-    print(f"Documenti ArXiv:  {count_arxiv}")
-
-    query_pubmed = {"query": {"term": {"source": "pubmed"}}}
-    count_pubmed = es.count(index=INDEX_DOCS, body=query_pubmed)['count']
-    print(f"Documenti PubMed: {count_pubmed}")
+    # Conteggi totali e per sorgente (una sola richiesta con aggregazione)
+    counts = service.source_counts(INDEX_DOCS)
+    print(f"Totale documenti in '{INDEX_DOCS}': {counts['total']}")
+    print(f"Documenti ArXiv:  {counts.get('arxiv', 0)}")
+    print(f"Documenti PubMed: {counts.get('pubmed', 0)}")
     
     # Recupero documenti
     print(f"Recupero {NUM_DOCS_TO_SHOW} documenti con source='{source_to_check}'")
 
-    search_body = {
-        "query": {
-            "function_score": {
-                "query": {"term": {"source": source_to_check}}, 
-                "random_score": {}, 
-                "boost_mode": "replace"
-            }
-        },
-        "size": NUM_DOCS_TO_SHOW 
-    }
-    
-    resp = es.search(index=INDEX_DOCS, body=search_body)
-    hits = resp['hits']['hits']
+    hits = service.random_sample(INDEX_DOCS, source_to_check, NUM_DOCS_TO_SHOW)
     
     if not hits:
         print(f"\nNessun documento trovato per source='{source_to_check}'.")
         return
 
+    # Figure e tabelle collegate a tutti i documenti con un solo _msearch
+    # (invece di due conteggi per documento)
+    related = service.related_counts(hit['_source'].get('document_id') for hit in hits)
+
     # Ciclo risultati
     for i, hit in enumerate(hits, 1):
         doc = hit['_source']
         es_id = hit['_id']
         doc_id = doc.get('document_id')
 
-        # Contiamo figure e tabelle collegate
-        n_figures = 0
-        n_tables = 0
-        if doc_id:
-            if es.indices.exists(index=INDEX_FIGURES):
-                q_fig = {"query": {"term": {"paper_id": doc_id}}}
-                n_figures = es.count(index=INDEX_FIGURES, body=q_fig)['count']
-            
-            if es.indices.exists(index=INDEX_TABLES):
-                q_tab = {"query": {"term": {"paper_id": doc_id}}}
-                n_tables = es.count(index=INDEX_TABLES, body=q_tab)['count']
+        linked = related.get(doc_id, {"figures": 0, "tables": 0})
+        n_figures = linked["figures"]
+        n_tables = linked["tables"]
 
         # Stampa informazioni documento
         print(f"\n\nDOCUMENTO {i}/{len(hits)} ({source_to_check})")
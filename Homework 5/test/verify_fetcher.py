@@ -0,0 +1,157 @@
+# per eseguire: python -m test.verify_fetcher
+# Non richiede rete né Elasticsearch: usa un server HTTP stub locale.
+
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from src.ingestion import cache as cache_module
+from src.ingestion.fetcher import fetch_many, stream_get
+from src.ingestion.cache import HttpCache
+from src.ingestion.pubmed import _iter_articles
+
+# Registro delle richieste ricevute dallo stub (path, istante)
+REQUEST_LOG = []
+FLAKY_FAILURES = {"count": 0}
+
+# /articleset: XML in stile efetch con molti <article> (per il parsing in streaming)
+N_ARTICLES = 2000
+ARTICLE_XML = (
+    '<article><front><article-meta><article-id pub-id-type="pmc">{i}</article-id>'
+    '<title-group><article-title>Title {i}</article-title></title-group></article-meta></front>'
+    '<body><p>' + "text " * 400 + '</p></body></article>'
+)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        REQUEST_LOG.append((self.path, time.monotonic()))
+
+        # /etag supporta le richieste condizionali (304 se l'ETag coincide)
+        if self.path.startswith("/etag") and self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        # /flaky risponde 503 alle prime due richieste, poi 200
+        if self.path.startswith("/flaky") and FLAKY_FAILURES["count"] < 2:
+            FLAKY_FAILURES["count"] += 1
+            self.send_response(503)
+            self.end_headers()
+            return
+
+        if self.path.startswith("/articleset"):
+            # Scritto un articolo alla volta (HTTP/1.0: il corpo termina con la connessione)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.end_headers()
+            self.wfile.write(b"<pmc-articleset>")
+            for i in range(N_ARTICLES):
+                self.wfile.write(ARTICLE_XML.format(i=i).encode("utf-8"))
+            self.wfile.write(b"</pmc-articleset>")
+            return
+
+        body = f"<html><body>{self.path}</body></html>".encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Silenzia il log di default
+
+
+def verify_fetcher():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    try:
+        # 1. Ordine dei risultati e rate limit per host
+        rate = 5.0
+        n_requests = 10
+        urls = [f"{base}/doc/{i}" for i in range(n_requests)]
+
+        t_start = time.monotonic()
+        results = fetch_many(urls, rate_limits={"127.0.0.1": rate}, concurrency=4, retries=0, use_cache=False)
+        elapsed = time.monotonic() - t_start
+
+        ordered = all(f"/doc/{i}<" in r.text for i, r in enumerate(results))
+        min_expected = (n_requests - 1) / rate
+        print("\nRate limit e ordinamento")
+        print(f"Richieste:        {n_requests} a {rate} req/s")
+        print(f"Tempo impiegato:  {elapsed:.2f}s (minimo atteso {min_expected:.2f}s)")
+        print(f"Ordine corretto:  {ordered}")
+        print(f"Rate rispettato:  {elapsed >= min_expected * 0.95}")
+
+        # 1b. Rate limit tra chiamate successive (una per pagina): fetcher e bucket condivisi
+        t_start = time.monotonic()
+        for page in range(2):
+            fetch_many([f"{base}/page/{page}/{i}" for i in range(5)], rate_limits={"127.0.0.1": rate}, concurrency=4, retries=0, use_cache=False)
+        elapsed = time.monotonic() - t_start
+        print(f"Due pagine da 5:  {elapsed:.2f}s (minimo atteso {min_expected + 1 / rate:.2f}s, bucket già vuoto)")
+        print(f"Rate tra pagine:  {elapsed >= (min_expected + 1 / rate) * 0.95}")
+
+        # 2. Retry con backoff su errori temporanei
+        REQUEST_LOG.clear()
+        result = fetch_many([f"{base}/flaky"], rate_limits={"127.0.0.1": 50}, retries=3, backoff=0.1, use_cache=False)[0]
+        attempts = len([p for p, _ in REQUEST_LOG if p.startswith("/flaky")])
+        print("\nRetry con backoff")
+        print(f"Tentativi:        {attempts} (attesi 3)")
+        print(f"Status finale:    {result.status_code}")
+
+        # 3. Errore di connessione: nessuna eccezione, errore riportato nel risultato
+        result = fetch_many(["http://127.0.0.1:9/"], retries=1, backoff=0.1, use_cache=False)[0]
+        print("\nErrore di connessione")
+        print(f"Errore registrato: {type(result.error).__name__}")
+
+        # 4. Cache HTTP: richiesta condizionale (304), modalità offline ed eviction LRU
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = HttpCache(cache_dir, max_bytes=10 * 1024 * 1024)
+            url = f"{base}/etag/page"
+
+            REQUEST_LOG.clear()
+            first = fetch_many([url], rate_limits={"127.0.0.1": 50}, cache=cache)[0]
+            second = fetch_many([url], rate_limits={"127.0.0.1": 50}, cache=cache)[0]
+            print("\nCache HTTP")
+            print(f"Richieste al server:   {len(REQUEST_LOG)} (la seconda è condizionale)")
+            print(f"Corpo identico (304):  {first.content == second.content and second.status_code == 200}")
+
+            REQUEST_LOG.clear()
+            cache.offline = True
+            offline = fetch_many([url, f"{base}/etag/missing"], cache=cache)
+            print(f"Offline, da cache:     {offline[0].status_code == 200 and offline[0].content == first.content}")
+            print(f"Offline, non in cache: {type(offline[1].error).__name__}")
+            print(f"Richieste in offline:  {len(REQUEST_LOG)} (attese 0)")
+
+            # Limite minimo: ogni nuova voce fa uscire la meno recente
+            cache.offline = False
+            cache.max_bytes = 1
+            fetch_many([f"{base}/doc/a", f"{base}/doc/b"], rate_limits={"127.0.0.1": 50}, cache=cache, concurrency=1)
+            print(f"Eviction LRU:          {cache.lookup(f'{base}/doc/a') is None and cache.lookup(url) is None}")
+
+        # 5. efetch in streaming: XML letto a blocchi dalla connessione e poi dalla cache
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache_module._cache = HttpCache(cache_dir, max_bytes=100 * 1024 * 1024)
+            xml_size = N_ARTICLES * len(ARTICLE_XML)
+            print(f"\nefetch in streaming ({N_ARTICLES} articoli, {xml_size / 1e6:.1f} MB)")
+            # Ogni esearch restituisce un WebEnv diverso: in cache vale il result set (cache_vary)
+            for webenv, label in (("MCID_1", "rete"), ("MCID_2", "cache offline")):
+                cache_module._cache.offline = label == "cache offline"
+                params = {"WebEnv": webenv, "query_key": "1", "retstart": 0}
+                tracemalloc.start()
+                with stream_get(f"{base}/articleset", params, rate_limits={"127.0.0.1": 50}, cache_vary="term=test") as resp:
+                    parsed = sum(1 for _ in _iter_articles(resp.raw))
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"Da {label + ':':<15} {parsed} articoli, picco memoria {peak / 1e6:.2f} MB")
+            cache_module._cache = None
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    verify_fetcher()
@@ -1,10 +1,12 @@
 # per eseguire: python -m test.verify_figures
 
 from src.core.es import get_es_client
+from src.search import SearchService
 from src.config import Config
 
 def verify_figures():
     es = get_es_client()
+    service = SearchService(es)
     
     # Indici
     INDEX_DOCS = Config.INDEX_DOCS
@@ -23,39 +25,26 @@ def verify_figures():
         print(f"L'indice '{INDEX_FIGURES}' non esiste.")
         return
 
-    # Conteggi totali
-    count = es.count(index=INDEX_FIGURES)['count']
-    print(f"Totale figure in '{INDEX_FIGURES}': {count}")
-
-    query_arxiv = {"query": {"term": {"source": "arxiv"}}}
-    count_arxiv = es.count(index=INDEX_FIGURES, body=query_arxiv)['count']
-    print(f"Figure da ArXiv:  {count_arxiv}")
-
-    query_pubmed = {"query": {"term": {"source": "pubmed"}}}
-    count_pubmed = es.count(index=INDEX_FIGURES, body=query_pubmed)['count']
-    print(f"Figure da PubMed: {count_pubmed}")
+    # Conteggi totali e per sorgente (una sola richiesta con aggregazione)
+    counts = service.source_counts(INDEX_FIGURES)
+    print(f"Totale figure in '{INDEX_FIGURES}': {counts['total']}")
+    print(f"Figure da ArXiv:  {counts.get('arxiv', 0)}")
+    print(f"Figure da PubMed: {counts.get('pubmed', 0)}")
 
     # Recupero figure
     print(f"Recupero {NUM_TO_SHOW} figure CASUALI con source='{source_to_check}'...")
 
-    search_body = {
-        "query": {
-            "function_score": {
-                "query": {"term": {"source": source_to_check}}, 
-                "random_score": {}, 
-                "boost_mode": "replace"
-            }
-        },
-        "size": NUM_TO_SHOW 
-    }
-    
-    resp = es.search(index=INDEX_FIGURES, body=search_body)
-    hits = resp['hits']['hits']
+    hits = service.random_sample(INDEX_FIGURES, source_to_check, NUM_TO_SHOW)
     
     if not hits:
         print(f"Nessuna figura trovata per source='{source_to_check}'.")
         return
 
+    # Documenti padre di tutti i risultati con una sola richiesta (invece di una per risultato)
+    parents = {}
+    if es.indices.exists(index=INDEX_DOCS):
+        parents = service.find_documents(hit['_source'].get('paper_id') for hit in hits)
+
     # Ciclo risultati
     for i, hit in enumerate(hits, 1):
         fig = hit['_source']
@@ -65,19 +54,9 @@ def verify_figures():
         paper_id = fig.get('paper_id')
         
         # Verifichiamo se il documento padre esiste nell'indice DOCS
-        parent_title = "N/A"
-        parent_found = False
-        
-        if es.indices.exists(index=INDEX_DOCS) and paper_id:
-            q_parent = {
-                "query": {"term": {"document_id": paper_id}},
-                "size": 1
-            }
-            resp_parent = es.search(index=INDEX_DOCS, body=q_parent)
-            
-            if resp_parent['hits']['hits']:
-                parent_found = True
-                parent_title = resp_parent['hits']['hits'][0]['_source'].get('title')
+        parent = parents.get(paper_id)
+        parent_found = parent is not None
+        parent_title = (parent or {}).get('title') or "N/A"
 
         # Stampa informazioni figura
         print(f"\n\nFIGURA {i}/{len(hits)} ({source_to_check})")
@@ -1,10 +1,12 @@
 # per eseguire: python -m test.verify_tables
 
 from src.core.es import get_es_client
+from src.search import SearchService
 from src.config import Config
 
 def verify_tables():
     es = get_es_client()
+    service = SearchService(es)
     
     # Indici
     INDEX_DOCS = Config.INDEX_DOCS
@@ -22,39 +24,26 @@ def verify_tables():
         print(f"L'indice '{INDEX_TABLES}' non esiste.")
         return
 
-    # Conteggi totali
-    count = es.count(index=INDEX_TABLES)['count']
-    print(f"Totale tabelle in '{INDEX_TABLES}': {count}")
+    # Conteggi totali e per sorgente (una sola richiesta con aggregazione)
+    counts = service.source_counts(INDEX_TABLES)
+    print(f"Totale tabelle in '{INDEX_TABLES}': {counts['total']}")
+    print(f"Tabelle da ArXiv:  {counts.get('arxiv', 0)}")
+    print(f"Tabelle da PubMed: {counts.get('pubmed', 0)}")
 
-    query_arxiv = {"query": {"term": {"source": "arxiv"}}}
-    count_arxiv = es.count(index=INDEX_TABLES, body=query_arxiv)['count']
-    print(f"Tabelle da ArXiv:  {count_arxiv}")
-
-    query_pubmed = {"query": {"term": {"source": "pubmed"}}}
-    count_pubmed = es.count(index=INDEX_TABLES, body=query_pubmed)['count']
-    print(f"Tabelle da PubMed: {count_pubmed}")
-    
     # Recupero tabelle
     print(f"Recupero {NUM_TO_SHOW} tabelle CASUALI con source='{source_to_check}'...")
 
-    search_body = {
-        "query": {
-            "function_score": {
-                "query": {"term": {"source": source_to_check}}, 
-                "random_score": {}, 
-                "boost_mode": "replace"
-            }
-        },
-        "size": NUM_TO_SHOW 
-    }
-    
-    resp = es.search(index=INDEX_TABLES, body=search_body)
-    hits = resp['hits']['hits']
+    hits = service.random_sample(INDEX_TABLES, source_to_check, NUM_TO_SHOW)
     
     if not hits:
         print(f"Nessuna tabella trovata per source='{source_to_check}'.")
         return
 
+    # Documenti padre di tutti i risultati con una sola richiesta (invece di una per risultato)
+    parents = {}
+    if es.indices.exists(index=INDEX_DOCS):
+        parents = service.find_documents(hit['_source'].get('paper_id') for hit in hits)
+
     # Ciclo risultati
     for i, hit in enumerate(hits, 1):
         tbl = hit['_source']
@@ -64,19 +53,9 @@ def verify_tables():
         paper_id = tbl.get('paper_id')
         
         # Verifichiamo se il documento padre esiste nell'indice DOCS
-        parent_title = "N/A"
-        parent_found = False
-        
-        if es.indices.exists(index=INDEX_DOCS) and paper_id:
-            q_parent = {
-                "query": {"term": {"document_id": paper_id}},
-                "size": 1
-            }
-            resp_parent = es.search(index=INDEX_DOCS, body=q_parent)
-            
-            if resp_parent['hits']['hits']:
-                parent_found = True
-                parent_title = resp_parent['hits']['hits'][0]['_source'].get('title')
+        parent = parents.get(paper_id)
+        parent_found = parent is not None
+        parent_title = (parent or {}).get('title') or "N/A"
 
         # Stampa informazioni tabella
         print(f"\n\nTABELLA {i}/{len(hits)} ({source_to_check})")